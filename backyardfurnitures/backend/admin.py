@@ -1,3 +1,51 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.template.response import TemplateResponse
+from django.urls import path
 
-# Register your models here.
+from .forms import ProductImportForm
+from .imports import import_products_file
+from .models import Product
+
+
+# Rejected rows listed on the import page
+IMPORT_ERRORS_SHOWN = 200
+
+
+@admin.register(Product)
+class ProductAdmin(admin.ModelAdmin):
+    list_display = ('name', 'sku', 'category', 'price', 'is_active', 'featured')
+    list_filter = ('is_active', 'featured', 'category')
+    list_select_related = ('category',)
+    search_fields = ('name', 'sku')
+    change_list_template = 'admin/backend/product/change_list.html'
+
+    def get_urls(self):
+        return [
+            path('import/', self.admin_site.admin_view(self.import_view), name='backend_product_import'),
+        ] + super().get_urls()
+
+    def import_view(self, request):
+        """Upload a supplier catalog and upsert it by SKU"""
+        if not self.has_add_permission(request) or not self.has_change_permission(request):
+            raise PermissionDenied
+
+        result = None
+        form = ProductImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            result = import_products_file(request.FILES['file'], form.cleaned_data['format'] or None)
+            messages.success(
+                request,
+                f'Created {result.created} and updated {result.updated} products, '
+                f'rejected {len(result.errors)} rows.'
+            )
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Import products',
+            'form': form,
+            'result': result,
+            'errors': result.errors[:IMPORT_ERRORS_SHOWN] if result else [],
+        }
+        return TemplateResponse(request, 'admin/backend/product/import.html', context)
@@ -0,0 +1,84 @@
+"""
+Available-to-promise stock.
+
+Availability is summed over every active warehouse and cached per product
+for a short time. Stock is tracked per product, so all variants of a
+product share the same figure.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q, Sum
+
+from .models import Inventory
+from .pagecache import invalidate_tags, product_tag
+from .replicas import reading_from
+
+
+AVAILABILITY_CACHE_TIMEOUT = getattr(settings, 'AVAILABILITY_CACHE_TIMEOUT', 30)
+
+# Cached marker for products without any inventory rows
+UNTRACKED = 'untracked'
+
+
+def cache_key(product_id):
+    return f'availability:{product_id}'
+
+
+def get_available_quantities(product_ids):
+    """
+    Return ``{product_id: available}`` for a batch of products using at most
+    one cache round trip and one grouped query. Products that have no
+    inventory rows are not stock tracked and map to None.
+    """
+    product_ids = set(product_ids)
+    if not product_ids:
+        return {}
+
+    cached = cache.get_many([cache_key(pk) for pk in product_ids])
+    result = {}
+    missing = []
+    for pk in product_ids:
+        value = cached.get(cache_key(pk))
+        if value is None:
+            missing.append(pk)
+        else:
+            result[pk] = None if value == UNTRACKED else value
+
+    if missing:
+        rows = (
+            Inventory.objects
+            .filter(product_id__in=missing)
+            .values('product_id')
+            .annotate(available=Sum(
+                'available_quantity',
+                filter=Q(warehouse__is_active=True),
+                default=0,
+            ))
+            .order_by()
+        )
+        with reading_from(None):
+            loaded = {row['product_id']: max(row['available'], 0) for row in rows}
+        cache.set_many(
+            {cache_key(pk): loaded.get(pk, UNTRACKED) for pk in missing},
+            AVAILABILITY_CACHE_TIMEOUT
+        )
+        result.update({pk: loaded.get(pk) for pk in missing})
+
+    return result
+
+
+def get_available_quantity(product_id):
+    return get_available_quantities([product_id])[product_id]
+
+
+def invalidate_availability(product_ids):
+    """
+    Drop cached availability once the current transaction commits, along
+    with the cached storefront pages showing those products' stock
+    """
+    product_ids = set(product_ids)
+    keys = [cache_key(pk) for pk in product_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+    invalidate_tags(*(product_tag(pk) for pk in product_ids))
@@ -0,0 +1,97 @@
+"""
+Category tree.
+
+``Category.path`` is a materialized path maintained by ``Category.save()``,
+so a whole subtree is one indexed range query (``Category.objects.subtree``).
+The active tree used by navigation menus is built from a single query and
+cached until a category changes.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.functions import Substr
+
+from .models import Category, category_path_upper_bound
+from .replicas import reading_from
+
+
+CATEGORY_TREE_KEY = 'categories:tree'
+CATEGORY_TREE_TIMEOUT = 60 * 60 * 24
+
+
+class CategoryNode:
+    def __init__(self, pk, name, slug, path):
+        self.id = pk
+        self.name = name
+        self.slug = slug
+        self.path = path
+        self.children = []
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def depth(self):
+        return self.path.count('/') - 1
+
+    def walk(self):
+        """This node and all its descendants, depth first"""
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+
+class CategoryTree:
+    """Active categories as nested nodes, in path order"""
+
+    def __init__(self, rows):
+        self.roots = []
+        self.by_id = {}
+        self.by_slug = {}
+        for pk, name, slug, path, parent_id in rows:
+            node = CategoryNode(pk, name, slug, path)
+            self.by_id[pk] = node
+            self.by_slug[slug] = node
+            parent = self.by_id.get(parent_id)
+            if parent_id is None:
+                self.roots.append(node)
+            elif parent is not None:
+                parent.children.append(node)
+            # Otherwise the parent is inactive and the branch is hidden
+
+    def __iter__(self):
+        for root in self.roots:
+            yield from root.walk()
+
+    def subtree_ids(self, category_id):
+        node = self.by_id.get(category_id)
+        return [descendant.id for descendant in node.walk()] if node else [category_id]
+
+
+def get_category_tree():
+    tree = cache.get(CATEGORY_TREE_KEY)
+    if tree is None:
+        # Path order puts every parent before its children
+        rows = (
+            Category.objects
+            .filter(is_active=True)
+            .order_by('path')
+            .values_list('pk', 'name', 'slug', 'path', 'parent_id')
+        )
+        with reading_from(None):
+            tree = CategoryTree(rows)
+        cache.set(CATEGORY_TREE_KEY, tree, CATEGORY_TREE_TIMEOUT)
+    return tree
+
+
+def invalidate_category_tree():
+    transaction.on_commit(lambda: cache.delete(CATEGORY_TREE_KEY))
+
+
+def detach_subtree(path):
+    """
+    Re-root the descendants of a deleted category. Its children were set to
+    no parent, so the deleted category's prefix is cut from their paths.
+    """
+    Category.objects.filter(
+        path__gt=path, path__lt=category_path_upper_bound(path)
+    ).update(path=Substr('path', len(path) + 1))
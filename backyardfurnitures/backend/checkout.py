@@ -0,0 +1,74 @@
+"""
+Checkout pipeline.
+
+Turns a cart into an order inside one transaction with a fixed number of
+queries however many lines the cart has.
+"""
+from django.db import transaction
+
+from .inventory import reserve_stock
+from .models import CartItem, Order, OrderItem
+from .pricing import redeem_promotion
+from .stats import add_units_sold
+from .totals import calculate_totals, cart_lines
+
+
+class EmptyCart(Exception):
+    pass
+
+
+class PromotionUnavailable(Exception):
+    """The promotion used to price the cart reached its usage limit"""
+
+
+def place_order(customer, cart, shipping_address, billing_address, shipping_method, payment_method,
+                notes='', promo_code=None):
+    """Create an order from the cart, reserve its stock and empty the cart"""
+    with transaction.atomic():
+        lines = cart_lines(cart)
+        if not lines:
+            raise EmptyCart()
+
+        quantities = {}
+        for line in lines:
+            quantities[line['product_id']] = quantities.get(line['product_id'], 0) + line['quantity']
+
+        # Raises InsufficientStock and rolls everything back if stock ran out
+        reserve_stock(quantities)
+
+        totals = calculate_totals(lines, shipping_method, promo_code)
+        if totals.promotion and not redeem_promotion(totals.promotion):
+            raise PromotionUnavailable()
+
+        order = Order.objects.create(
+            customer=customer,
+            shipping_address=shipping_address,
+            billing_address=billing_address,
+            shipping_method=shipping_method,
+            shipping_cost=totals.shipping,
+            subtotal=totals.subtotal,
+            discount=totals.discount,
+            tax=totals.tax,
+            total=totals.total,
+            payment_method=payment_method,
+            notes=notes,
+        )
+
+        # bulk_create skips OrderItem.save() and its signals, so totals are
+        # set here and units sold are bumped in one statement
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product_id=line['product_id'],
+                variant_id=line['variant_id'],
+                quantity=line['quantity'],
+                price=line['unit_price'],
+                total=line['line_total'],
+            )
+            for line in totals.lines
+        ])
+        add_units_sold(quantities)
+
+        CartItem.objects.filter(cart=cart).delete()
+
+    return order
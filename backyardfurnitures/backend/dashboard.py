@@ -0,0 +1,171 @@
+"""
+Cached dashboard metrics.
+
+Counters are adjusted in place from model signals (see ``backend.signals``)
+and every entry carries a TTL, so a missed update or a cold cache falls
+back to recomputing that one metric from the database.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import Inventory, Order, Product
+from .replicas import reading_from
+
+
+DASHBOARD_CACHE_TIMEOUT = getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 300)
+
+RECENT_ITEMS_LIMIT = 5
+LOW_STOCK_DISPLAY_LIMIT = 10
+
+# Orders that do not count towards revenue
+EXCLUDED_REVENUE_STATUSES = ('cancelled', 'returned')
+
+TOTAL_PRODUCTS_KEY = 'dashboard:total_products'
+TOTAL_ORDERS_KEY = 'dashboard:total_orders'
+RECENT_PRODUCTS_KEY = 'dashboard:recent_products'
+RECENT_ORDERS_KEY = 'dashboard:recent_orders'
+LOW_STOCK_COUNT_KEY = 'dashboard:low_stock_count'
+LOW_STOCK_ITEMS_KEY = 'dashboard:low_stock_items'
+
+
+def revenue_key(when):
+    return f'dashboard:revenue:{timezone.localtime(when):%Y-%m}'
+
+
+def low_stock_queryset():
+    return Inventory.objects.low_stock()
+
+
+def month_start(when):
+    return timezone.localtime(when).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def to_cents(amount):
+    return int((Decimal(amount or 0) * 100).to_integral_value())
+
+
+def load_monthly_revenue(when):
+    """Revenue for the month containing ``when`` in cents"""
+    total = (
+        Order.objects
+        .filter(created_at__gte=month_start(when), created_at__lte=when)
+        .exclude(status__in=EXCLUDED_REVENUE_STATUSES)
+        .aggregate(total=Sum('total'))['total']
+    )
+    return to_cents(total)
+
+
+def load_metric(key, now):
+    if key == TOTAL_PRODUCTS_KEY:
+        return Product.objects.count()
+    if key == TOTAL_ORDERS_KEY:
+        return Order.objects.count()
+    if key == RECENT_PRODUCTS_KEY:
+        return list(
+            Product.objects.with_primary_image().select_related('category').order_by('-created_at')[:RECENT_ITEMS_LIMIT]
+        )
+    if key == RECENT_ORDERS_KEY:
+        return list(Order.objects.select_related('customer__user').order_by('-created_at')[:RECENT_ITEMS_LIMIT])
+    if key == LOW_STOCK_COUNT_KEY:
+        return low_stock_queryset().count()
+    if key == LOW_STOCK_ITEMS_KEY:
+        return list(
+            low_stock_queryset()
+            .select_related('product', 'warehouse')
+            .order_by('product__name')[:LOW_STOCK_DISPLAY_LIMIT]
+        )
+    return load_monthly_revenue(now)
+
+
+def get_dashboard_metrics():
+    """Return every dashboard metric with one cache round trip when warm"""
+    now = timezone.now()
+    keys = [
+        TOTAL_PRODUCTS_KEY, TOTAL_ORDERS_KEY, RECENT_PRODUCTS_KEY, RECENT_ORDERS_KEY,
+        LOW_STOCK_COUNT_KEY, LOW_STOCK_ITEMS_KEY, revenue_key(now),
+    ]
+    values = cache.get_many(keys)
+
+    # From the primary, counters are then shifted by signals rather than reloaded
+    with reading_from(None):
+        missing = {key: load_metric(key, now) for key in keys if key not in values}
+    if missing:
+        cache.set_many(missing, DASHBOARD_CACHE_TIMEOUT)
+        values.update(missing)
+
+    return {
+        'total_products': values[TOTAL_PRODUCTS_KEY],
+        'total_orders': values[TOTAL_ORDERS_KEY],
+        'recent_products': values[RECENT_PRODUCTS_KEY],
+        'recent_orders': values[RECENT_ORDERS_KEY],
+        'low_stock_count': values[LOW_STOCK_COUNT_KEY],
+        'low_stock_items': values[LOW_STOCK_ITEMS_KEY],
+        'monthly_revenue': Decimal(values[revenue_key(now)]) / 100,
+    }
+
+
+def adjust_counter(key, delta):
+    """Shift a cached counter once the current transaction commits"""
+    def apply():
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            # Not cached yet, the next read loads it from the database
+            pass
+    transaction.on_commit(apply)
+
+
+def invalidate(*keys):
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def product_saved(product, created):
+    if created:
+        adjust_counter(TOTAL_PRODUCTS_KEY, 1)
+    invalidate(RECENT_PRODUCTS_KEY, LOW_STOCK_ITEMS_KEY)
+
+
+def product_deleted(product):
+    adjust_counter(TOTAL_PRODUCTS_KEY, -1)
+    invalidate(RECENT_PRODUCTS_KEY, LOW_STOCK_COUNT_KEY, LOW_STOCK_ITEMS_KEY)
+
+
+def product_image_changed():
+    """Recent products are cached with their primary image, which changes without a Product signal"""
+    invalidate(RECENT_PRODUCTS_KEY)
+
+
+def products_imported():
+    """Bulk imports skip the Product signals and may add any number of products"""
+    invalidate(TOTAL_PRODUCTS_KEY, RECENT_PRODUCTS_KEY, LOW_STOCK_ITEMS_KEY)
+
+
+def order_saved(order, created):
+    if created:
+        adjust_counter(TOTAL_ORDERS_KEY, 1)
+        if order.status not in EXCLUDED_REVENUE_STATUSES:
+            adjust_counter(revenue_key(order.created_at), to_cents(order.total))
+        invalidate(RECENT_ORDERS_KEY)
+    else:
+        # Status or totals may have changed, reload that month lazily
+        invalidate(RECENT_ORDERS_KEY, revenue_key(order.created_at))
+
+
+def order_deleted(order):
+    adjust_counter(TOTAL_ORDERS_KEY, -1)
+    invalidate(RECENT_ORDERS_KEY, revenue_key(order.created_at))
+
+
+def user_saved(user, update_fields):
+    """Recent orders are cached with their customer's name; logins only touch last_login"""
+    if update_fields is None or not set(update_fields) <= {'last_login'}:
+        invalidate(RECENT_ORDERS_KEY)
+
+
+def invalidate_low_stock():
+    invalidate(LOW_STOCK_COUNT_KEY, LOW_STOCK_ITEMS_KEY)
@@ -0,0 +1,227 @@
+"""
+Streaming CSV and JSON Lines exports.
+
+Rows are read as plain tuples with a chunked ``iterator()`` and written to
+the response one at a time, so an export of any size runs in constant
+memory and the first bytes go out as soon as the first chunk is fetched.
+Related columns are joined into the same query, like ``select_related``,
+without building model instances.
+
+Orders come from one LEFT JOIN on their lines: one CSV row per line with
+the order columns repeated, or one JSON object per order with its lines
+nested.
+"""
+import csv
+import json
+from itertools import groupby
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
+
+from .models import Inventory, Order, Product
+
+
+CHUNK_SIZE = 2000
+# Bytes gathered before each write, rather than one small write per row
+BUFFER_SIZE = 64 * 1024
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+# Spreadsheets run cells starting with these as formulas, so CSV text
+# values that do are prefixed with a quote
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+# (column, lookup)
+PRODUCT_COLUMNS = (
+    ('id', 'id'),
+    ('sku', 'sku'),
+    ('name', 'name'),
+    ('slug', 'slug'),
+    ('category', 'category__name'),
+    ('material', 'material__name'),
+    ('price', 'price'),
+    ('sale_price', 'sale_price'),
+    ('is_active', 'is_active'),
+    ('featured', 'featured'),
+    ('units_sold', 'units_sold'),
+    ('rating_average', 'rating_average'),
+    ('review_count', 'review_count'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+)
+
+INVENTORY_COLUMNS = (
+    ('id', 'id'),
+    ('sku', 'product__sku'),
+    ('product', 'product__name'),
+    ('warehouse', 'warehouse__name'),
+    ('quantity', 'quantity'),
+    ('reserved_quantity', 'reserved_quantity'),
+    ('available_quantity', 'available_quantity'),
+    ('reorder_point', 'reorder_point'),
+    ('last_restock_date', 'last_restock_date'),
+    ('updated_at', 'updated_at'),
+)
+
+ORDER_COLUMNS = (
+    ('order_number', 'order_number'),
+    ('created_at', 'created_at'),
+    ('status', 'status'),
+    ('payment_status', 'payment_status'),
+    ('payment_method', 'payment_method'),
+    ('customer_email', 'customer__user__email'),
+    ('shipping_method', 'shipping_method'),
+    ('subtotal', 'subtotal'),
+    ('shipping_cost', 'shipping_cost'),
+    ('tax', 'tax'),
+    ('discount', 'discount'),
+    ('total', 'total'),
+)
+
+# Lookups from the order; every line has an id, so a NULL id means no lines
+ORDER_ITEM_COLUMNS = (
+    ('line_id', 'items__id'),
+    ('sku', 'items__product__sku'),
+    ('product', 'items__product__name'),
+    ('variant', 'items__variant__color'),
+    ('quantity', 'items__quantity'),
+    ('price', 'items__price'),
+    ('line_total', 'items__total'),
+)
+
+
+class Echo:
+    """File-like object whose ``write`` returns the value, for ``csv.writer``"""
+
+    def write(self, value):
+        return value
+
+
+def header(columns):
+    return [column for column, lookup in columns]
+
+
+def lookups(columns):
+    return [lookup for column, lookup in columns]
+
+
+def csv_value(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def json_line(data):
+    return json.dumps(data, cls=DjangoJSONEncoder) + '\n'
+
+
+def stream_csv(rows, columns):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header(columns))
+    for row in rows:
+        yield writer.writerow([csv_value(value) for value in row])
+
+
+def stream_jsonl(rows, columns):
+    names = header(columns)
+    for row in rows:
+        yield json_line(dict(zip(names, row)))
+
+
+def stream_orders_jsonl(rows):
+    """Fold the consecutive line rows of each order into one object"""
+    order_names, item_names = header(ORDER_COLUMNS), header(ORDER_ITEM_COLUMNS)
+    split = len(order_names)
+    for order, lines in groupby(rows, key=lambda row: row[:split]):
+        data = dict(zip(order_names, order))
+        data['items'] = [
+            dict(zip(item_names, line[split:])) for line in lines if line[split] is not None
+        ]
+        yield json_line(data)
+
+
+def product_rows():
+    return (
+        Product.objects
+        .order_by('pk')
+        .values_list(*lookups(PRODUCT_COLUMNS))
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def inventory_rows():
+    return (
+        Inventory.objects
+        .order_by('pk')
+        .values_list(*lookups(INVENTORY_COLUMNS))
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def order_rows(status=None, start_date=None, end_date=None):
+    """
+    One row per order line, grouped by order; orders without lines get a
+    single row. Either date bound may be left out and both are inclusive
+    days in the current time zone.
+    """
+    orders = Order.objects.all()
+    if status:
+        orders = orders.filter(status=status)
+    if start_date:
+        orders = orders.filter(created_at__date__gte=start_date)
+    if end_date:
+        orders = orders.filter(created_at__date__lte=end_date)
+    return (
+        orders
+        .order_by('created_at', 'pk', 'items__id')
+        .values_list(*lookups(ORDER_COLUMNS + ORDER_ITEM_COLUMNS))
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def buffered(lines, size=BUFFER_SIZE):
+    buffer, length = [], 0
+    for line in lines:
+        buffer.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def export_response(name, fmt, content):
+    if fmt not in EXPORT_FORMATS:
+        raise Http404(f'Unknown export format: {fmt}')
+    response = StreamingHttpResponse(buffered(content), content_type=EXPORT_FORMATS[fmt])
+    filename = f'{name}-{timezone.now():%Y%m%d-%H%M%S}.{fmt}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def export_products(fmt):
+    stream = stream_csv if fmt == 'csv' else stream_jsonl
+    return export_response('products', fmt, stream(product_rows(), PRODUCT_COLUMNS))
+
+
+def export_inventory(fmt):
+    stream = stream_csv if fmt == 'csv' else stream_jsonl
+    return export_response('inventory', fmt, stream(inventory_rows(), INVENTORY_COLUMNS))
+
+
+def export_orders(fmt, **filters):
+    rows = order_rows(**filters)
+    if fmt == 'csv':
+        content = stream_csv(rows, ORDER_COLUMNS + ORDER_ITEM_COLUMNS)
+    else:
+        content = stream_orders_jsonl(rows)
+    return export_response('orders', fmt, content)
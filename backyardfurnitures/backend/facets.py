@@ -0,0 +1,176 @@
+"""
+Faceted navigation for the shop.
+
+Counts per category, material, price bucket, ``weather_resistant`` and
+``assembly_required`` come from one grouped query over the products that
+match the search. Each facet is counted with every other selected filter
+applied but not its own, so the sidebar shows how many products each
+choice would leave. Results are cached per filter signature and catalog
+version.
+"""
+import hashlib
+from decimal import Decimal, InvalidOperation
+
+from django.core.cache import cache
+from django.db.models import BooleanField, Case, CharField, Count, Q, Value, When
+
+from .pagecache import CATALOG_TAG, CATEGORIES_TAG, normalize_query, tag_versions
+from .replicas import reading_from
+
+
+FACET_CACHE_TIMEOUT = 60 * 10
+
+# Query parameters that change the facet counts
+FACET_PARAMS = ('q', 'category', 'material', 'min_price', 'max_price', 'weather_resistant', 'assembly_required')
+
+# (key, label, lower bound, upper bound); lower bounds are inclusive, upper exclusive
+PRICE_BUCKETS = (
+    ('0-100', 'Under $100', None, Decimal('100')),
+    ('100-250', '$100 to $250', Decimal('100'), Decimal('250')),
+    ('250-500', '$250 to $500', Decimal('250'), Decimal('500')),
+    ('500-1000', '$500 to $1,000', Decimal('500'), Decimal('1000')),
+    ('1000-', '$1,000 and up', Decimal('1000'), None),
+)
+
+BOOLEAN_FACETS = ('weather_resistant', 'assembly_required')
+
+
+def parse_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_decimal(value):
+    try:
+        return Decimal(value) if value else None
+    except InvalidOperation:
+        return None
+
+
+def parse_bool(value):
+    return {'1': True, 'true': True, '0': False, 'false': False}.get((value or '').lower())
+
+
+class FacetSelection:
+    """The facet filters chosen in a shop request; invalid values are ignored"""
+
+    def __init__(self, query, category_tree):
+        self.category = category_tree.by_slug.get(query.get('category') or '')
+        self.category_ids = set(category_tree.subtree_ids(self.category.id)) if self.category else None
+        self.material_id = parse_int(query.get('material'))
+        self.min_price = parse_decimal(query.get('min_price'))
+        self.max_price = parse_decimal(query.get('max_price'))
+        self.booleans = {name: parse_bool(query.get(name)) for name in BOOLEAN_FACETS}
+        self.signature = normalize_query(query, FACET_PARAMS)
+
+    @property
+    def has_price_range(self):
+        return self.min_price is not None or self.max_price is not None
+
+    def price_q(self):
+        q = Q()
+        if self.min_price is not None:
+            q &= Q(price__gte=self.min_price)
+        if self.max_price is not None:
+            q &= Q(price__lte=self.max_price)
+        return q
+
+    def filter(self, queryset):
+        """Apply every selected facet to a Product queryset"""
+        if self.category:
+            queryset = queryset.filter(category_id__in=self.category_ids)
+        if self.material_id is not None:
+            queryset = queryset.filter(material_id=self.material_id)
+        queryset = queryset.filter(self.price_q())
+        for name, value in self.booleans.items():
+            if value is not None:
+                queryset = queryset.filter(**{name: value})
+        return queryset
+
+    def matches(self, row, skip):
+        """Whether a grouped row passes every selected filter except ``skip``"""
+        if skip != 'category' and self.category_ids is not None and row['category_id'] not in self.category_ids:
+            return False
+        if skip != 'material' and self.material_id is not None and row['material_id'] != self.material_id:
+            return False
+        if skip != 'price' and not row['in_price_range']:
+            return False
+        for name, value in self.booleans.items():
+            if skip != name and value is not None and row[name] != value:
+                return False
+        return True
+
+
+def price_bucket_expression():
+    whens = []
+    for key, label, lower, upper in PRICE_BUCKETS:
+        condition = Q()
+        if lower is not None:
+            condition &= Q(price__gte=lower)
+        if upper is not None:
+            condition &= Q(price__lt=upper)
+        whens.append(When(condition, then=Value(key)))
+    return Case(*whens, output_field=CharField())
+
+
+def grouped_rows(queryset, selection):
+    """Product counts grouped by every facet dimension, in one query"""
+    in_price_range = Value(True, output_field=BooleanField())
+    if selection.has_price_range:
+        in_price_range = Case(
+            When(selection.price_q(), then=Value(True)), default=Value(False), output_field=BooleanField()
+        )
+    return list(
+        queryset
+        .order_by()
+        .annotate(price_bucket=price_bucket_expression(), in_price_range=in_price_range)
+        .values('category_id', 'material_id', 'price_bucket', 'in_price_range', *BOOLEAN_FACETS)
+        .annotate(count=Count('pk'))
+    )
+
+
+def count_facets(rows, selection, category_tree):
+    facets = {
+        'categories': {},
+        'materials': {},
+        'price': {key: 0 for key, label, lower, upper in PRICE_BUCKETS},
+    }
+    facets.update({name: {True: 0, False: 0} for name in BOOLEAN_FACETS})
+
+    category_counts = {}
+    for row in rows:
+        count = row['count']
+        if selection.matches(row, 'category'):
+            category_counts[row['category_id']] = category_counts.get(row['category_id'], 0) + count
+        if selection.matches(row, 'material'):
+            facets['materials'][row['material_id']] = facets['materials'].get(row['material_id'], 0) + count
+        if selection.matches(row, 'price'):
+            facets['price'][row['price_bucket']] += count
+        for name in BOOLEAN_FACETS:
+            if selection.matches(row, name):
+                facets[name][row[name]] += count
+
+    # A category counts the products of all its subcategories
+    for node in category_tree:
+        total = sum(category_counts.get(descendant.id, 0) for descendant in node.walk())
+        if total:
+            facets['categories'][node.id] = total
+    return facets
+
+
+def get_facet_counts(queryset, selection, category_tree):
+    """
+    Facet counts for ``queryset``, the shop products before any facet
+    filter is applied (i.e. active products matching the search).
+    """
+    versions = tag_versions([CATALOG_TAG, CATEGORIES_TAG])
+    version = ':'.join(versions[key] for key in sorted(versions))
+    key = 'facets:' + hashlib.md5(f'{selection.signature}|{version}'.encode()).hexdigest()
+    facets = cache.get(key)
+    if facets is None:
+        with reading_from(None):
+            facets = count_facets(grouped_rows(queryset, selection), selection, category_tree)
+        cache.set(key, facets, FACET_CACHE_TIMEOUT)
+    return facets
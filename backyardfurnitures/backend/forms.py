@@ -6,6 +6,18 @@ from .models import (
     Customer, Order, OrderItem, Supplier, ProductReview, Promotion,
     Wishlist, WishlistItem, Cart, CartItem
 )
+from .images import check_image_size
+
+
+def clean_image_upload(upload):
+    """Reject uploads too large to decode; images already stored pass through"""
+    # forms.ImageField attaches the opened Pillow image to new uploads only
+    if getattr(upload, 'image', None) is not None:
+        try:
+            check_image_size(upload.image)
+        except ValueError as exc:
+            raise forms.ValidationError(str(exc))
+    return upload
 
 
 class UserRegistrationForm(UserCreationForm):
@@ -63,6 +75,9 @@ class CategoryForm(forms.ModelForm):
         if self.instance.pk:
             self.fields['parent'].queryset = Category.objects.exclude(pk=self.instance.pk)
 
+    def clean_image(self):
+        return clean_image_upload(self.cleaned_data['image'])
+
 
 class MaterialForm(forms.ModelForm):
     class Meta:
@@ -89,6 +104,9 @@ class ProductImageForm(forms.ModelForm):
         model = ProductImage
         fields = ('image', 'alt_text', 'is_primary', 'display_order')
 
+    def clean_image(self):
+        return clean_image_upload(self.cleaned_data['image'])
+
 
 class ProductVariantForm(forms.ModelForm):
     class Meta:
@@ -98,6 +116,9 @@ class ProductVariantForm(forms.ModelForm):
             'color_code': forms.TextInput(attrs={'type': 'color'}),
         }
 
+    def clean_image(self):
+        return clean_image_upload(self.cleaned_data['image'])
+
 
 class ProductImageFormSet(forms.BaseInlineFormSet):
     def clean(self):
@@ -158,6 +179,9 @@ class ProductReviewForm(forms.ModelForm):
 class ReviewImageForm(forms.Form):
     images = forms.ImageField()
 
+    def clean_images(self):
+        return clean_image_upload(self.cleaned_data['images'])
+
 
 class PromotionForm(forms.ModelForm):
     class Meta:
@@ -321,4 +345,12 @@ class InventoryForm(forms.Form):
     def __init__(self, *args, **kwargs):
         from .models import Warehouse
         super().__init__(*args, **kwargs)
-        self.fields['warehouse'].queryset = Warehouse.objects.filter(is_active=True)
\ No newline at end of file
+        self.fields['warehouse'].queryset = Warehouse.objects.filter(is_active=True)
+
+
+class ProductImportForm(forms.Form):
+    file = forms.FileField(help_text="CSV or JSON Lines (.jsonl), one product per row, matched on SKU")
+    format = forms.ChoiceField(
+        choices=[('', 'From file extension'), ('csv', 'CSV'), ('jsonl', 'JSON Lines')],
+        required=False
+    )
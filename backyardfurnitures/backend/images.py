@@ -0,0 +1,190 @@
+"""
+Responsive image derivatives.
+
+When an uploaded image changes, a worker thread resizes it to each of
+``IMAGE_DERIVATIVE_WIDTHS`` that is narrower than the original, saving a
+WebP copy and a JPEG (PNG when the image has transparency) fallback of
+each. Files are named after a hash of the source bytes, so they never
+change once written, identical uploads share them, and they can be served
+with far-future cache headers.
+
+What was written is recorded in the model's ``image_derivatives`` field:
+
+    {
+        'source': 'products/bench.jpg',
+        'width': 2400, 'height': 1600,
+        'formats': {'image/webp': {'320': 'derivatives/...', ...}, 'image/jpeg': {...}},
+    }
+
+and rendered by the ``{% responsive_image %}`` tag in ``backend.templatetags.images``.
+
+Jobs only live in this process's executor: a job that fails is logged, and
+one still queued when the process stops is lost. Either way the instance
+keeps its old ``image_derivatives``, so ``needs_derivatives`` stays true and
+``manage.py generate_image_derivatives`` rebuilds it; run it after deploys
+and on a schedule to catch both.
+
+Images over ``IMAGE_MAX_PIXELS`` are rejected from their header, before any
+pixel data is decoded.
+"""
+import hashlib
+import io
+import logging
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import ExifTags, Image, ImageOps
+
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVES_DIR = 'derivatives'
+
+# Models with an ``image`` and an ``image_derivatives`` field
+IMAGE_MODELS = ('backend.Category', 'backend.ProductImage', 'backend.ProductVariant', 'backend.ReviewImage')
+
+WEBP_OPTIONS = {'format': 'WEBP', 'quality': 80, 'method': 4}
+JPEG_OPTIONS = {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True}
+PNG_OPTIONS = {'format': 'PNG', 'optimize': True}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def derivative_widths():
+    return tuple(sorted(getattr(settings, 'IMAGE_DERIVATIVE_WIDTHS', (320, 640, 960, 1280))))
+
+
+def max_pixels():
+    return getattr(settings, 'IMAGE_MAX_PIXELS', 40_000_000)
+
+
+def check_image_size(image):
+    """Raise ValueError for images too large to decode; only the header has to be read"""
+    width, height = image.size
+    if width * height > max_pixels():
+        raise ValueError(f'Images can have at most {max_pixels():,} pixels, this one is {width}x{height}.')
+
+
+def target_widths(width):
+    """Bucket widths narrower than the original, or the original when it is smaller than all of them"""
+    return [bucket for bucket in derivative_widths() if bucket < width] or [width]
+
+
+def needs_derivatives(instance):
+    """Whether the recorded derivatives are missing or belong to a different upload"""
+    name = instance.image.name if instance.image else ''
+    return name != (instance.image_derivatives or {}).get('source', '')
+
+
+def encode(image, options):
+    buffer = io.BytesIO()
+    image.save(buffer, **options)
+    return buffer.getvalue()
+
+
+def build_derivatives(source):
+    """
+    Resize an image file and store its derivatives; returns the
+    ``image_derivatives`` data, without ``source``.
+    """
+    content = source.read()
+    digest = hashlib.sha256(content).hexdigest()[:32]
+    image = Image.open(io.BytesIO(content))
+    check_image_size(image)
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+
+    # Size as displayed, after applying the EXIF orientation
+    rotated = image.getexif().get(ExifTags.Base.Orientation, 1) in (5, 6, 7, 8)
+    original_width, original_height = (image.height, image.width) if rotated else image.size
+    widths = target_widths(original_width)
+
+    # JPEG sources can decode at a fraction of their size when only smaller copies are needed
+    scale = widths[-1] / original_width
+    image.draft(image.mode, (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+    image = ImageOps.exif_transpose(image).convert('RGBA' if has_alpha else 'RGB')
+
+    fallback_type, fallback_options, fallback_ext = (
+        ('image/png', PNG_OPTIONS, 'png') if has_alpha else ('image/jpeg', JPEG_OPTIONS, 'jpg')
+    )
+    encodings = (('image/webp', WEBP_OPTIONS, 'webp'), (fallback_type, fallback_options, fallback_ext))
+    formats = {mime: {} for mime, options, ext in encodings}
+
+    # Largest first, each copy resized from the previous one
+    for width in reversed(widths):
+        height = max(1, round(original_height * width / original_width))
+        if image.size != (width, height):
+            image = image.resize((width, height), Image.LANCZOS)
+        for mime, options, ext in encodings:
+            name = f'{DERIVATIVES_DIR}/{digest[:2]}/{digest}/{width}w.{ext}'
+            if not default_storage.exists(name):
+                name = default_storage.save(name, ContentFile(encode(image, options)))
+            formats[mime][str(width)] = name
+
+    return {'width': original_width, 'height': original_height, 'formats': formats}
+
+
+def generate_derivatives(instance):
+    """Build and record the derivatives of one instance's current image"""
+    if not instance.image:
+        data = {}
+    else:
+        with instance.image.open('rb') as source:
+            data = {'source': instance.image.name, **build_derivatives(source)}
+    instance.image_derivatives = data
+    # A normal save, so updated_at moves and the page and fragment caches let go of the old markup
+    instance.save(update_fields=['image_derivatives', 'updated_at'])
+    return data
+
+
+def process_image(model_label, pk, source_name):
+    """Worker entry point; skips uploads replaced or deleted since they were queued"""
+    model = apps.get_model(model_label)
+    try:
+        instance = model.objects.filter(pk=pk).first()
+        if instance is None or instance.image.name != source_name or not needs_derivatives(instance):
+            return
+        generate_derivatives(instance)
+    except Exception:
+        # Left for generate_image_derivatives to retry
+        logger.exception('Could not build image derivatives for %s %s', model_label, pk)
+
+
+def run_in_worker(*args):
+    try:
+        process_image(*args)
+    finally:
+        # Worker threads open their own connections
+        connections.close_all()
+
+
+def image_workers():
+    return getattr(settings, 'IMAGE_WORKERS', 2)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=image_workers(), thread_name_prefix='image-derivatives'
+            )
+        return _executor
+
+
+def schedule_derivatives(instance):
+    """Queue derivative generation for after the current transaction commits"""
+    args = (instance._meta.label, instance.pk, instance.image.name)
+
+    def submit():
+        if image_workers():
+            get_executor().submit(run_in_worker, *args)
+        else:
+            process_image(*args)
+    transaction.on_commit(submit)
@@ -0,0 +1,230 @@
+"""
+Bulk product import.
+
+Rows are streamed from a CSV or JSON Lines file and handled in batches:
+each row is validated against the Product model fields, ``category`` and
+``material`` are resolved by name from an in-memory map, and the batch is
+upserted on ``sku`` with one ``bulk_create(update_conflicts=True)``.
+Existing products keep their slug; new ones get unique slugs generated a
+batch at a time. Invalid rows are skipped and reported with their line
+number, the rest of the file is still imported.
+
+``bulk_create`` sends no signals, so every batch refreshes the search
+index and invalidates the dashboard and the cached storefront pages
+itself.
+"""
+import csv
+import io
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils.text import slugify
+
+from . import dashboard
+from .models import Category, Material, Product
+from .pagecache import CATALOG_TAG, category_tag, invalidate_tags, product_tag
+from .search import get_search_backend
+
+
+BATCH_SIZE = 1000
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+REQUIRED_COLUMNS = ('sku', 'name', 'description', 'category', 'material', 'price', 'weight', 'width', 'height', 'depth')
+
+# Product fields read from a row, besides ``category`` and ``material``
+PRODUCT_FIELDS = (
+    'sku', 'name', 'description', 'price', 'sale_price', 'weight', 'width', 'height', 'depth',
+    'assembly_required', 'weather_resistant', 'is_active', 'featured', 'warranty_months',
+)
+
+# Written over existing products; sku is the match key and slugs stay stable
+UPDATE_FIELDS = tuple(name for name in PRODUCT_FIELDS if name != 'sku') + ('category', 'material', 'updated_at')
+
+BOOLEAN_VALUES = {
+    'true': True, 't': True, 'yes': True, 'y': True, '1': True,
+    'false': False, 'f': False, 'no': False, 'n': False, '0': False,
+}
+
+SLUG_LENGTH = Product._meta.get_field('slug').max_length
+
+
+class ProductImportResult:
+    """Counts and per-row errors of one import"""
+
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        # (line number, message)
+        self.errors = []
+
+    @property
+    def imported(self):
+        return self.created + self.updated
+
+
+def detect_format(filename):
+    extension = filename.rsplit('.', 1)[-1].lower()
+    return 'jsonl' if extension in ('jsonl', 'ndjson') else 'csv'
+
+
+def read_rows(stream, fmt):
+    """``(line number, row dict)`` pairs from a text stream; unparseable lines yield the error"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield line_number, ValidationError(f'Invalid JSON: {exc}')
+            continue
+        if not isinstance(row, dict):
+            row = ValidationError('Expected a JSON object.')
+        yield line_number, row
+
+
+def name_map(model):
+    return {name.strip().lower(): pk for pk, name in model.objects.values_list('pk', 'name')}
+
+
+def clean_value(field, value):
+    if isinstance(value, str):
+        value = value.strip()
+    if value in ('', None):
+        if field.has_default():
+            return field.get_default()
+        value = None
+    elif field.get_internal_type() == 'BooleanField' and isinstance(value, str):
+        if value.lower() not in BOOLEAN_VALUES:
+            raise ValidationError(f'"{value}" is not a boolean.')
+        value = BOOLEAN_VALUES[value.lower()]
+    return field.clean(value, None)
+
+
+def build_product(row, categories, materials):
+    """An unsaved Product from a row, or a ValidationError listing every problem"""
+    errors = []
+    missing = [column for column in REQUIRED_COLUMNS if row.get(column) in ('', None)]
+    if missing:
+        raise ValidationError(f'Missing {", ".join(missing)}.')
+
+    values = {}
+    for name in PRODUCT_FIELDS:
+        try:
+            values[name] = clean_value(Product._meta.get_field(name), row.get(name))
+        except ValidationError as exc:
+            errors.append(f'{name}: {" ".join(exc.messages)}')
+    for name, lookup in (('category', categories), ('material', materials)):
+        pk = lookup.get(str(row[name]).strip().lower())
+        if pk is None:
+            errors.append(f'{name}: no {name} named "{row[name]}".')
+        values[f'{name}_id'] = pk
+    if errors:
+        raise ValidationError(errors)
+    return Product(**values)
+
+
+class SlugAllocator:
+    """
+    Unique slugs for new products, checked against the database one query
+    per round of candidates rather than one per product.
+    """
+
+    def __init__(self):
+        self.taken = set()
+        # Last suffix tried per base slug
+        self.counters = {}
+
+    def next_candidate(self, base, reserved):
+        while True:
+            n = self.counters.get(base, 0) + 1
+            self.counters[base] = n
+            slug = base if n == 1 else f'{base}-{n}'
+            if slug not in self.taken and slug not in reserved:
+                return slug
+
+    def assign(self, products):
+        bases = {id(product): slugify(product.name)[:SLUG_LENGTH - 8] or 'product' for product in products}
+        pending = products
+        while pending:
+            candidates = {}
+            for product in pending:
+                candidates[self.next_candidate(bases[id(product)], candidates)] = product
+            self.taken.update(Product.objects.filter(slug__in=candidates).values_list('slug', flat=True))
+            pending = []
+            for slug, product in candidates.items():
+                if slug in self.taken:
+                    pending.append(product)
+                else:
+                    product.slug = slug
+                    self.taken.add(slug)
+
+
+def save_batch(products, result, slugs):
+    """Upsert one batch of valid products and refresh what depends on them"""
+    # A sku repeated within the batch keeps its last row, as it would across batches
+    products = list({product.sku: product for product in products}.values())
+    existing = {
+        sku: (slug, category_id)
+        for sku, slug, category_id in Product.objects.filter(sku__in=[p.sku for p in products])
+        .values_list('sku', 'slug', 'category_id')
+    }
+    new = [product for product in products if product.sku not in existing]
+    # Pages of the category a product moved out of list it too
+    category_ids = {category_id for slug, category_id in existing.values()}
+    for product in products:
+        category_ids.add(product.category_id)
+        if product.sku in existing:
+            product.slug = existing[product.sku][0]
+
+    with transaction.atomic():
+        slugs.assign(new)
+        Product.objects.bulk_create(
+            products, update_conflicts=True, unique_fields=['sku'], update_fields=UPDATE_FIELDS
+        )
+        get_search_backend().index_products(products)
+        dashboard.products_imported()
+        invalidate_tags(
+            CATALOG_TAG,
+            *(category_tag(category_id) for category_id in category_ids),
+            *(product_tag(product.pk) for product in products),
+        )
+    result.created += len(new)
+    result.updated += len(products) - len(new)
+
+
+def import_products(stream, fmt='csv', batch_size=BATCH_SIZE):
+    """Import products from a text stream; returns a ProductImportResult"""
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError(f'Unknown import format: {fmt}')
+    result = ProductImportResult()
+    categories, materials = name_map(Category), name_map(Material)
+    slugs = SlugAllocator()
+
+    batch = []
+    for line_number, row in read_rows(stream, fmt):
+        try:
+            if isinstance(row, ValidationError):
+                raise row
+            batch.append(build_product(row, categories, materials))
+        except ValidationError as exc:
+            result.errors.append((line_number, ' '.join(exc.messages)))
+            continue
+        if len(batch) >= batch_size:
+            save_batch(batch, result, slugs)
+            batch = []
+    if batch:
+        save_batch(batch, result, slugs)
+    return result
+
+
+def import_products_file(uploaded_file, fmt=None):
+    """Import from an uploaded (binary) file, e.g. from the admin"""
+    fmt = fmt or detect_format(uploaded_file.name)
+    return import_products(io.TextIOWrapper(uploaded_file, encoding='utf-8-sig', newline=''), fmt)
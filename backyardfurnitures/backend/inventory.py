@@ -0,0 +1,231 @@
+"""
+Stock operations.
+
+Every change to ``Inventory`` quantities goes through conditional UPDATE
+statements so concurrent requests cannot oversell or lose writes.
+"""
+from django.db import transaction
+from django.db.models import Case, DateField, F, IntegerField, Value, When
+from django.db.models.lookups import GreaterThanOrEqual
+from django.utils import timezone
+
+from .availability import invalidate_availability
+from .dashboard import invalidate_low_stock
+from .models import Inventory, StockMovement
+
+
+MOVEMENT_ADD = 'add'
+MOVEMENT_REMOVE = 'remove'
+MOVEMENT_SET = 'set'
+
+# Inventory rows per UPDATE statement in bulk_adjust
+ADJUST_BATCH_SIZE = 500
+
+
+class InsufficientStock(Exception):
+    """Raised when the requested quantity is not available"""
+
+    def __init__(self, product_ids, inventory_ids=()):
+        self.product_ids = list(product_ids)
+        # Rows an adjustment would take below zero or below what is reserved
+        self.inventory_ids = list(inventory_ids)
+        if self.inventory_ids:
+            message = f'Insufficient stock in inventory rows {self.inventory_ids}'
+        else:
+            message = f'Insufficient stock for products {self.product_ids}'
+        super().__init__(message)
+
+
+def allocate(rows, quantities):
+    """
+    Spread each product's requested quantity over its inventory rows in
+    active warehouses, most available first. Products without any inventory
+    rows are not stock tracked and are skipped; products whose rows are all
+    in inactive warehouses have nothing available.
+    """
+    by_product = {}
+    for row in rows:
+        by_product.setdefault(row['product_id'], []).append(row)
+
+    allocations = {}
+    short = []
+    for product_id, requested in quantities.items():
+        product_rows = by_product.get(product_id)
+        if not product_rows:
+            continue
+        product_rows.sort(key=lambda row: row['quantity'] - row['reserved_quantity'], reverse=True)
+        remaining = requested
+        for row in product_rows:
+            if not row['warehouse__is_active']:
+                continue
+            take = min(remaining, row['quantity'] - row['reserved_quantity'])
+            if take > 0:
+                allocations[row['id']] = take
+                remaining -= take
+            if not remaining:
+                break
+        if remaining:
+            short.append(product_id)
+
+    if short:
+        raise InsufficientStock(short)
+    return allocations
+
+
+def reserve_stock(quantities):
+    """
+    Reserve a ``{product_id: quantity}`` mapping across active warehouses.
+
+    Runs one SELECT and one UPDATE regardless of how many products are
+    involved. The UPDATE re-checks availability per row, so if a concurrent
+    checkout got there first nothing is reserved and InsufficientStock is
+    raised; call this inside ``transaction.atomic``.
+    """
+    quantities = {pk: qty for pk, qty in quantities.items() if qty > 0}
+    if not quantities:
+        return {}
+
+    rows = (
+        Inventory.objects
+        .select_for_update(of=('self',))
+        .filter(product_id__in=quantities)
+        .values('id', 'product_id', 'quantity', 'reserved_quantity', 'warehouse__is_active')
+    )
+    allocations = allocate(list(rows), quantities)
+    if not allocations:
+        return allocations
+
+    amount = Case(
+        *[When(pk=pk, then=Value(qty)) for pk, qty in allocations.items()],
+        output_field=IntegerField(),
+    )
+    updated = (
+        Inventory.objects
+        .filter(pk__in=allocations, quantity__gte=F('reserved_quantity') + amount)
+        .update(reserved_quantity=F('reserved_quantity') + amount)
+    )
+    if updated != len(allocations):
+        raise InsufficientStock(quantities)
+    invalidate_availability(quantities)
+    # Low stock is measured on available_quantity, which reservations lower
+    invalidate_low_stock()
+    return allocations
+
+
+def plan_adjustments(movements):
+    """
+    Collapse movements, in order, into one ``(set_to, delta, restocked)``
+    instruction per inventory row. ``set_to`` is None unless a 'set'
+    movement fixed the base quantity.
+    """
+    plan = {}
+    for movement in movements:
+        if movement.movement_type not in (MOVEMENT_ADD, MOVEMENT_REMOVE, MOVEMENT_SET):
+            raise ValueError(f'Unknown movement type {movement.movement_type!r}')
+        if movement.quantity < 0:
+            raise ValueError('Movement quantities must not be negative')
+
+        set_to, delta, restocked = plan.get(movement.inventory_id, (None, 0, False))
+        if movement.movement_type == MOVEMENT_SET:
+            set_to, delta = movement.quantity, 0
+        elif movement.movement_type == MOVEMENT_ADD:
+            delta += movement.quantity
+            restocked = True
+        else:
+            delta -= movement.quantity
+        if set_to is not None and set_to + delta < 0:
+            raise InsufficientStock([], [movement.inventory_id])
+        plan[movement.inventory_id] = (set_to, delta, restocked)
+    return plan
+
+
+def apply_adjustments(plan):
+    """Apply one batch of planned adjustments with a single UPDATE"""
+    new_quantity = []
+    lowered = []
+    restocked = []
+    for pk, (set_to, delta, was_restocked) in plan.items():
+        if set_to is not None:
+            when = When(pk=pk, then=Value(set_to + delta))
+        else:
+            when = When(pk=pk, then=F('quantity') + Value(delta))
+        new_quantity.append(when)
+        if set_to is not None or delta < 0:
+            lowered.append(when)
+        if was_restocked:
+            restocked.append(pk)
+
+    queryset = Inventory.objects.filter(pk__in=plan)
+    if lowered:
+        # Stock reserved for open orders cannot be removed or set away
+        result = Case(*lowered, default=F('reserved_quantity'), output_field=IntegerField())
+        queryset = queryset.filter(GreaterThanOrEqual(result, F('reserved_quantity')))
+
+    changes = {
+        'quantity': Case(*new_quantity, output_field=IntegerField()),
+        'updated_at': timezone.now(),
+    }
+    if restocked:
+        changes['last_restock_date'] = Case(
+            When(pk__in=restocked, then=Value(timezone.now().date())),
+            default=F('last_restock_date'),
+            output_field=DateField(),
+        )
+
+    if queryset.update(**changes) != len(plan):
+        raise_adjustment_error(plan)
+
+
+def raise_adjustment_error(plan):
+    """Name the rows that made a batch of adjustments fail"""
+    rows = {
+        pk: (product_id, quantity, reserved)
+        for pk, product_id, quantity, reserved in Inventory.objects.filter(pk__in=plan)
+        .values_list('pk', 'product_id', 'quantity', 'reserved_quantity')
+    }
+    missing = sorted(set(plan) - set(rows))
+    if missing:
+        raise Inventory.DoesNotExist(f'No inventory rows with ids {missing}')
+    short = []
+    for pk, (set_to, delta, restocked) in sorted(plan.items()):
+        product_id, quantity, reserved = rows[pk]
+        if (quantity if set_to is None else set_to) + delta < reserved:
+            short.append(pk)
+    raise InsufficientStock([rows[pk][0] for pk in short], short)
+
+
+def bulk_adjust(movements, batch_size=ADJUST_BATCH_SIZE):
+    """
+    Apply a list of unsaved StockMovement instances and record them in the
+    ledger. Quantities change through F() expressions, one UPDATE per
+    ``batch_size`` inventory rows, so concurrent adjustments never overwrite
+    each other. The whole call is atomic: if a removal or a 'set' would
+    leave less than is reserved, nothing is applied and InsufficientStock
+    is raised, and unknown inventory ids raise Inventory.DoesNotExist.
+    """
+    movements = list(movements)
+    plan = list(plan_adjustments(movements).items())
+
+    with transaction.atomic():
+        for start in range(0, len(plan), batch_size):
+            batch = dict(plan[start:start + batch_size])
+            apply_adjustments(batch)
+            invalidate_availability(
+                Inventory.objects.filter(pk__in=batch).values_list('product_id', flat=True)
+            )
+        StockMovement.objects.bulk_create(movements, batch_size=batch_size)
+
+    invalidate_low_stock()
+    return movements
+
+
+def adjust_stock(inventory_id, movement_type, quantity, reason='', user=None):
+    """Apply a single adjustment, see ``bulk_adjust``"""
+    movement = StockMovement(
+        inventory_id=inventory_id,
+        movement_type=movement_type,
+        quantity=quantity,
+        reason=reason,
+        created_by=user,
+    )
+    return bulk_adjust([movement])[0]
@@ -0,0 +1,77 @@
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.test import RequestFactory, override_settings
+from django.utils import timezone
+
+from backend.models import Category, Customer, Order, Product
+
+
+# A private cache so the benchmark never touches shared entries
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark-fragments',
+    }
+}
+
+
+class Command(BaseCommand):
+    help = 'Time dashboard renders with and without the versioned fragment cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50, help='Products and orders listed on the page')
+        parser.add_argument('--repeat', type=int, default=200, help='Renders timed per run')
+
+    def handle(self, *args, **options):
+        context = self.build_context(options['rows'])
+        request = RequestFactory().get('/dashboard/')
+        request.user = AnonymousUser()
+
+        with override_settings(CACHES=BENCHMARK_CACHES):
+            with override_settings(FRAGMENT_CACHE_TIMEOUT=0):
+                uncached = self.time_renders(request, context, options['repeat'])
+
+            # The first render fills the cache, the timed ones read from it
+            render_to_string('backend/dashboard.html', context, request)
+            cached = self.time_renders(request, context, options['repeat'])
+
+        self.stdout.write(f'Rows per table: {options["rows"]}')
+        self.stdout.write(f'Without fragment cache: {uncached:.2f} ms per page')
+        self.stdout.write(f'With fragment cache:    {cached:.2f} ms per page')
+        self.stdout.write(self.style.SUCCESS(f'Speed-up: {uncached / cached:.1f}x'))
+
+    def time_renders(self, request, context, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            render_to_string('backend/dashboard.html', context, request)
+        return (time.perf_counter() - start) * 1000 / repeat
+
+    def build_context(self, rows):
+        """Unsaved instances, so the benchmark needs no data in the database"""
+        now = timezone.now()
+        category = Category(pk=1, name='Seating', updated_at=now)
+        customer = Customer(pk=1, user=User(first_name='Jane', last_name='Doe'), updated_at=now)
+        statuses = [status for status, label in Order.ORDER_STATUS_CHOICES]
+        products = [
+            Product(pk=i, name=f'Teak Bench {i}', price=Decimal('249.99'), category=category,
+                    created_at=now, updated_at=now)
+            for i in range(1, rows + 1)
+        ]
+        orders = [
+            Order(pk=i, order_number=f'ORD-{i:08X}', customer=customer, total=Decimal('312.50'),
+                  status=statuses[i % len(statuses)], updated_at=now)
+            for i in range(1, rows + 1)
+        ]
+        return {
+            'products': products,
+            'recent_orders': orders,
+            'low_stock_items': [],
+            'total_products': rows,
+            'total_orders': rows,
+            'monthly_revenue': Decimal('15625.00'),
+            'low_stock_count': 0,
+        }
@@ -0,0 +1,27 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from backend.images import IMAGE_MODELS, generate_derivatives, needs_derivatives
+
+
+class Command(BaseCommand):
+    help = 'Build missing responsive image derivatives, e.g. for failed or lost background jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Rebuild images that already have derivatives')
+
+    def handle(self, *args, **options):
+        built = failed = 0
+        for label in IMAGE_MODELS:
+            model = apps.get_model(label)
+            for instance in model.objects.exclude(image='').exclude(image=None).iterator():
+                if not options['force'] and not needs_derivatives(instance):
+                    continue
+                try:
+                    generate_derivatives(instance)
+                    built += 1
+                except (OSError, ValueError, Image.DecompressionBombError) as exc:
+                    failed += 1
+                    self.stderr.write(f'{label} {instance.pk}: {exc}')
+        self.stdout.write(self.style.SUCCESS(f'Built derivatives for {built} images, {failed} failed.'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from backend.reorder import CHUNK_SIZE, SALES_WINDOW_DAYS, generate_purchase_suggestions
+
+
+class Command(BaseCommand):
+    help = 'Replace draft purchase suggestions using recent sales and supplier lead times'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window-days', type=int, default=SALES_WINDOW_DAYS,
+                            help='Days of order history used to measure sales velocity')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help='Inventory rows read and suggestions written per round trip')
+
+    def handle(self, *args, **options):
+        created = generate_purchase_suggestions(options['window_days'], options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Created {created} purchase suggestions.'))
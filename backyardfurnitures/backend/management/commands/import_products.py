@@ -0,0 +1,38 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.imports import BATCH_SIZE, IMPORT_FORMATS, detect_format, import_products
+
+
+class Command(BaseCommand):
+    help = 'Create or update products from a CSV or JSON Lines file, matched on sku'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import')
+        parser.add_argument('--format', choices=IMPORT_FORMATS,
+                            help='File format, guessed from the extension by default')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='Rows validated and written per round trip')
+        parser.add_argument('--errors', help='Write the rejected rows to this CSV file')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or detect_format(options['path'])
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as stream:
+                result = import_products(stream, fmt, options['batch_size'])
+        except OSError as exc:
+            raise CommandError(exc)
+
+        if options['errors']:
+            with open(options['errors'], 'w', newline='') as report:
+                writer = csv.writer(report)
+                writer.writerow(['line', 'error'])
+                writer.writerows(result.errors)
+        else:
+            for line_number, message in result.errors:
+                self.stderr.write(f'Line {line_number}: {message}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {result.created} and updated {result.updated} products, rejected {len(result.errors)} rows.'
+        ))
@@ -0,0 +1,183 @@
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections
+from django.http import QueryDict
+from django.test import override_settings
+
+from backend.availability import get_available_quantities
+from backend.categories import get_category_tree
+from backend.checkout import place_order
+from backend.facets import FacetSelection, get_facet_counts
+from backend.models import (
+    Address, Cart, CartItem, Category, Customer, Inventory, Material, Product, Warehouse
+)
+
+
+# Caches off, so every storefront request reaches the database
+LOAD_TEST_SETTINGS = {
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+    'IMAGE_WORKERS': 0,
+}
+
+PROFILES = (
+    ('default', {}),
+    ('production', settings.SQLITE_PRODUCTION_SETTINGS),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Run concurrent storefront reads and checkouts against a scratch SQLite copy, '
+        'once with the default settings and once with the production profile'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8, help='Threads loading shop pages')
+        parser.add_argument('--writers', type=int, default=4, help='Threads placing orders')
+        parser.add_argument('--seconds', type=float, default=10, help='Duration of each run')
+        parser.add_argument('--products', type=int, default=500, help='Catalog size')
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp(prefix='load-test-')
+        original = dict(connections.settings['default'])
+        try:
+            with override_settings(**LOAD_TEST_SETTINGS):
+                template = os.path.join(directory, 'template.sqlite3')
+                self.use_database(original, template, {})
+                call_command('migrate', verbosity=0)
+                self.seed(options['products'], options['writers'])
+
+                results = []
+                for profile, profile_settings in PROFILES:
+                    path = os.path.join(directory, f'{profile}.sqlite3')
+                    shutil.copy(template, path)
+                    self.use_database(original, path, profile_settings)
+                    self.stdout.write(f'Running {profile} profile for {options["seconds"]:g}s...')
+                    results.append((profile, self.run_load(options)))
+        finally:
+            connections.close_all()
+            connections.settings['default'] = original
+            shutil.rmtree(directory, ignore_errors=True)
+
+        self.report(results)
+
+    def use_database(self, original, name, profile_settings):
+        """Point the default alias at ``name``; threads started afterwards connect there"""
+        connections.close_all()
+        connections.settings['default'] = {
+            **original, 'NAME': name, 'OPTIONS': {}, 'CONN_MAX_AGE': 0, **profile_settings,
+        }
+        del connections['default']
+
+    def seed(self, product_count, customer_count):
+        address = Address.objects.create(
+            address_line1='1 Yard Lane', city='Nairobi', state='Nairobi', postal_code='00100', country='Kenya'
+        )
+        warehouse = Warehouse.objects.create(name='Main', address=address, phone='1', email='main@example.com')
+        categories = [Category.objects.create(name=f'Category {i}') for i in range(8)]
+        materials = [Material.objects.create(name=f'Material {i}', weather_resistance_rating=5,
+                                             maintenance_level='low') for i in range(4)]
+        Product.objects.bulk_create([
+            Product(
+                name=f'Product {i}', slug=f'product-{i}', description='Outdoor furniture', sku=f'LT-{i}',
+                category=categories[i % len(categories)], material=materials[i % len(materials)],
+                price=Decimal(50 + i % 900), weight=1, width=1, height=1, depth=1,
+            )
+            for i in range(product_count)
+        ])
+        Inventory.objects.bulk_create([
+            Inventory(product=product, warehouse=warehouse, quantity=10 ** 9)
+            for product in Product.objects.all()
+        ])
+        for i in range(customer_count):
+            Customer.objects.create(user=User.objects.create(username=f'load-test-{i}'))
+
+    def run_load(self, options):
+        deadline = time.perf_counter() + options['seconds']
+        stats = {'shop': [], 'checkout': [], 'errors': []}
+        lock = threading.Lock()
+        customer_ids = list(Customer.objects.values_list('pk', flat=True))
+        product_ids = list(Product.objects.values_list('pk', flat=True))
+        category_slugs = list(Category.objects.values_list('slug', flat=True))
+        address = Address.objects.first()
+        connections.close_all()
+
+        def worker(kind, operation, *args):
+            try:
+                while time.perf_counter() < deadline:
+                    start = time.perf_counter()
+                    try:
+                        operation(*args)
+                    except OperationalError as exc:
+                        with lock:
+                            stats['errors'].append(f'{kind}: {exc}')
+                        continue
+                    with lock:
+                        stats[kind].append(time.perf_counter() - start)
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=worker, args=('shop', self.shop_page, category_slugs))
+            for _ in range(options['readers'])
+        ] + [
+            threading.Thread(target=worker, args=('checkout', self.checkout, customer_ids[i], product_ids, address))
+            for i in range(options['writers'])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats['seconds'] = options['seconds']
+        return stats
+
+    def shop_page(self, category_slugs):
+        """The queries behind a filtered shop page: facets, one page of products, stock badges"""
+        tree = get_category_tree()
+        query = QueryDict(f'category={random.choice(category_slugs)}')
+        selection = FacetSelection(query, tree)
+        products = Product.objects.with_primary_image().filter(is_active=True)
+        get_facet_counts(products, selection, tree)
+        page = list(selection.filter(products).order_by('-units_sold')[:12])
+        get_available_quantities(product.pk for product in page)
+
+    def checkout(self, customer_id, product_ids, address):
+        """Fill a cart with a few products and place the order"""
+        customer = Customer(pk=customer_id)
+        cart = Cart.objects.create(customer=customer)
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product_id=product_id, quantity=1)
+            for product_id in random.sample(product_ids, 3)
+        ])
+        place_order(customer, cart, address, address, 'standard', 'credit_card')
+
+    def report(self, results):
+        self.stdout.write('')
+        self.stdout.write(f'{"profile":<12}{"shop/s":>10}{"p95 ms":>10}{"orders/s":>10}{"p95 ms":>10}{"errors":>8}')
+        for profile, stats in results:
+            self.stdout.write(
+                f'{profile:<12}'
+                f'{len(stats["shop"]) / stats["seconds"]:>10.1f}{p95(stats["shop"]):>10.1f}'
+                f'{len(stats["checkout"]) / stats["seconds"]:>10.1f}{p95(stats["checkout"]):>10.1f}'
+                f'{len(stats["errors"]):>8}'
+            )
+        for profile, stats in results:
+            for error in sorted(set(stats['errors'])):
+                self.stdout.write(self.style.WARNING(f'{profile}: {error}'))
+
+
+def p95(durations):
+    if len(durations) < 2:
+        return durations[0] * 1000 if durations else 0.0
+    return statistics.quantiles(durations, n=20)[-1] * 1000
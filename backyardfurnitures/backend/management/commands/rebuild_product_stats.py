@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from backend.stats import rebuild_product_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute rating average, review count and units sold for every product'
+
+    def handle(self, *args, **options):
+        updated = rebuild_product_stats()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt stats for {updated} products.'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from backend.related import rebuild_related_products
+
+
+class Command(BaseCommand):
+    help = 'Recompute the related products index from categories, materials and co-purchases'
+
+    def handle(self, *args, **options):
+        updated = rebuild_related_products()
+        self.stdout.write(self.style.SUCCESS(f'Updated related products for {updated} products.'))
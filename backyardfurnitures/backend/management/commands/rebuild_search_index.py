@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from backend.models import Product
+from backend.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product search index from the Product table'
+
+    def handle(self, *args, **options):
+        get_search_backend().rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {Product.objects.count()} products.'))
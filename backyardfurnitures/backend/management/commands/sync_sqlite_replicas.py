@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from backend.replicas import replica_aliases, sync_sqlite_replicas
+
+
+class Command(BaseCommand):
+    help = 'Copy the SQLite database over the SQLITE_REPLICAS files that stand in for read replicas'
+
+    def handle(self, *args, **options):
+        aliases = replica_aliases()
+        if not aliases:
+            raise CommandError('No replicas configured; set SQLITE_REPLICAS to a comma-separated list of files.')
+        for alias in [DEFAULT_DB_ALIAS, *aliases]:
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError(f'Database "{alias}" is not SQLite; sync real replicas with replication.')
+        copied = sync_sqlite_replicas()
+        self.stdout.write(self.style.SUCCESS(f'Copied the database to {len(copied)} replicas: {", ".join(copied)}.'))
@@ -0,0 +1,123 @@
+"""
+Per-request SQL instrumentation.
+
+``QueryCountMiddleware`` records how many queries a request ran, how long
+they took and which statements repeated, reports them in ``X-Query-*``
+response headers and a JSON log line, and checks the count against the
+``QUERY_BUDGETS`` setting for the matched route or URL name.
+"""
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger('backend.queries')
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+IN_LIST_RE = re.compile(r'\bIN \((?:\s*(?:\?|%s)\s*,?)+\)', re.IGNORECASE)
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def fingerprint(sql):
+    """Normalize a statement so repeats with different parameters compare equal"""
+    sql = STRING_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    return WHITESPACE_RE.sub(' ', sql).strip()
+
+
+def get_query_budget(match):
+    """Budget for a resolved URL, by route first since several routes can share a name"""
+    budgets = getattr(settings, 'QUERY_BUDGETS', {})
+    default = getattr(settings, 'QUERY_BUDGET_DEFAULT', None)
+    if match is None:
+        return default
+    return budgets.get(match.route, budgets.get(match.url_name, default))
+
+
+class QueryRecorder:
+    """Database execute wrapper collecting count, time and fingerprints"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    @property
+    def duplicates(self):
+        return {sql: count for sql, count in self.fingerprints.items() if count > 1}
+
+    @property
+    def duplicate_count(self):
+        return sum(count - 1 for count in self.duplicates.values())
+
+    @contextmanager
+    def record(self):
+        """Record queries on every database connection inside the block"""
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(self))
+            yield self
+
+
+class QueryCountMiddleware:
+    """Measure every request's SQL and enforce per-URL query budgets"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        url_name = match.url_name if match else None
+        budget = get_query_budget(match)
+
+        response['X-Query-Count'] = str(recorder.count)
+        response['X-Query-Time'] = f'{recorder.duration * 1000:.2f}'
+        response['X-Query-Duplicates'] = str(recorder.duplicate_count)
+
+        log_line = {
+            'path': request.path,
+            'method': request.method,
+            'url_name': url_name,
+            'route': match.route if match else None,
+            'status': response.status_code,
+            'query_count': recorder.count,
+            'query_time_ms': round(recorder.duration * 1000, 2),
+            'duplicate_queries': recorder.duplicates,
+            'budget': budget,
+        }
+        if budget is not None and recorder.count > budget:
+            logger.warning(json.dumps(log_line))
+            if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                raise QueryBudgetExceeded(
+                    f'{url_name} ran {recorder.count} queries, budget is {budget}: '
+                    f'{json.dumps(recorder.duplicates)}'
+                )
+        else:
+            logger.info(json.dumps(log_line))
+
+        return response
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.2 on 2026-10-17 03:25
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_product_stats(apps, schema_editor):
+    Product = apps.get_model('backend', 'Product')
+    ProductReview = apps.get_model('backend', 'ProductReview')
+    OrderItem = apps.get_model('backend', 'OrderItem')
+    reviews = ProductReview.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    sales = OrderItem.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    Product.objects.update(
+        rating_average=Coalesce(Subquery(reviews.annotate(value=Avg('rating')).values('value')), Value(0.0)),
+        review_count=Coalesce(Subquery(reviews.annotate(value=Count('id')).values('value')), Value(0)),
+        units_sold=Coalesce(Subquery(sales.annotate(value=Sum('quantity')).values('value')), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0002_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_average',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='review_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='units_sold',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(populate_product_stats, migrations.RunPython.noop),
+    ]
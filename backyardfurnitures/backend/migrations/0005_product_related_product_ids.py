@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-17 03:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0004_stock_movement'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='related_product_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.2 on 2026-10-17 03:37
+
+from django.db import migrations, models
+
+
+def populate_category_paths(apps, schema_editor):
+    Category = apps.get_model('backend', 'Category')
+    parents = dict(Category.objects.values_list('pk', 'parent_id'))
+    paths = {}
+
+    def path_of(pk, seen=()):
+        if pk not in paths:
+            parent_id = parents[pk]
+            # Categories caught in a parent cycle are treated as roots
+            prefix = path_of(parent_id, seen + (pk,)) if parent_id and parent_id not in seen else ''
+            paths[pk] = f'{prefix}{pk:06d}/'
+        return paths[pk]
+
+    categories = [Category(pk=pk, path=path_of(pk)) for pk in parents]
+    Category.objects.bulk_update(categories, ['path'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0005_product_related_product_ids'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(populate_category_paths, migrations.RunPython.noop),
+    ]
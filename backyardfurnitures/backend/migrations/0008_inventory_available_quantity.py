@@ -0,0 +1,23 @@
+# Generated by Django 5.1.2 on 2026-10-17 03:42
+
+import django.db.models.expressions
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0007_view_access_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventory',
+            name='available_quantity',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(models.F('quantity'), '-', models.F('reserved_quantity')), output_field=models.IntegerField()),
+        ),
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(django.db.models.expressions.CombinedExpression(models.F('available_quantity'), '-', models.F('reorder_point')), name='inventory_restock_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.2 on 2026-10-17 03:43
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0008_inventory_available_quantity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PurchaseSuggestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('quantity', models.IntegerField(validators=[django.core.validators.MinValueValidator(1)])),
+                ('unit_cost', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('lead_time_days', models.IntegerField()),
+                ('daily_sales', models.DecimalField(decimal_places=3, help_text='Recent units sold per day', max_digits=10)),
+                ('status', models.CharField(choices=[('draft', 'Draft'), ('ordered', 'Ordered'), ('dismissed', 'Dismissed')], default='draft', max_length=20)),
+                ('inventory', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='purchase_suggestions', to='backend.inventory')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='purchase_suggestions', to='backend.product')),
+                ('supplier', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='backend.supplier')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='purchase_suggestions', to='backend.warehouse')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.2 on 2026-10-17 04:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def populate_primary_images(apps, schema_editor):
+    Product = apps.get_model('backend', 'Product')
+    ProductImage = apps.get_model('backend', 'ProductImage')
+    images = ProductImage.objects.filter(product=OuterRef('pk')).order_by('-is_primary', 'display_order', 'pk')
+    Product.objects.update(primary_image=Subquery(images.values('pk')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0010_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='primary_image',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='backend.productimage'),
+        ),
+        migrations.RunPython(populate_primary_images, migrations.RunPython.noop),
+    ]
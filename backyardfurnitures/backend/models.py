@@ -1,5 +1,8 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Substr
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils.text import slugify
 import uuid
@@ -29,18 +32,66 @@ class Address(TimeStampedModel):
         verbose_name_plural = "Addresses"
 
 
+# Digits per level of Category.path
+CATEGORY_PATH_STEP = 6
+
+
+def category_path_upper_bound(path):
+    """Smallest path sorting after every descendant of ``path``"""
+    # Paths only hold digits and '/', and '0' sorts right after '/'
+    return path[:-1] + '0'
+
+
+class CategoryQuerySet(models.QuerySet):
+    def subtree(self, category):
+        """The category and all its descendants, as an indexed range on path"""
+        return self.filter(path__gte=category.path, path__lt=category_path_upper_bound(category.path))
+
+
 class Category(TimeStampedModel):
     name = models.CharField(max_length=100)
     slug = models.SlugField(max_length=120, unique=True)
     description = models.TextField(blank=True)
     parent = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='subcategories')
     image = models.ImageField(upload_to='categories/', blank=True, null=True)
+    # Resized WebP and fallback copies of the image, written by backend.images
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
     is_active = models.BooleanField(default=True)
+    # Materialized path of zero-padded ids from the root, e.g. "000001/000004/"
+    path = models.CharField(max_length=255, db_index=True, editable=False, default='')
+
+    objects = CategoryQuerySet.as_manager()
+
+    def clean(self):
+        super().clean()
+        if self.path and self.parent_id:
+            parent_path = Category.objects.filter(pk=self.parent_id).values_list('path', flat=True).first() or ''
+            if parent_path.startswith(self.path):
+                raise ValidationError({'parent': 'A category cannot be moved under one of its subcategories.'})
+
+    def own_path_segment(self):
+        return f'{self.pk:0{CATEGORY_PATH_STEP}d}/'
 
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            old_path = ''
+            if self.pk:
+                old_path = Category.objects.filter(pk=self.pk).values_list('path', flat=True).first() or ''
+            super().save(*args, **kwargs)
+
+            parent_path = ''
+            if self.parent_id:
+                parent_path = Category.objects.filter(pk=self.parent_id).values_list('path', flat=True).get()
+            self.path = parent_path + self.own_path_segment()
+            if self.path != old_path:
+                Category.objects.filter(pk=self.pk).update(path=self.path)
+                if old_path:
+                    # Move the whole subtree along with this category
+                    Category.objects.filter(
+                        path__gt=old_path, path__lt=category_path_upper_bound(old_path)
+                    ).update(path=Concat(Value(self.path), Substr('path', len(old_path) + 1)))
 
     def __str__(self):
         return self.name
@@ -68,6 +119,12 @@ class Material(TimeStampedModel):
         return self.name
 
 
+class ProductQuerySet(models.QuerySet):
+    def with_primary_image(self):
+        """Join the denormalized primary image, so product cards need no image queries"""
+        return self.select_related('primary_image')
+
+
 class Product(TimeStampedModel):
     name = models.CharField(max_length=200)
     slug = models.SlugField(max_length=220, unique=True)
@@ -90,6 +147,21 @@ class Product(TimeStampedModel):
     featured = models.BooleanField(default=False)
     warranty_months = models.IntegerField(default=0)
 
+    # Aggregates maintained by backend.stats, used for shop sorting
+    rating_average = models.DecimalField(max_digits=3, decimal_places=2, default=0)
+    review_count = models.IntegerField(default=0)
+    units_sold = models.IntegerField(default=0)
+
+    # Best related products, precomputed by backend.related
+    related_product_ids = models.JSONField(default=list, blank=True)
+
+    # Image shown on product cards, maintained by backend.stats
+    primary_image = models.ForeignKey(
+        'ProductImage', on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='+'
+    )
+
+    objects = ProductQuerySet.as_manager()
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
@@ -102,11 +174,31 @@ class Product(TimeStampedModel):
     def is_on_sale(self):
         return self.sale_price is not None and self.sale_price < self.price
 
+    class Meta:
+        # Boolean filters compile to bare column tests on SQLite, which only
+        # partial indexes with the same condition can serve
+        indexes = [
+            # Shop filtered by category, sorted by price
+            models.Index(
+                fields=['category', 'price'], condition=models.Q(is_active=True), name='product_active_cat_price_idx'
+            ),
+            # Home page new arrivals and the shop's newest sort
+            models.Index(fields=['-created_at'], condition=models.Q(is_active=True), name='product_new_arrivals_idx'),
+            # Home page featured products. Without ANALYZE statistics SQLite
+            # breaks cost ties in favour of the newest index, so this one
+            # stays after the broader new arrivals index.
+            models.Index(
+                fields=['-created_at'], condition=models.Q(is_active=True, featured=True), name='product_featured_idx'
+            ),
+        ]
+
 
 class ProductImage(TimeStampedModel):
     
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='products/')
+    # Resized WebP and fallback copies of the image, written by backend.images
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
     alt_text = models.CharField(max_length=200)
     is_primary = models.BooleanField(default=False)
     display_order = models.IntegerField(default=1)
@@ -124,6 +216,8 @@ class ProductVariant(TimeStampedModel):
     color_code = models.CharField(max_length=10, help_text="Hex color code")
     price_adjustment = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     image = models.ImageField(upload_to='variants/', blank=True, null=True)
+    # Resized WebP and fallback copies of the image, written by backend.images
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
     
     def __str__(self):
         return f"{self.product.name} - {self.color}"
@@ -170,27 +264,65 @@ class Warehouse(TimeStampedModel):
         return self.name
 
 
+# Stock left above the reorder point; zero or less means the row needs restocking
+RESTOCK_MARGIN = F('available_quantity') - F('reorder_point')
+
+
+class InventoryQuerySet(models.QuerySet):
+    def low_stock(self):
+        """Rows that need restocking, as a range scan on inventory_restock_idx"""
+        return self.alias(restock_margin=RESTOCK_MARGIN).filter(restock_margin__lte=0)
+
+
 class Inventory(TimeStampedModel):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='inventory')
     warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='inventory')
     quantity = models.IntegerField(default=0)
     reserved_quantity = models.IntegerField(default=0, help_text="Items in customer carts or being processed")
+    available_quantity = models.GeneratedField(
+        expression=F('quantity') - F('reserved_quantity'),
+        output_field=models.IntegerField(),
+        db_persist=True,
+    )
     reorder_point = models.IntegerField(default=5)
     last_restock_date = models.DateField(blank=True, null=True)
 
+    objects = InventoryQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.product.name} at {self.warehouse.name}"
 
-    @property
-    def available_quantity(self):
-        return self.quantity - self.reserved_quantity
-
     @property
     def needs_restock(self):
         return self.available_quantity <= self.reorder_point
 
     class Meta:
         verbose_name_plural = "Inventories"
+        indexes = [
+            models.Index(RESTOCK_MARGIN, name='inventory_restock_idx'),
+        ]
+
+
+class StockMovement(models.Model):
+    """Append-only ledger of inventory adjustments"""
+    MOVEMENT_CHOICES = [
+        ('add', 'Add Stock'),
+        ('remove', 'Remove Stock'),
+        ('set', 'Set Exact Quantity'),
+    ]
+
+    inventory = models.ForeignKey(Inventory, on_delete=models.CASCADE, related_name='movements')
+    movement_type = models.CharField(max_length=10, choices=MOVEMENT_CHOICES)
+    quantity = models.IntegerField(validators=[MinValueValidator(0)])
+    reason = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.get_movement_type_display()} {self.quantity} for inventory #{self.inventory_id}"
+
+    class Meta:
+        ordering = ['-created_at']
 
 
 class Order(TimeStampedModel):
@@ -236,6 +368,14 @@ class Order(TimeStampedModel):
     def __str__(self):
         return self.order_number
 
+    class Meta:
+        indexes = [
+            # A customer's order history, newest first
+            models.Index(fields=['customer', '-created_at'], name='order_customer_created_idx'),
+            # Order list filtered by status
+            models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+        ]
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
@@ -280,6 +420,31 @@ class ProductSupplier(TimeStampedModel):
         return f"{self.product.name} from {self.supplier.name}"
 
 
+class PurchaseSuggestion(TimeStampedModel):
+    """Reorder proposal for one inventory row, written by backend.reorder"""
+    STATUS_CHOICES = [
+        ('draft', 'Draft'),
+        ('ordered', 'Ordered'),
+        ('dismissed', 'Dismissed'),
+    ]
+
+    inventory = models.ForeignKey(Inventory, on_delete=models.CASCADE, related_name='purchase_suggestions')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='purchase_suggestions')
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='purchase_suggestions')
+    supplier = models.ForeignKey(Supplier, on_delete=models.SET_NULL, null=True, blank=True)
+    quantity = models.IntegerField(validators=[MinValueValidator(1)])
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    lead_time_days = models.IntegerField()
+    daily_sales = models.DecimalField(max_digits=10, decimal_places=3, help_text="Recent units sold per day")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='draft')
+
+    def __str__(self):
+        return f"Reorder {self.quantity} of {self.product.name} for {self.warehouse.name}"
+
+    class Meta:
+        ordering = ['-created_at']
+
+
 class ProductReview(TimeStampedModel):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reviews')
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='reviews')
@@ -301,6 +466,8 @@ class ReviewImage(TimeStampedModel):
    
     review = models.ForeignKey(ProductReview, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='reviews/')
+    # Resized WebP and fallback copies of the image, written by backend.images
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
     
     def __str__(self):
         return f"Image for review #{self.review.id}"
@@ -333,6 +500,14 @@ class Promotion(TimeStampedModel):
                 self.start_date <= now <= self.end_date and 
                 (self.usage_limit == 0 or self.used_count < self.usage_limit))
 
+    class Meta:
+        indexes = [
+            # Running promotions: end_date leads because every lookup bounds it
+            models.Index(
+                fields=['end_date', 'start_date'], condition=models.Q(is_active=True), name='promotion_running_idx'
+            ),
+        ]
+
 
 class PromotionCategory(models.Model):
     promotion = models.ForeignKey(Promotion, on_delete=models.CASCADE, related_name='categories')
@@ -0,0 +1,142 @@
+"""
+Response cache for anonymous storefront pages.
+
+Pages are cached per path and normalized query string. While rendering, a
+view names the products, categories and promotions it shows with
+``add_cache_tags``. Every tag has a version in the cache and an entry is
+only served while all the tags it was stored with keep their version, so
+bumping a tag (see ``backend.signals``) evicts exactly the pages that
+depend on it.
+"""
+import hashlib
+import uuid
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.db import transaction
+
+from .replicas import reading_from
+
+
+PAGE_CACHE_TIMEOUT = getattr(settings, 'PAGE_CACHE_TIMEOUT', 600)
+
+PAGE_KEY_PREFIX = 'pagecache:page:'
+TAG_KEY_PREFIX = 'pagecache:tag:'
+
+# Pages whose product list can change whenever any product changes
+CATALOG_TAG = 'catalog'
+# Category, material and promotion navigation
+CATEGORIES_TAG = 'categories'
+MATERIALS_TAG = 'materials'
+PROMOTIONS_TAG = 'promotions'
+
+# Query values that render the same page as leaving the parameter out
+DEFAULT_PARAMS = {
+    'sort': 'default',
+    'page': '1',
+}
+
+
+def product_tag(product_id):
+    return f'product:{product_id}'
+
+
+def category_tag(category_id):
+    return f'category:{category_id}'
+
+
+def promotion_tag(promotion_id):
+    return f'promotion:{promotion_id}'
+
+
+def add_cache_tags(request, *tags):
+    """Record that the page being rendered depends on ``tags``"""
+    if not hasattr(request, 'cache_tags'):
+        request.cache_tags = set()
+    request.cache_tags.update(tags)
+
+
+def invalidate_tags(*tags):
+    """Evict every page tagged with any of ``tags`` once the transaction commits"""
+    keys = [TAG_KEY_PREFIX + tag for tag in set(tags)]
+    if keys:
+        transaction.on_commit(lambda: cache.set_many({key: uuid.uuid4().hex for key in keys}, None))
+
+
+def tag_versions(tags):
+    """Current ``{tag key: version}`` for ``tags``, creating missing versions"""
+    keys = [TAG_KEY_PREFIX + tag for tag in tags]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, uuid.uuid4().hex, None)
+        versions.update(cache.get_many(missing))
+    return versions
+
+
+def normalize_query(query, params):
+    """Only ``params`` count, in a fixed order, without blanks or defaults"""
+    items = []
+    for name in sorted(params):
+        value = query.get(name, '').strip()
+        if value and value != DEFAULT_PARAMS.get(name):
+            items.append((name, value))
+    return urlencode(items)
+
+
+def page_key(request, params):
+    url = f'{request.path}?{normalize_query(request.GET, params)}'
+    return PAGE_KEY_PREFIX + hashlib.md5(url.encode()).hexdigest()
+
+
+def is_cacheable_request(request):
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    if request.user.is_authenticated:
+        return False
+    # Pending flash messages are part of the page
+    return not len(messages.get_messages(request))
+
+
+def is_cacheable_response(request, response):
+    if request.method != 'GET' or response.status_code != 200 or response.streaming:
+        return False
+    if response.cookies:
+        return False
+    # A page with a CSRF token is bound to this visitor's cookie
+    return not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+
+
+def cache_anonymous_page(params=(), timeout=None):
+    """
+    Cache a view's response for anonymous visitors. ``params`` lists the
+    query parameters that change the page; any others are ignored.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not is_cacheable_request(request):
+                return view(request, *args, **kwargs)
+
+            key = page_key(request, params)
+            entry = cache.get(key)
+            if entry is not None:
+                response, versions = entry
+                if cache.get_many(list(versions)) == versions:
+                    return response
+
+            # Render from the primary, a lagging replica would cache the page the change evicted
+            with reading_from(None):
+                response = view(request, *args, **kwargs)
+            if is_cacheable_response(request, response):
+                # Versions are read after rendering; a change committed while
+                # the view ran is bounded by the timeout
+                versions = tag_versions(getattr(request, 'cache_tags', ()))
+                cache.set(key, (response, versions), PAGE_CACHE_TIMEOUT if timeout is None else timeout)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,197 @@
+"""
+Keyset (seek) pagination.
+
+Instead of ``COUNT(*)`` plus ``OFFSET n`` a page is fetched with a WHERE
+clause on the sort key of the last row seen, so page 500 costs the same as
+page 1. Pages are addressed with opaque cursors rather than page numbers.
+"""
+import base64
+import binascii
+import datetime
+import json
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+
+CURSOR_PARAM = 'cursor'
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """Keep full microsecond precision, DjangoJSONEncoder rounds to ms"""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def resolve_field(model, lookup):
+    """Return the concrete field a ``user__last_name`` style lookup points at"""
+    parts = lookup.split('__')
+    for part in parts[:-1]:
+        model = model._meta.get_field(part).related_model
+        if model is None:
+            raise FieldDoesNotExist(lookup)
+    return model._meta.get_field(parts[-1])
+
+
+def resolve_value(obj, lookup):
+    for part in lookup.split('__'):
+        obj = getattr(obj, part)
+    return obj
+
+
+class KeysetPage:
+    """A page of results plus the cursors needed to move either way"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """Paginate a queryset by seeking past the sort key of the last row"""
+
+    def __init__(self, queryset, per_page, ordering=None):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        ordering = list(ordering or queryset.query.order_by)
+        # The primary key makes the sort key unique so no row is skipped
+        if not {'pk', '-pk', 'id', '-id'} & set(ordering):
+            ordering.append('pk')
+        self.ordering = [
+            (term.lstrip('-'), term.startswith('-')) for term in ordering
+        ]
+
+    @classmethod
+    def supports(cls, queryset):
+        """Whether the queryset is ordered purely by non-null model fields"""
+        ordering = queryset.query.order_by
+        if not ordering:
+            return False
+        for term in ordering:
+            if not isinstance(term, str):
+                return False
+            lookup = term.lstrip('-')
+            if lookup == 'pk':
+                continue
+            try:
+                field = resolve_field(queryset.model, lookup)
+            except FieldDoesNotExist:
+                return False
+            if field.null or not field.concrete:
+                return False
+        return True
+
+    def encode_cursor(self, obj, direction):
+        values = [resolve_value(obj, lookup) for lookup, _ in self.ordering]
+        payload = json.dumps({'d': direction, 'v': values}, cls=CursorEncoder)
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            direction, raw_values = payload['d'], payload['v']
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            raise InvalidCursor(cursor)
+        if direction not in ('n', 'p') or len(raw_values) != len(self.ordering):
+            raise InvalidCursor(cursor)
+
+        values = []
+        for (lookup, _), raw in zip(self.ordering, raw_values):
+            field = self.queryset.model._meta.pk if lookup == 'pk' else resolve_field(self.queryset.model, lookup)
+            try:
+                values.append(field.to_python(raw))
+            except Exception:
+                raise InvalidCursor(cursor)
+        return direction, values
+
+    def seek_filter(self, values, forward):
+        """Rows strictly after (or before) the given sort key"""
+        condition = Q()
+        equal = Q()
+        for (lookup, descending), value in zip(self.ordering, values):
+            operator = 'lt' if descending == forward else 'gt'
+            condition |= equal & Q(**{f'{lookup}__{operator}': value})
+            equal &= Q(**{lookup: value})
+        return condition
+
+    def get_page(self, cursor=None):
+        direction, values = 'n', None
+        if cursor:
+            try:
+                direction, values = self.decode_cursor(cursor)
+            except InvalidCursor:
+                direction, values = 'n', None
+        forward = direction == 'n'
+
+        # Backward pages are read in reverse sort order and flipped below
+        ordering = [
+            f'{"-" if descending == forward else ""}{lookup}'
+            for lookup, descending in self.ordering
+        ]
+
+        queryset = self.queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self.seek_filter(values, forward))
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not forward:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or not forward:
+                next_cursor = self.encode_cursor(rows[-1], 'n')
+            if values is not None and (has_more or forward):
+                previous_cursor = self.encode_cursor(rows[0], 'p')
+        return KeysetPage(rows, next_cursor, previous_cursor)
+
+
+def paginate(request, queryset, per_page, page_param='page'):
+    """
+    Return a page for the request, seeking by cursor when ``?cursor=`` is
+    present and the queryset ordering allows it, otherwise by page number.
+    """
+    if CURSOR_PARAM in request.GET and KeysetPaginator.supports(queryset):
+        paginator = KeysetPaginator(queryset, per_page)
+        return paginator, paginator.get_page(request.GET.get(CURSOR_PARAM))
+    paginator = Paginator(queryset, per_page)
+    return paginator, paginator.get_page(request.GET.get(page_param))
+
+
+class KeysetPaginationMixin:
+    """ListView mixin adding the cursor based pagination mode"""
+
+    def paginate_queryset(self, queryset, page_size):
+        if CURSOR_PARAM not in self.request.GET or not KeysetPaginator.supports(queryset):
+            return super().paginate_queryset(queryset, page_size)
+        paginator = KeysetPaginator(queryset, page_size)
+        page = paginator.get_page(self.request.GET.get(CURSOR_PARAM))
+        return paginator, page, page.object_list, page.has_other_pages()
@@ -0,0 +1,231 @@
+"""
+Price and promotion engine.
+
+Active promotions are compiled into an in-memory index keyed by product,
+category and code. Each process keeps its own copy and only checks a
+version number in the cache, which ``invalidate_promotion_index`` bumps
+whenever a promotion or its scoping changes. With a shared cache every
+process sees the bump on its next request; with a per-process cache such
+as the default LocMemCache only the process that made the change does, so
+copies are also rebuilt once they are PROMOTION_INDEX_MAX_AGE seconds old.
+"""
+import time
+import uuid
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Promotion, PromotionCategory, PromotionProduct
+from .replicas import reading_from
+
+
+INDEX_VERSION_KEY = 'pricing:promotion_index_version'
+
+PROMOTION_INDEX_MAX_AGE = getattr(settings, 'PROMOTION_INDEX_MAX_AGE', 60)
+
+CENT = Decimal('0.01')
+
+
+class CompiledPromotion:
+    """Promotion fields needed for pricing plus its product/category scope"""
+
+    def __init__(self, promotion, product_ids=(), category_ids=()):
+        self.id = promotion.id
+        self.name = promotion.name
+        self.code = promotion.code or None
+        self.discount_type = promotion.discount_type
+        self.discount_value = promotion.discount_value
+        self.minimum_order_value = promotion.minimum_order_value
+        self.usage_limit = promotion.usage_limit
+        self.start_date = promotion.start_date
+        self.end_date = promotion.end_date
+        self.product_ids = frozenset(product_ids)
+        self.category_ids = frozenset(category_ids)
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def is_scoped(self):
+        return bool(self.product_ids or self.category_ids)
+
+    def is_running(self, now):
+        return self.start_date <= now <= self.end_date
+
+    def applies_to(self, line):
+        if not self.is_scoped:
+            return True
+        return line['product_id'] in self.product_ids or line['category_id'] in self.category_ids
+
+    def discount_for(self, amount):
+        if self.discount_type == 'percentage':
+            discount = amount * self.discount_value / 100
+        else:
+            discount = min(self.discount_value, amount)
+        return discount.quantize(CENT)
+
+
+class PromotionIndex:
+    """Active promotions looked up by product, category or code"""
+
+    def __init__(self, promotions):
+        self.unscoped = []
+        self.by_product = {}
+        self.by_category = {}
+        self.by_code = {}
+        for promotion in promotions:
+            if promotion.code:
+                self.by_code[promotion.code.lower()] = promotion
+                continue
+            if not promotion.is_scoped:
+                self.unscoped.append(promotion)
+            for product_id in promotion.product_ids:
+                self.by_product.setdefault(product_id, []).append(promotion)
+            for category_id in promotion.category_ids:
+                self.by_category.setdefault(category_id, []).append(promotion)
+
+    @classmethod
+    def build(cls):
+        """Compile every promotion that is active, not over and not used up"""
+        promotions = list(
+            Promotion.objects
+            .filter(is_active=True, end_date__gte=timezone.now())
+            .filter(Q(usage_limit=0) | Q(used_count__lt=F('usage_limit')))
+        )
+        promotion_ids = [promotion.id for promotion in promotions]
+
+        products = {}
+        for promotion_id, product_id in (
+            PromotionProduct.objects
+            .filter(promotion_id__in=promotion_ids)
+            .values_list('promotion_id', 'product_id')
+        ):
+            products.setdefault(promotion_id, []).append(product_id)
+
+        categories = {}
+        for promotion_id, category_id in (
+            PromotionCategory.objects
+            .filter(promotion_id__in=promotion_ids)
+            .values_list('promotion_id', 'category_id')
+        ):
+            categories.setdefault(promotion_id, []).append(category_id)
+
+        return cls([
+            CompiledPromotion(promotion, products.get(promotion.id, ()), categories.get(promotion.id, ()))
+            for promotion in promotions
+        ])
+
+    def candidates(self, lines, code=None):
+        """Promotions that could apply to any of the given lines"""
+        found = {promotion.id: promotion for promotion in self.unscoped}
+        for line in lines:
+            for promotion in self.by_product.get(line['product_id'], ()):
+                found[promotion.id] = promotion
+            for promotion in self.by_category.get(line['category_id'], ()):
+                found[promotion.id] = promotion
+        if code:
+            promotion = self.by_code.get(code.strip().lower())
+            if promotion:
+                found[promotion.id] = promotion
+        return found.values()
+
+
+# (version, built_at, PromotionIndex) for this process
+_compiled_index = None
+
+
+def get_promotion_index():
+    """Return this process's compiled index, rebuilding it if it is stale or too old"""
+    global _compiled_index
+
+    version = cache.get(INDEX_VERSION_KEY)
+    if version is None:
+        cache.add(INDEX_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(INDEX_VERSION_KEY)
+
+    now = time.monotonic()
+    compiled = _compiled_index
+    if (
+        compiled is None
+        or compiled[0] != version
+        or now - compiled[1] >= PROMOTION_INDEX_MAX_AGE
+    ):
+        with reading_from(None):
+            compiled = (version, now, PromotionIndex.build())
+        _compiled_index = compiled
+    return compiled[2]
+
+
+def invalidate_promotion_index():
+    """Make every process recompile its index on next use"""
+    transaction.on_commit(lambda: cache.set(INDEX_VERSION_KEY, uuid.uuid4().hex, None))
+
+
+def unit_price(line):
+    """Sale price when it undercuts the list price, plus the variant adjustment"""
+    price = line['price']
+    if line.get('sale_price') is not None and line['sale_price'] < price:
+        price = line['sale_price']
+    return price + (line.get('price_adjustment') or 0)
+
+
+class PricedCart:
+    def __init__(self, lines, subtotal, discount, promotion):
+        self.lines = lines
+        self.subtotal = subtotal
+        self.discount = discount
+        self.promotion = promotion
+
+
+def price_cart(lines, code=None, now=None):
+    """
+    Price a cart in one pass.
+
+    ``lines`` are dicts with ``product_id``, ``category_id``, ``quantity``,
+    ``price``, ``sale_price`` and ``price_adjustment``. Each line gains
+    ``unit_price`` and ``line_total``. The single best promotion is applied,
+    percentage or fixed, to the lines it is scoped to.
+    """
+    now = now or timezone.now()
+    subtotal = Decimal('0.00')
+    for line in lines:
+        line['unit_price'] = unit_price(line)
+        line['line_total'] = line['unit_price'] * line['quantity']
+        subtotal += line['line_total']
+
+    best_discount = Decimal('0.00')
+    best_promotion = None
+    for promotion in get_promotion_index().candidates(lines, code):
+        if not promotion.is_running(now) or subtotal < promotion.minimum_order_value:
+            continue
+        eligible = sum(
+            (line['line_total'] for line in lines if promotion.applies_to(line)),
+            Decimal('0.00')
+        )
+        discount = promotion.discount_for(eligible)
+        if discount > best_discount:
+            best_discount = discount
+            best_promotion = promotion
+
+    return PricedCart(lines, subtotal, best_discount, best_promotion)
+
+
+def redeem_promotion(promotion):
+    """
+    Count one use of a promotion. Returns False if its usage limit was
+    reached in the meantime.
+    """
+    redeemed = (
+        Promotion.objects
+        .filter(pk=promotion.id)
+        .filter(Q(usage_limit=0) | Q(used_count__lt=F('usage_limit')))
+        .update(used_count=F('used_count') + 1)
+    )
+    if promotion.usage_limit:
+        # update() skips signals, so drop the index to re-check the limit
+        invalidate_promotion_index()
+    return bool(redeemed)
@@ -0,0 +1,150 @@
+"""
+Related products index.
+
+Each product stores the ids of its best related products in
+``Product.related_product_ids``. Candidates are scored by how many orders
+bought them together, then by sharing the category and material, with
+ties going to the better seller. The detail page only reads those ids.
+"""
+import random
+
+from django.db.models import Count, F, Q
+
+from .models import OrderItem, Product
+from .pagecache import invalidate_tags, product_tag
+
+
+# Ids stored per product and shown on the detail page
+RELATED_INDEX_SIZE = 12
+RELATED_DISPLAY_COUNT = 4
+
+CO_PURCHASE_WEIGHT = 3
+CATEGORY_WEIGHT = 2
+MATERIAL_WEIGHT = 1
+
+UPDATE_BATCH_SIZE = 500
+
+
+def co_purchase_counts(product_ids=None):
+    """``{product_id: {other_id: orders}}`` from one grouped self-join"""
+    pairs = OrderItem.objects.all()
+    if product_ids is not None:
+        pairs = pairs.filter(product_id__in=product_ids)
+    rows = (
+        pairs
+        .values('product_id', other_id=F('order__items__product_id'))
+        .annotate(orders=Count('order_id', distinct=True))
+        .order_by()
+    )
+    counts = {}
+    for row in rows:
+        # The join also pairs every item with itself
+        if row['other_id'] == row['product_id']:
+            continue
+        counts.setdefault(row['product_id'], {})[row['other_id']] = row['orders']
+    return counts
+
+
+def rank_related(product, candidates, by_category, by_material, by_both, co_purchases):
+    """Ids of the best related products for one product row"""
+    pk, category_id, material_id = product['id'], product['category_id'], product['material_id']
+
+    def attribute_score(other_id):
+        other = candidates[other_id]
+        score = CATEGORY_WEIGHT if other['category_id'] == category_id else 0
+        return score + (MATERIAL_WEIGHT if other['material_id'] == material_id else 0)
+
+    scores = {}
+    for other_id, orders in co_purchases.get(pk, {}).items():
+        if other_id in candidates:
+            scores[other_id] = CO_PURCHASE_WEIGHT * orders + attribute_score(other_id)
+
+    # The groups are sorted by popularity, so their heads are enough to fill the index
+    for group in (
+        by_both.get((category_id, material_id), ()),
+        by_category.get(category_id, ()),
+        by_material.get(material_id, ()),
+    ):
+        for other_id in group[:RELATED_INDEX_SIZE + 1]:
+            if other_id != pk and other_id not in scores:
+                scores[other_id] = attribute_score(other_id)
+
+    ranked = sorted(scores, key=lambda other_id: (-scores[other_id], -candidates[other_id]['units_sold']))
+    return ranked[:RELATED_INDEX_SIZE]
+
+
+def compute_related(product_ids=None):
+    """``{product_id: [related ids]}`` for the given products, or all of them"""
+    fields = ('id', 'category_id', 'material_id', 'units_sold')
+    products = Product.objects.values(*fields)
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+    products = list(products)
+    if not products:
+        return {}
+
+    candidates_qs = Product.objects.filter(is_active=True).values(*fields).order_by('-units_sold', 'pk')
+    if product_ids is not None:
+        candidates_qs = candidates_qs.filter(
+            Q(category_id__in={p['category_id'] for p in products})
+            | Q(material_id__in={p['material_id'] for p in products})
+            | Q(pk__in=OrderItem.objects.filter(order__items__product_id__in=product_ids).values('product_id'))
+        )
+    candidates = {}
+    by_category, by_material, by_both = {}, {}, {}
+    for row in candidates_qs:
+        candidates[row['id']] = row
+        by_category.setdefault(row['category_id'], []).append(row['id'])
+        by_material.setdefault(row['material_id'], []).append(row['id'])
+        by_both.setdefault((row['category_id'], row['material_id']), []).append(row['id'])
+
+    co_purchases = co_purchase_counts(product_ids)
+    return {
+        product['id']: rank_related(product, candidates, by_category, by_material, by_both, co_purchases)
+        for product in products
+    }
+
+
+def store_related(related):
+    """Save computed lists, writing only the products whose list changed"""
+    current = dict(
+        Product.objects.filter(pk__in=related).values_list('pk', 'related_product_ids')
+    )
+    changed = [
+        Product(pk=pk, related_product_ids=ids)
+        for pk, ids in related.items()
+        if current.get(pk) != ids
+    ]
+    Product.objects.bulk_update(changed, ['related_product_ids'], batch_size=UPDATE_BATCH_SIZE)
+    # Cached detail pages embed the related products
+    invalidate_tags(*(product_tag(product.pk) for product in changed))
+    return len(changed)
+
+
+def refresh_related_products(product_ids):
+    """Recompute the index for a few products, e.g. after they were edited"""
+    return store_related(compute_related(list(product_ids)))
+
+
+def rebuild_related_products():
+    """Recompute the index for every product"""
+    return store_related(compute_related())
+
+
+def related_products_for(product, count=RELATED_DISPLAY_COUNT):
+    """
+    A rotating pick of ``count`` products from the stored index. Before the
+    index is built, falls back to the best sellers in the same category.
+    """
+    ids = product.related_product_ids
+    if not ids:
+        return list(
+            Product.objects
+            .with_primary_image()
+            .filter(category_id=product.category_id, is_active=True)
+            .exclude(pk=product.pk)
+            .order_by('-units_sold')[:count]
+        )
+    picked = random.sample(ids, min(count, len(ids)))
+    products = {related.pk: related for related in Product.objects.with_primary_image().filter(pk__in=picked, is_active=True)}
+    return [products[pk] for pk in picked if pk in products]
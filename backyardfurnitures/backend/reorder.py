@@ -0,0 +1,132 @@
+"""
+Reorder suggestions.
+
+``generate_purchase_suggestions`` streams every inventory row of the
+active warehouses and proposes a draft purchase for rows that will run
+out before a new delivery could arrive. Demand comes from recent order
+lines, delivery time from the product's supplier lead time. Only per
+product summaries are held in memory; inventory rows are read and
+suggestions written in fixed size chunks.
+"""
+import math
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from .models import Inventory, OrderItem, ProductSupplier, PurchaseSuggestion
+
+
+# Days of order history used to measure sales velocity
+SALES_WINDOW_DAYS = 30
+# Orders that do not count as demand
+EXCLUDED_ORDER_STATUSES = ('cancelled', 'returned')
+# Stock a delivery should cover after it arrives, on top of the lead time
+COVERAGE_DAYS = 14
+# Lead time assumed for products without a supplier
+DEFAULT_LEAD_TIME_DAYS = 7
+
+CHUNK_SIZE = 2000
+
+INVENTORY_FIELDS = ('id', 'product_id', 'warehouse_id', 'available_quantity', 'reorder_point')
+
+
+def daily_sales(since, days):
+    """``{product_id: units per day}`` over the window, from one grouped query"""
+    rows = (
+        OrderItem.objects
+        .filter(order__created_at__gte=since)
+        .exclude(order__status__in=EXCLUDED_ORDER_STATUSES)
+        .values('product_id')
+        .annotate(units=Sum('quantity'))
+        .order_by()
+    )
+    return {row['product_id']: Decimal(row['units']) / days for row in rows}
+
+
+def warehouse_counts():
+    """Active warehouses stocking each product, to split its demand between them"""
+    rows = (
+        Inventory.objects
+        .filter(warehouse__is_active=True)
+        .values('product_id')
+        .annotate(warehouses=Count('id'))
+        .order_by()
+    )
+    return {row['product_id']: row['warehouses'] for row in rows}
+
+
+def preferred_suppliers():
+    """``{product_id: (supplier_id, cost, lead_time_days)}``, primary supplier first, then fastest"""
+    suppliers = {}
+    rows = (
+        ProductSupplier.objects
+        .filter(supplier__is_active=True)
+        .order_by('product_id', '-is_primary', 'lead_time_days', 'cost')
+        .values_list('product_id', 'supplier_id', 'cost', 'lead_time_days')
+    )
+    for product_id, supplier_id, cost, lead_time_days in rows.iterator(chunk_size=CHUNK_SIZE):
+        suppliers.setdefault(product_id, (supplier_id, cost, lead_time_days))
+    return suppliers
+
+
+def reorder_quantity(row, daily, lead_time_days):
+    """
+    Units to order for an inventory row, or 0. A row is reordered once its
+    stock will not last through the lead time or it reached its reorder
+    point; the order brings it back to the reorder point plus enough to
+    cover the lead time and ``COVERAGE_DAYS`` of sales.
+    """
+    lead_time_demand = daily * lead_time_days
+    available = row['available_quantity']
+    if available > max(lead_time_demand, row['reorder_point']):
+        return 0
+    target = row['reorder_point'] + daily * (lead_time_days + COVERAGE_DAYS)
+    return max(math.ceil(target - available), 0)
+
+
+def generate_purchase_suggestions(window_days=SALES_WINDOW_DAYS, chunk_size=CHUNK_SIZE, now=None):
+    """Replace all draft suggestions with fresh ones; returns how many were written"""
+    now = now or timezone.now()
+    velocity = daily_sales(now - timedelta(days=window_days), window_days)
+    warehouses = warehouse_counts()
+    suppliers = preferred_suppliers()
+
+    rows = (
+        Inventory.objects
+        .filter(warehouse__is_active=True)
+        .order_by()
+        .values(*INVENTORY_FIELDS)
+        .iterator(chunk_size=chunk_size)
+    )
+
+    created = 0
+    with transaction.atomic():
+        PurchaseSuggestion.objects.filter(status='draft').delete()
+        batch = []
+        for row in rows:
+            product_id = row['product_id']
+            daily = velocity.get(product_id, Decimal(0)) / warehouses.get(product_id, 1)
+            supplier_id, cost, lead_time_days = suppliers.get(product_id, (None, None, DEFAULT_LEAD_TIME_DAYS))
+            quantity = reorder_quantity(row, daily, lead_time_days)
+            if not quantity:
+                continue
+            batch.append(PurchaseSuggestion(
+                inventory_id=row['id'],
+                product_id=product_id,
+                warehouse_id=row['warehouse_id'],
+                supplier_id=supplier_id,
+                quantity=quantity,
+                unit_cost=cost,
+                lead_time_days=lead_time_days,
+                daily_sales=daily.quantize(Decimal('0.001')),
+            ))
+            if len(batch) >= chunk_size:
+                PurchaseSuggestion.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        PurchaseSuggestion.objects.bulk_create(batch)
+        created += len(batch)
+    return created
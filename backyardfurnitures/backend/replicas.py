@@ -0,0 +1,150 @@
+"""
+Read replicas.
+
+Views marked with ``@replica_reads`` (the storefront and reporting pages)
+read the shop's models from one of the ``DATABASE_REPLICAS`` aliases,
+picked once per request; everything else, every write, and any read
+inside a transaction on ``default`` goes to the primary.
+
+A visitor who has just changed something (added to their cart, checked
+out, any successful POST) gets a short-lived cookie that keeps their
+reads on the primary for ``REPLICA_PIN_SECONDS``, so they see their own
+writes even while the replicas lag behind.
+
+Anything that outlives the request is loaded from the primary with
+``reading_from(None)``: cached pages, dashboard metrics and counters,
+availability, facet counts, the category tree and the promotion index. A
+replica that lags behind a change would otherwise refill the cache entry
+the change just invalidated, and the stale copy would be served until it
+expires. Replicas serve the reads that are not cached, e.g. pages for
+signed-in customers.
+
+Locally, SQLite copies of the database stand in for replicas: list them
+in ``SQLITE_REPLICAS`` and refresh them with ``sync_sqlite_replicas``.
+"""
+import random
+import sqlite3
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+PIN_COOKIE = 'db_pin'
+
+# Only these apps are read from replicas; sessions and auth stay on the primary
+REPLICA_APP_LABELS = ('backend',)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Replica alias for the current request, None to read from the primary
+_read_alias = ContextVar('replica_read_alias', default=None)
+
+
+def replica_aliases():
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+def pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 15)
+
+
+def replica_reads(view):
+    """Allow a view to read from a replica; use ``method_decorator`` on ``dispatch`` for class-based views"""
+    view.replica_reads = True
+    return view
+
+
+@contextmanager
+def reading_from(alias):
+    """Route reads inside the block to ``alias``; None reads from the primary, e.g. for cache fills"""
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+class ReplicaRouter:
+    """Reads of marked requests go to their replica; all writes go to the primary"""
+
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        if (
+            alias is None
+            or model._meta.app_label not in REPLICA_APP_LABELS
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            # Explicit, so objects loaded from a replica don't pull related reads there
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        # Instances remember the replica they came from; never write there
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        aliases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Replicas get their schema from the primary
+        if db in replica_aliases():
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Send reads of ``@replica_reads`` views to a replica unless the visitor is pinned to the primary"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _read_alias.set(None)
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+
+        # Read-your-writes: keep this browser on the primary until the replicas catch up
+        if request.method not in SAFE_METHODS and response.status_code < 400 and replica_aliases():
+            response.set_cookie(
+                PIN_COOKIE, str(int(time.time())), max_age=pin_seconds(), httponly=True, samesite='Lax'
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        aliases = replica_aliases()
+        if (
+            aliases
+            and getattr(view_func, 'replica_reads', False)
+            and request.method in SAFE_METHODS
+            and PIN_COOKIE not in request.COOKIES
+        ):
+            _read_alias.set(random.choice(aliases))
+
+
+# Local SQLite replicas
+
+def sync_sqlite_replicas():
+    """Copy the primary SQLite database over each replica file; returns the aliases copied"""
+    primary = connections[DEFAULT_DB_ALIAS]
+    primary.ensure_connection()
+    copied = []
+    for alias in replica_aliases():
+        replica = connections[alias]
+        replica.close()
+        # The backup API takes a consistent snapshot even while the primary is being written
+        target = sqlite3.connect(replica.settings_dict['NAME'])
+        try:
+            primary.connection.backup(target)
+        finally:
+            target.close()
+        copied.append(alias)
+    return copied
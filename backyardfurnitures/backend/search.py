@@ -0,0 +1,184 @@
+"""
+Product search backends.
+
+The active backend is chosen with the ``PRODUCT_SEARCH_BACKEND`` setting and
+is kept in sync with Product saves and deletes by ``backend.signals``.
+"""
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+
+DEFAULT_SEARCH_BACKEND = 'backend.search.SQLiteFTSBackend'
+
+# Matches ranked by relevance; any further matches sort after them
+SEARCH_RESULT_LIMIT = 500
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query):
+    """Split a free text query into lowercase search terms"""
+    return [token.lower() for token in TOKEN_RE.findall(query or '')]
+
+
+class BaseSearchBackend:
+    """Interface every product search backend has to implement"""
+
+    def index_products(self, products):
+        """Add or refresh the given products in the index"""
+        raise NotImplementedError
+
+    def remove_products(self, product_ids):
+        """Drop the given product ids from the index"""
+        raise NotImplementedError
+
+    def rebuild(self):
+        """Re-index the whole catalog"""
+        raise NotImplementedError
+
+    def search(self, query, limit=SEARCH_RESULT_LIMIT):
+        """Return matching product ids, best match first"""
+        raise NotImplementedError
+
+    def filter(self, queryset, query):
+        """Restrict a Product queryset to every match, in the database"""
+        raise NotImplementedError
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """Plain LIKE based search, usable on any database"""
+
+    def index_products(self, products):
+        pass
+
+    def remove_products(self, product_ids):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def condition(self, terms):
+        condition = Q()
+        for term in terms:
+            condition &= (
+                Q(name__icontains=term) |
+                Q(description__icontains=term) |
+                Q(sku__icontains=term)
+            )
+        return condition
+
+    def search(self, query, limit=SEARCH_RESULT_LIMIT):
+        from .models import Product
+
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        # Name matches rank above description-only matches
+        name_match = Q()
+        for term in terms:
+            name_match &= Q(name__icontains=term) | Q(sku__icontains=term)
+
+        return list(
+            Product.objects
+            .filter(self.condition(terms))
+            .annotate(name_rank=Case(When(name_match, then=Value(0)), default=Value(1)))
+            .order_by('name_rank', 'name')
+            .values_list('id', flat=True)[:limit]
+        )
+
+    def filter(self, queryset, query):
+        terms = tokenize(query)
+        if not terms:
+            return queryset.none()
+        return queryset.filter(self.condition(terms))
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """SQLite FTS5 index keyed on the product id"""
+
+    table = 'backend_product_fts'
+
+    # bm25 column weights for name, sku and description
+    weights = (10.0, 8.0, 1.0)
+
+    def index_products(self, products):
+        rows = [(p.pk, p.name, p.sku, p.description) for p in products]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(row[0],) for row in rows])
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, name, sku, description) VALUES (%s, %s, %s, %s)',
+                rows
+            )
+
+    def remove_products(self, product_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(pk,) for pk in product_ids])
+
+    def rebuild(self):
+        from .models import Product
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, name, sku, description) '
+                f'SELECT id, name, sku, description FROM {Product._meta.db_table}'
+            )
+
+    def build_match(self, query):
+        """Turn user input into an FTS5 expression of quoted prefix terms"""
+        return ' '.join(f'"{term}"*' for term in tokenize(query))
+
+    def search(self, query, limit=SEARCH_RESULT_LIMIT):
+        match = self.build_match(query)
+        if not match:
+            return []
+        weights = ', '.join(str(w) for w in self.weights)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s '
+                f'ORDER BY bm25({self.table}, {weights}) LIMIT %s',
+                [match, limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def filter(self, queryset, query):
+        match = self.build_match(query)
+        if not match:
+            return queryset.none()
+        return queryset.filter(pk__in=RawSQL(f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s', [match]))
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    path = getattr(settings, 'PRODUCT_SEARCH_BACKEND', DEFAULT_SEARCH_BACKEND)
+    return import_string(path)()
+
+
+def search_products(queryset, query):
+    """Restrict a Product queryset to every search match"""
+    return get_search_backend().filter(queryset, query)
+
+
+def rank_search_results(queryset, query):
+    """
+    Annotate ``search_rank`` for ordering by relevance. The best
+    SEARCH_RESULT_LIMIT matches get their position; the rest share the
+    next rank, so order by a tiebreaker after it.
+    """
+    product_ids = get_search_backend().search(query, SEARCH_RESULT_LIMIT)
+    return queryset.annotate(
+        search_rank=Case(
+            *[When(pk=pk, then=Value(rank)) for rank, pk in enumerate(product_ids)],
+            default=Value(len(product_ids)),
+            output_field=IntegerField(),
+        )
+    )
@@ -0,0 +1,185 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import dashboard
+from .availability import invalidate_availability
+from .categories import detach_subtree, invalidate_category_tree
+from .images import needs_derivatives, schedule_derivatives
+from .models import (
+    Category, Inventory, Material, Order, OrderItem, Product, ProductImage,
+    ProductReview, ProductVariant, Promotion, PromotionCategory, PromotionProduct, ReviewImage
+)
+from .pagecache import (
+    CATALOG_TAG, CATEGORIES_TAG, MATERIALS_TAG, PROMOTIONS_TAG,
+    category_tag, invalidate_tags, product_tag, promotion_tag
+)
+from .pricing import invalidate_promotion_index
+from .related import refresh_related_products
+from .search import get_search_backend
+from .stats import (
+    add_units_sold, affected_product_ids, primary_image_saved, refresh_primary_image, refresh_product_rating,
+    refresh_units_sold, remember_product
+)
+
+
+# Search index
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    get_search_backend().index_products([instance])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    get_search_backend().remove_products([instance.pk])
+
+
+# Category tree
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, **kwargs):
+    invalidate_category_tree()
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    detach_subtree(instance.path)
+    invalidate_category_tree()
+
+
+# Image derivatives
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_save, sender=ReviewImage)
+def image_saved(sender, instance, **kwargs):
+    if needs_derivatives(instance):
+        schedule_derivatives(instance)
+
+
+# Related products index
+@receiver(post_save, sender=Product)
+def update_related_products(sender, instance, **kwargs):
+    refresh_related_products([instance.pk])
+
+
+# Product aggregates
+@receiver(pre_save, sender=ProductReview)
+@receiver(pre_save, sender=OrderItem)
+def remember_previous_product(sender, instance, **kwargs):
+    remember_product(instance)
+
+
+@receiver(post_save, sender=ProductReview)
+@receiver(post_delete, sender=ProductReview)
+def update_product_rating(sender, instance, **kwargs):
+    for product_id in affected_product_ids(instance):
+        refresh_product_rating(product_id)
+
+
+@receiver(post_save, sender=ProductImage)
+def update_primary_image(sender, instance, **kwargs):
+    # Also true for derivative saves of the primary image
+    if primary_image_saved(instance):
+        dashboard.product_image_changed()
+
+
+@receiver(post_delete, sender=ProductImage)
+def replace_primary_image(sender, instance, **kwargs):
+    image_id, repointed = refresh_primary_image(instance.product_id)
+    # Deleting the primary image nulls primary_image before this runs, so
+    # losing the last image leaves nothing for refresh_primary_image to repoint
+    if repointed or image_id is None:
+        dashboard.product_image_changed()
+
+
+@receiver(post_save, sender=OrderItem)
+def update_units_sold(sender, instance, created, **kwargs):
+    if created:
+        add_units_sold({instance.product_id: instance.quantity})
+    else:
+        for product_id in affected_product_ids(instance):
+            refresh_units_sold(product_id)
+
+
+@receiver(post_delete, sender=OrderItem)
+def remove_units_sold(sender, instance, **kwargs):
+    add_units_sold({instance.product_id: -instance.quantity})
+
+
+# Dashboard metrics
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, created, **kwargs):
+    dashboard.product_saved(instance, created)
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    dashboard.product_deleted(instance)
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, created, **kwargs):
+    dashboard.order_saved(instance, created)
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    dashboard.order_deleted(instance)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    dashboard.user_saved(instance, update_fields)
+
+
+@receiver(post_save, sender=Inventory)
+@receiver(post_delete, sender=Inventory)
+def inventory_changed(sender, instance, **kwargs):
+    dashboard.invalidate_low_stock()
+    invalidate_availability([instance.product_id])
+
+
+# Promotion index
+@receiver(post_save, sender=Promotion)
+@receiver(post_delete, sender=Promotion)
+@receiver(post_save, sender=PromotionCategory)
+@receiver(post_delete, sender=PromotionCategory)
+@receiver(post_save, sender=PromotionProduct)
+@receiver(post_delete, sender=PromotionProduct)
+def promotion_changed(sender, **kwargs):
+    invalidate_promotion_index()
+
+
+# Storefront page cache
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def evict_product_pages(sender, instance, **kwargs):
+    invalidate_tags(product_tag(instance.pk), category_tag(instance.category_id), CATALOG_TAG)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+@receiver(post_save, sender=ProductReview)
+@receiver(post_delete, sender=ProductReview)
+def evict_product_detail_pages(sender, instance, **kwargs):
+    invalidate_tags(*(product_tag(product_id) for product_id in affected_product_ids(instance)))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def evict_category_pages(sender, instance, **kwargs):
+    invalidate_tags(category_tag(instance.pk), CATEGORIES_TAG)
+
+
+@receiver(post_save, sender=Material)
+@receiver(post_delete, sender=Material)
+def evict_material_pages(sender, instance, **kwargs):
+    invalidate_tags(MATERIALS_TAG)
+
+
+@receiver(post_save, sender=Promotion)
+@receiver(post_delete, sender=Promotion)
+def evict_promotion_pages(sender, instance, **kwargs):
+    invalidate_tags(promotion_tag(instance.pk), PROMOTIONS_TAG)
@@ -0,0 +1,262 @@
+"""
+Versioned, precompressed static files.
+
+``collectstatic`` with ``CompressedManifestStaticFilesStorage`` writes
+every file under a content-hashed name (``css/style.3f2a9c1e07b4.css``)
+plus a gzip sibling, and a brotli one when the ``brotli`` package is
+installed. ``StaticFilesWSGIHandler`` and ``StaticFilesASGIHandler`` wrap
+the Django application and answer ``STATIC_URL`` requests straight from
+``STATIC_ROOT``: hashed names are cached by browsers for a year, and the
+smallest encoding the client accepts is sent without compressing anything
+per request.
+"""
+import gzip
+import json
+import mimetypes
+import os
+from email.utils import formatdate
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.mjs', '.map', '.svg', '.json', '.txt', '.html', '.xml', '.ico')
+# Skip writing an encoding that saves less than this fraction of the file
+MIN_COMPRESSION_SAVING = 0.05
+
+# (Accept-Encoding token, file suffix), best first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Unhashed names can change on the next deploy
+DEFAULT_CACHE_CONTROL = 'public, max-age=60'
+
+CHUNK_SIZE = 64 * 1024
+
+
+# Build step
+
+def compress(content):
+    """``{suffix: bytes}`` for every encoding that makes the file meaningfully smaller"""
+    variants = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(content)
+    limit = len(content) * (1 - MIN_COMPRESSION_SAVING)
+    return {suffix: data for suffix, data in variants.items() if len(data) < limit}
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Manifest storage that also writes ``.gz`` and ``.br`` siblings of text files"""
+
+    # Only the final hashed names are referenced, not the intermediate passes
+    keep_intermediate_files = False
+
+    def stored_name(self, name):
+        # Until collectstatic has written a manifest (development, tests) use the plain names
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        for name in list(paths) + list(self.hashed_files.values()):
+            if name.endswith(COMPRESSIBLE_EXTENSIONS) and self.exists(name):
+                self.write_compressed(name)
+
+    def write_compressed(self, name):
+        with self.open(name) as original:
+            content = original.read()
+        for suffix, data in compress(content).items():
+            if self.exists(name + suffix):
+                self.delete(name + suffix)
+            self._save(name + suffix, ContentFile(data))
+
+
+# Serving
+
+def parse_accept_encoding(header):
+    """``{coding: q}`` from an Accept-Encoding header; malformed q-values count as 0"""
+    accepted = {}
+    for item in (header or '').lower().split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+class StaticFile:
+    """Headers and on-disk path of one static file and each of its encodings"""
+
+    def __init__(self, path, url_name, immutable):
+        stat = os.stat(path)
+        content_type, charset = mimetypes.guess_type(url_name)[0] or 'application/octet-stream', ''
+        if content_type.startswith('text/') or content_type in ('application/javascript', 'application/json'):
+            charset = '; charset=utf-8'
+        # Weak, since the encoded variants share it
+        self.etag = f'W/"{stat.st_size:x}-{int(stat.st_mtime):x}"'
+        headers = [
+            ('Content-Type', content_type + charset),
+            ('Last-Modified', formatdate(stat.st_mtime, usegmt=True)),
+            ('ETag', self.etag),
+            ('Cache-Control', IMMUTABLE_CACHE_CONTROL if immutable else DEFAULT_CACHE_CONTROL),
+        ]
+        self.encodings = []
+        for encoding, suffix in ENCODINGS:
+            if os.path.isfile(path + suffix):
+                self.encodings.append((encoding, path + suffix, os.path.getsize(path + suffix)))
+        if self.encodings:
+            headers.append(('Vary', 'Accept-Encoding'))
+        self.headers = headers
+        self.path = path
+        self.size = stat.st_size
+
+    def select(self, accept_encoding):
+        """
+        ``(path, headers)`` of the variant the client prefers by q-value, the
+        smallest on ties; ``*`` covers codings not listed and q=0 refuses one.
+        """
+        accepted = parse_accept_encoding(accept_encoding)
+        candidates = [
+            (accepted.get(encoding, accepted.get('*', 0)), encoding, path, size)
+            for encoding, path, size in self.encodings
+        ]
+        # sorted() is stable, so ENCODINGS order breaks ties
+        for q, encoding, path, size in sorted(candidates, key=lambda candidate: -candidate[0]):
+            if q > 0:
+                return path, self.headers + [('Content-Encoding', encoding), ('Content-Length', str(size))]
+        return self.path, self.headers + [('Content-Length', str(self.size))]
+
+
+class StaticFileIndex:
+    """Every file under ``root`` keyed by URL path, scanned once"""
+
+    def __init__(self, root=None, url=None):
+        self.root = root or settings.STATIC_ROOT
+        self.url = url or settings.STATIC_URL
+        self.files = self.scan() if self.root and os.path.isdir(self.root) else {}
+
+    def hashed_names(self):
+        manifest = os.path.join(self.root, ManifestStaticFilesStorage.manifest_name)
+        if not os.path.isfile(manifest):
+            return set()
+        with open(manifest) as f:
+            return set(json.load(f)['paths'].values())
+
+    def scan(self):
+        hashed = self.hashed_names()
+        suffixes = tuple(suffix for encoding, suffix in ENCODINGS)
+        files = {}
+        for directory, subdirectories, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, self.root).replace(os.sep, '/')
+                if name.endswith(suffixes) and os.path.isfile(path[:path.rindex('.')]):
+                    continue
+                files[self.url + name] = StaticFile(path, name, name in hashed)
+        return files
+
+    def find(self, method, path):
+        if method not in ('GET', 'HEAD') or not path.startswith(self.url):
+            return None
+        return self.files.get(path)
+
+
+def response_for(static_file, accept_encoding, if_none_match):
+    """``(status, headers, path or None)`` for a request of ``static_file``"""
+    if if_none_match and static_file.etag in if_none_match:
+        return 304, [(key, value) for key, value in static_file.headers if key != 'Content-Type'], None
+    path, headers = static_file.select(accept_encoding)
+    return 200, headers, path
+
+
+class StaticFilesWSGIHandler:
+    """WSGI middleware answering static file requests before they reach Django"""
+
+    def __init__(self, application, root=None, url=None):
+        self.application = application
+        self.index = StaticFileIndex(root, url)
+
+    def __call__(self, environ, start_response):
+        static_file = self.index.find(environ['REQUEST_METHOD'], environ.get('PATH_INFO', ''))
+        if static_file is None:
+            return self.application(environ, start_response)
+
+        status, headers, path = response_for(
+            static_file, environ.get('HTTP_ACCEPT_ENCODING'), environ.get('HTTP_IF_NONE_MATCH')
+        )
+        start_response('200 OK' if status == 200 else '304 Not Modified', headers)
+        if path is None or environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+        file_wrapper = environ.get('wsgi.file_wrapper', FileIterator)
+        return file_wrapper(open(path, 'rb'), CHUNK_SIZE)
+
+
+class FileIterator:
+    """Fallback for servers without ``wsgi.file_wrapper``"""
+
+    def __init__(self, file, block_size):
+        self.file = file
+        self.block_size = block_size
+
+    def __iter__(self):
+        return iter(lambda: self.file.read(self.block_size), b'')
+
+    def close(self):
+        self.file.close()
+
+
+class StaticFilesASGIHandler:
+    """ASGI middleware answering static file requests before they reach Django"""
+
+    def __init__(self, application, root=None, url=None):
+        self.application = application
+        self.index = StaticFileIndex(root, url)
+
+    async def __call__(self, scope, receive, send):
+        static_file = None
+        if scope['type'] == 'http':
+            static_file = self.index.find(scope['method'], scope['path'])
+        if static_file is None:
+            return await self.application(scope, receive, send)
+
+        request_headers = {key.decode('latin-1'): value.decode('latin-1') for key, value in scope['headers']}
+        status, headers, path = response_for(
+            static_file, request_headers.get('accept-encoding'), request_headers.get('if-none-match')
+        )
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(key.lower().encode('latin-1'), value.encode('latin-1')) for key, value in headers],
+        })
+        if path is None or scope['method'] == 'HEAD':
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+
+        file = await sync_to_async(open, thread_sensitive=False)(path, 'rb')
+        try:
+            while True:
+                chunk = await sync_to_async(file.read, thread_sensitive=False)(CHUNK_SIZE)
+                more = len(chunk) == CHUNK_SIZE
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': more})
+                if not more:
+                    break
+        finally:
+            file.close()
@@ -0,0 +1,114 @@
+"""
+Denormalized product aggregates.
+
+``Product.rating_average``, ``review_count`` and ``units_sold`` are kept up
+to date from review and order item writes so listings can sort on plain
+columns instead of grouping over ProductReview and OrderItem.
+``Product.primary_image`` likewise points at the image product cards show,
+so listings join it instead of querying ``product.images``.
+"""
+from decimal import Decimal
+
+from django.db.models import Avg, Case, Count, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import OrderItem, Product, ProductImage, ProductReview
+
+
+RATING_PRECISION = Decimal('0.01')
+
+
+def remember_product(instance):
+    """Snapshot the stored ``product_id`` of a review or order item before it is saved"""
+    instance._previous_product_id = None
+    if not instance._state.adding and instance.pk is not None:
+        instance._previous_product_id = (
+            type(instance).objects.filter(pk=instance.pk).values_list('product_id', flat=True).first()
+        )
+
+
+def affected_product_ids(instance):
+    """The instance's product, plus the one it was moved away from by this save"""
+    previous = getattr(instance, '_previous_product_id', None)
+    return {instance.product_id, previous} - {None}
+
+
+def refresh_product_rating(product_id):
+    """Recompute rating average and review count for one product"""
+    summary = ProductReview.objects.filter(product_id=product_id).aggregate(
+        average=Avg('rating'),
+        count=Count('id'),
+    )
+    average = Decimal(summary['average'] or 0).quantize(RATING_PRECISION)
+    Product.objects.filter(pk=product_id).update(
+        rating_average=average,
+        review_count=summary['count'],
+    )
+
+
+def add_units_sold(quantities):
+    """Increment ``units_sold`` by a ``{product_id: quantity}`` mapping in one UPDATE"""
+    quantities = {pk: qty for pk, qty in quantities.items() if qty}
+    if not quantities:
+        return
+    delta = Case(
+        *[When(pk=pk, then=Value(qty)) for pk, qty in quantities.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    Product.objects.filter(pk__in=quantities).update(units_sold=F('units_sold') + delta)
+
+
+def refresh_units_sold(product_id):
+    """Recompute ``units_sold`` for one product from its order items"""
+    total = OrderItem.objects.filter(product_id=product_id).aggregate(total=Sum('quantity'))['total']
+    Product.objects.filter(pk=product_id).update(units_sold=total or 0)
+
+
+def primary_images(product_id=None):
+    """Images ordered as cards pick them: the one flagged primary, else the first by display order"""
+    images = ProductImage.objects.order_by('-is_primary', 'display_order', 'pk')
+    if product_id is None:
+        return images.filter(product=OuterRef('pk'))
+    return images.filter(product_id=product_id)
+
+
+def primary_image_saved(image):
+    """
+    Keep one primary image per product, as ProductImageFormSet requires, and
+    repoint the product. Returns whether the product's card image changed,
+    i.e. it was repointed or the saved image is its primary one.
+    """
+    if image.is_primary:
+        ProductImage.objects.filter(product_id=image.product_id, is_primary=True).exclude(pk=image.pk).update(
+            is_primary=False
+        )
+    image_id, repointed = refresh_primary_image(image.product_id)
+    return repointed or image_id == image.pk
+
+
+def refresh_primary_image(product_id):
+    """
+    Repoint ``primary_image`` for one product; ``updated_at`` moves only when
+    it changes. Returns the primary image id and whether it was repointed.
+    """
+    image_id = primary_images(product_id).values_list('pk', flat=True).first()
+    products = Product.objects.filter(pk=product_id)
+    if image_id is None:
+        products = products.filter(primary_image__isnull=False)
+    else:
+        products = products.exclude(primary_image=image_id)
+    return image_id, bool(products.update(primary_image=image_id, updated_at=timezone.now()))
+
+
+def rebuild_product_stats():
+    """Recompute every product's aggregates with a single UPDATE"""
+    reviews = ProductReview.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    sales = OrderItem.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    return Product.objects.update(
+        rating_average=Coalesce(Subquery(reviews.annotate(value=Avg('rating')).values('value')), Value(0.0)),
+        review_count=Coalesce(Subquery(reviews.annotate(value=Count('id')).values('value')), Value(0)),
+        units_sold=Coalesce(Subquery(sales.annotate(value=Sum('quantity')).values('value')), Value(0)),
+        primary_image=Subquery(primary_images().values('pk')[:1]),
+    )
@@ -0,0 +1,70 @@
+"""
+Versioned template fragment cache.
+
+    {% load fragments %}
+    {% versioned_cache 'product_row' product product.category %}
+        ...
+    {% endversioned_cache %}
+
+The key is built from the fragment name and each object's model, primary
+key and ``updated_at``. Saving an object changes its key, so stale
+fragments are never served and simply age out of the cache.
+"""
+import hashlib
+
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+
+
+register = template.Library()
+
+FRAGMENT_KEY_PREFIX = 'fragment:'
+
+
+def fragment_version(value):
+    """Version string for a model instance, or the value itself"""
+    meta = getattr(value, '_meta', None)
+    if meta is None:
+        return str(value)
+    updated_at = getattr(value, 'updated_at', None)
+    return f'{meta.label_lower}:{value.pk}:{updated_at.timestamp() if updated_at else ""}'
+
+
+def fragment_key(name, vary_on):
+    digest = hashlib.md5(':'.join(fragment_version(value) for value in vary_on).encode())
+    return f'{FRAGMENT_KEY_PREFIX}{name}:{digest.hexdigest()}'
+
+
+class VersionedCacheNode(template.Node):
+    def __init__(self, nodelist, name, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        timeout = getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 3600)
+        if not timeout:
+            return self.nodelist.render(context)
+
+        key = fragment_key(self.name.resolve(context), [var.resolve(context) for var in self.vary_on])
+        content = cache.get(key)
+        if content is None:
+            content = self.nodelist.render(context)
+            cache.set(key, content, timeout)
+        return content
+
+
+@register.tag('versioned_cache')
+def do_versioned_cache(parser, token):
+    """Cache the enclosed fragment until any of the given objects is saved"""
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' takes a fragment name and at least one object.")
+    nodelist = parser.parse(('endversioned_cache',))
+    parser.delete_first_token()
+    return VersionedCacheNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        [parser.compile_filter(bit) for bit in bits[2:]],
+    )
@@ -0,0 +1,60 @@
+"""
+Responsive images.
+
+    {% load images %}
+    {% responsive_image product_image sizes="(min-width: 992px) 25vw, 50vw" class="card-img-top" %}
+
+renders a ``<picture>`` with a WebP ``srcset`` and a JPEG/PNG fallback
+``srcset`` built from ``image_derivatives`` (see ``backend.images``), so
+the browser fetches the smallest copy wide enough for the layout. Until
+the derivatives exist it falls back to the original upload.
+"""
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+
+register = template.Library()
+
+DEFAULT_SIZES = '100vw'
+# Fallback ``src`` for browsers without srcset support
+DEFAULT_SRC_WIDTH = 640
+
+
+def srcset(names):
+    return ', '.join(f'{default_storage.url(name)} {width}w' for width, name in sorted_widths(names))
+
+
+def sorted_widths(names):
+    return sorted((int(width), name) for width, name in names.items())
+
+
+@register.simple_tag
+def responsive_image(obj, sizes=DEFAULT_SIZES, alt=None, loading='lazy', **attrs):
+    """An ``<img>`` or ``<picture>`` for an object with ``image`` and ``image_derivatives``"""
+    image = getattr(obj, 'image', None)
+    if not image:
+        return ''
+    if alt is None:
+        alt = getattr(obj, 'alt_text', '') or str(obj)
+    extra = format_html_join('', ' {}="{}"', attrs.items())
+
+    derivatives = obj.image_derivatives or {}
+    if derivatives.get('source') != image.name:
+        return format_html('<img src="{}" alt="{}" loading="{}"{}>', image.url, alt, loading, extra)
+
+    formats = dict(derivatives['formats'])
+    webp = formats.pop('image/webp')
+    fallback_type, fallback = formats.popitem()
+    widths = sorted_widths(fallback)
+    src = next((name for width, name in widths if width >= DEFAULT_SRC_WIDTH), widths[-1][1])
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<source type="{}" srcset="{}" sizes="{}">'
+        '<img src="{}" width="{}" height="{}" alt="{}" loading="{}" decoding="async"{}>'
+        '</picture>',
+        srcset(webp), sizes,
+        fallback_type, srcset(fallback), sizes,
+        default_storage.url(src), derivatives['width'], derivatives['height'], alt, loading, extra,
+    )
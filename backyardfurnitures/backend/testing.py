@@ -0,0 +1,34 @@
+"""
+Test helpers for query budgets.
+"""
+from django.test import override_settings
+
+from .middleware import QueryRecorder, get_query_budget
+
+
+class QueryBudgetTestMixin:
+    """
+    Make every request issued by the test client fail with
+    QueryBudgetExceeded when it goes over its URL's budget.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        strict = override_settings(QUERY_BUDGET_STRICT=True)
+        strict.enable()
+        cls.addClassCleanup(strict.disable)
+
+    def assertWithinQueryBudget(self, response):
+        """Check a response's recorded query count against its URL's budget"""
+        url_name = response.resolver_match.url_name
+        budget = get_query_budget(response.resolver_match)
+        count = int(response['X-Query-Count'])
+        if budget is not None:
+            self.assertLessEqual(count, budget, f'{url_name} ran {count} queries, budget is {budget}')
+        self.assertEqual(response['X-Query-Duplicates'], '0', f'{url_name} repeated queries')
+        return count
+
+    def recordQueries(self):
+        """Context manager yielding a QueryRecorder for code outside a request"""
+        return QueryRecorder().record()
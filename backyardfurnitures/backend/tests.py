@@ -1,3 +1,1447 @@
-from django.test import TestCase
+import base64
+import gzip
+import io
+import json
+import re
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections, router
+from django.db.models import F, Q
+from django.http import HttpResponse, QueryDict
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from PIL import Image
+
+from .availability import get_available_quantities
+from .categories import get_category_tree
+from .checkout import place_order
+from .dashboard import get_dashboard_metrics
+from .facets import FacetSelection, get_facet_counts
+from .forms import CategoryForm, ProductImageForm, ProductVariantForm, ReviewImageForm
+from .imports import import_products
+from .inventory import (
+    MOVEMENT_ADD, MOVEMENT_REMOVE, MOVEMENT_SET, InsufficientStock, adjust_stock, allocate, bulk_adjust,
+    reserve_stock
+)
+from .middleware import QueryBudgetExceeded, fingerprint, get_query_budget
+from .models import (
+    Address, Cart, CartItem, Category, Customer, Inventory, Material, Order, OrderItem, Product, ProductImage,
+    ProductReview, ProductSupplier, ProductVariant, Promotion, PromotionCategory, PromotionProduct, PurchaseSuggestion,
+    StockMovement, Supplier, Warehouse
+)
+from .pagecache import add_cache_tags, cache_anonymous_page, product_tag
+from .pagination import KeysetPaginator, paginate
+from .pricing import get_promotion_index, price_cart
+from .related import rebuild_related_products
+from .replicas import PIN_COOKIE, ReplicaRoutingMiddleware, reading_from, replica_reads, sync_sqlite_replicas
+from .reorder import generate_purchase_suggestions
+from .search import get_search_backend, rank_search_results, search_products
+from .stats import rebuild_product_stats
+from .staticfiles import StaticFile, StaticFilesWSGIHandler
+from .testing import QueryBudgetTestMixin
+from .totals import batch_cart_totals, cart_totals
+
+
+def create_catalog(product_count=3):
+    category = Category.objects.create(name='Seating')
+    material = Material.objects.create(name='Teak', weather_resistance_rating=8, maintenance_level='low')
+    address = Address.objects.create(
+        address_line1='1 Yard Lane', city='Nairobi', state='Nairobi', postal_code='00100', country='Kenya'
+    )
+    warehouse = Warehouse.objects.create(name='Main', address=address, phone='1', email='main@example.com')
+    products = []
+    for i in range(product_count):
+        product = Product.objects.create(
+            name=f'Bench {i}', slug=f'bench-{i}', description='Garden bench', category=category,
+            material=material, price=Decimal('100.00'), weight=10, width=120, height=80, depth=50,
+            sku=f'BF-{i}',
+        )
+        Inventory.objects.create(product=product, warehouse=warehouse, quantity=i, reorder_point=5)
+        products.append(product)
+    customer = Customer.objects.create(user=User.objects.create(username='buyer', first_name='Ann'))
+    for product in products:
+        Order.objects.create(
+            customer=customer, shipping_address=address, billing_address=address,
+            shipping_method='standard', shipping_cost=Decimal('10.00'), subtotal=product.price,
+            tax=Decimal('7.00'), total=Decimal('117.00'), payment_method='credit_card',
+        )
+    return products
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Uses the SQLite FTS5 index')
+class SearchTests(TestCase):
+    def setUp(self):
+        self.bench, self.chair, self.table = create_catalog()
+        self.chair.name, self.chair.description = 'Lounge chair', 'Pairs with any teak bench'
+        self.chair.save()
+        self.table.name = 'Dining table'
+        self.table.save()
+        self.bench.name = 'Teak Bench'
+        self.bench.save()
+
+    def search(self, query):
+        return get_search_backend().search(query)
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertEqual(self.search('teak ben'), [self.bench.pk, self.chair.pk])
+        self.assertEqual(self.search('BF-2'), [self.table.pk])
+        ranked = rank_search_results(search_products(Product.objects.all(), 'teak'), 'teak')
+        self.assertEqual(list(ranked.order_by('search_rank')), [self.bench, self.chair])
+
+    def test_filter_keeps_matches_past_the_ranking_limit(self):
+        with mock.patch('backend.search.SEARCH_RESULT_LIMIT', 1):
+            matches = search_products(Product.objects.order_by('pk'), 'bench')
+            self.assertNotIn('CASE', str(matches.query))
+            self.assertEqual(list(matches), [self.bench, self.chair, self.table])
+            ranked = rank_search_results(matches, 'bench').order_by('search_rank', 'name')
+            self.assertEqual([(p, p.search_rank) for p in ranked], [(self.bench, 0), (self.table, 1), (self.chair, 1)])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.bench.name = 'Oak Bench'
+        self.bench.save()
+        self.assertEqual(self.search('teak'), [self.chair.pk])
+        self.chair.delete()
+        self.assertEqual(self.search('teak'), [])
+        self.assertEqual(self.search('oak'), [self.bench.pk])
+
+    def test_fts_syntax_in_queries_is_ignored(self):
+        self.assertEqual(self.search('"(*'), [])
+        self.assertEqual(self.search('teak AND NOT'), [])
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Prices repeat, so pages have to break ties on the primary key
+        for i, product in enumerate(create_catalog(11)):
+            product.price = Decimal(i % 3)
+            product.save()
+
+    def walk(self, queryset, per_page=4):
+        paginator = KeysetPaginator(queryset, per_page)
+        pages = [list(paginator.get_page())]
+        page = paginator.get_page()
+        while page.has_next():
+            page = paginator.get_page(page.next_cursor)
+            pages.append(list(page))
+        backward = [list(page)]
+        while page.has_previous():
+            page = paginator.get_page(page.previous_cursor)
+            backward.append(list(page))
+        return pages, backward[::-1]
+
+    def test_cursors_walk_both_ways_through_ties(self):
+        for ordering in (['-price'], ['price', '-name'], ['-created_at']):
+            queryset = Product.objects.order_by(*ordering)
+            self.assertTrue(KeysetPaginator.supports(queryset))
+            pages, backward = self.walk(queryset)
+            self.assertEqual([len(page) for page in pages], [4, 4, 3])
+            self.assertEqual(sum(pages, []), list(queryset.order_by(*ordering, 'pk')), ordering)
+            self.assertEqual(backward, pages, ordering)
+
+    def test_invalid_cursors_fall_back_to_the_first_page(self):
+        paginator = KeysetPaginator(Product.objects.order_by('price'), 4)
+        first = list(paginator.get_page())
+        cursor = paginator.get_page().next_cursor
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        tampered = [
+            'garbage', cursor[:-3],
+            base64.urlsafe_b64encode(json.dumps({**payload, 'v': ['cheap', 1]}).encode()).decode(),
+            base64.urlsafe_b64encode(json.dumps({**payload, 'v': payload['v'][:1]}).encode()).decode(),
+            base64.urlsafe_b64encode(json.dumps({**payload, 'd': 'x'}).encode()).decode(),
+        ]
+        for cursor in tampered:
+            page = paginator.get_page(cursor)
+            self.assertEqual(list(page), first, cursor)
+            self.assertFalse(page.has_previous())
+
+    def test_nullable_or_computed_orderings_use_page_numbers(self):
+        self.assertFalse(KeysetPaginator.supports(Product.objects.order_by('sale_price')))
+        self.assertFalse(KeysetPaginator.supports(Product.objects.all()))
+        request = RequestFactory().get('/shop/', {'cursor': ''})
+        paginator, page = paginate(request, Product.objects.order_by('sale_price'), 4)
+        self.assertEqual(page.number, 1)
+
+
+class ProductStatsTests(TestCase):
+    def setUp(self):
+        self.bench, self.chair, self.table = create_catalog()
+        self.order = Order.objects.first()
+        self.ann = Customer.objects.get()
+        self.bob = Customer.objects.create(user=User.objects.create(username='bob'))
+
+    def review(self, product, customer, rating):
+        return ProductReview.objects.create(product=product, customer=customer, rating=rating, title='t', comment='c')
+
+    def sell(self, product, quantity):
+        return OrderItem.objects.create(order=self.order, product=product, quantity=quantity, price=product.price)
+
+    def stats(self, product):
+        product.refresh_from_db()
+        return product.rating_average, product.review_count, product.units_sold
+
+    def test_reviews_and_order_items_update_aggregates(self):
+        self.review(self.bench, self.ann, 5)
+        review = self.review(self.bench, self.bob, 2)
+        item = self.sell(self.chair, 3)
+        self.sell(self.chair, 2)
+        self.assertEqual(self.stats(self.bench), (Decimal('3.50'), 2, 0))
+        self.assertEqual(self.stats(self.chair), (Decimal('0.00'), 0, 5))
+
+        item.quantity = 1
+        item.save()
+        review.delete()
+        self.assertEqual(self.stats(self.bench), (Decimal('5.00'), 1, 0))
+        self.assertEqual(self.stats(self.chair)[2], 3)
+        self.assertEqual(list(Product.objects.order_by('-units_sold', 'pk')), [self.chair, self.bench, self.table])
+
+    def test_moving_a_review_or_item_refreshes_both_products(self):
+        review = self.review(self.bench, self.ann, 4)
+        item = self.sell(self.bench, 3)
+        review.product = self.table
+        review.save()
+        item.product = self.table
+        item.save()
+        self.assertEqual(self.stats(self.bench), (Decimal('0.00'), 0, 0))
+        self.assertEqual(self.stats(self.table), (Decimal('4.00'), 1, 3))
+
+    def test_rebuild_recomputes_every_product(self):
+        self.review(self.bench, self.ann, 4)
+        self.review(self.bench, self.bob, 5)
+        self.sell(self.chair, 2)
+        Product.objects.update(rating_average=0, review_count=0, units_sold=7)
+        self.assertEqual(rebuild_product_stats(), 3)
+        self.assertEqual(self.stats(self.bench), (Decimal('4.50'), 2, 0))
+        self.assertEqual(self.stats(self.chair), (Decimal('0.00'), 0, 2))
+
+
+class DashboardMetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.products = create_catalog()
+        self.order = Order.objects.first()
+        # Warm every entry
+        get_dashboard_metrics()
+
+    def write(self, function, *args, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return function(*args, **kwargs)
+
+    def test_warm_metrics_run_no_queries(self):
+        with self.assertNumQueries(0):
+            metrics = get_dashboard_metrics()
+        self.assertEqual((metrics['total_products'], metrics['total_orders']), (3, 3))
+        self.assertEqual(metrics['monthly_revenue'], Decimal('351.00'))
+
+    def test_counters_follow_creates_and_deletes(self):
+        address = self.order.shipping_address
+        order = self.write(
+            Order.objects.create, customer=self.order.customer, shipping_address=address, billing_address=address,
+            shipping_method='standard', shipping_cost=Decimal('0'), subtotal=Decimal('12.34'), tax=Decimal('0'),
+            total=Decimal('12.34'), payment_method='credit_card',
+        )
+        with self.assertNumQueries(1):
+            # Only the recent orders list is reloaded
+            metrics = get_dashboard_metrics()
+        self.assertEqual((metrics['total_orders'], metrics['monthly_revenue']), (4, Decimal('363.34')))
+
+        self.write(order.delete)
+        self.write(self.products[2].delete)
+        metrics = get_dashboard_metrics()
+        self.assertEqual((metrics['total_orders'], metrics['total_products']), (3, 2))
+        self.assertEqual(metrics['monthly_revenue'], Decimal('351.00'))
+        self.assertNotIn(self.products[2], metrics['recent_products'])
+
+    def test_updates_invalidate_dependent_entries(self):
+        self.order.status = 'cancelled'
+        self.write(self.order.save)
+        self.assertEqual(get_dashboard_metrics()['monthly_revenue'], Decimal('234.00'))
+
+        product = self.products[0]
+        product.name = 'Renamed bench'
+        self.write(product.save)
+        names = [recent.name for recent in get_dashboard_metrics()['recent_products']]
+        self.assertIn('Renamed bench', names)
+
+    def test_reservations_refresh_low_stock(self):
+        product = self.products[0]
+        Inventory.objects.filter(product=product).update(quantity=8)
+        cache.clear()
+        low_stock = get_dashboard_metrics()['low_stock_count']
+        self.write(reserve_stock, {product.pk: 4})
+        self.assertEqual(get_dashboard_metrics()['low_stock_count'], low_stock + 1)
+
+    def test_rolled_back_writes_leave_counters_alone(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            self.products[0].delete()
+        self.assertEqual(get_dashboard_metrics()['total_products'], 3)
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.products = create_catalog(20)
+        Inventory.objects.update(quantity=5)
+        self.customer = Customer.objects.get()
+        self.address = Address.objects.get()
+        self.cart = Cart.objects.create(customer=self.customer)
+
+    def fill_cart(self, products, quantity=2):
+        CartItem.objects.bulk_create([
+            CartItem(cart=self.cart, product=product, quantity=quantity) for product in products
+        ])
+
+    def place_order(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return place_order(self.customer, self.cart, self.address, self.address, 'standard', 'credit_card')
+
+    def test_order_reserves_stock_and_empties_cart(self):
+        self.fill_cart(self.products[:2])
+        order = self.place_order()
+        self.assertEqual(order.items.count(), 2)
+        self.assertEqual(order.subtotal, Decimal('400.00'))
+        self.assertEqual(order.tax, Decimal('28.00'))
+        self.assertFalse(self.cart.items.exists())
+        self.assertEqual(Inventory.objects.get(product=self.products[0]).reserved_quantity, 2)
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].units_sold, 2)
+
+    def test_query_count_does_not_grow_with_the_cart(self):
+        # The first order also loads the promotion index into the cache
+        self.fill_cart(self.products[:1], quantity=1)
+        self.place_order()
+        self.fill_cart(self.products[:2])
+        with CaptureQueriesContext(connection) as small:
+            self.place_order()
+        self.fill_cart(self.products)
+        with self.assertNumQueries(len(small)):
+            self.place_order()
+
+    def test_short_stock_rolls_everything_back(self):
+        self.fill_cart(self.products[:2])
+        CartItem.objects.filter(product=self.products[1]).update(quantity=6)
+        with self.assertRaises(InsufficientStock) as raised:
+            self.place_order()
+        self.assertEqual(raised.exception.product_ids, [self.products[1].pk])
+        self.assertEqual(Order.objects.count(), 20)
+        self.assertEqual(self.cart.items.count(), 2)
+        self.assertFalse(Inventory.objects.filter(reserved_quantity__gt=0).exists())
+
+    def test_stock_in_closed_warehouses_cannot_be_ordered(self):
+        self.fill_cart(self.products[:2])
+        Inventory.objects.filter(product=self.products[1]).update(quantity=50)
+        Warehouse.objects.update(is_active=False)
+        self.assertEqual(get_available_quantities([self.products[1].pk]), {self.products[1].pk: 0})
+        with self.assertRaises(InsufficientStock) as raised:
+            self.place_order()
+        self.assertEqual(raised.exception.product_ids, [self.products[0].pk, self.products[1].pk])
+        self.assertEqual(Order.objects.count(), 20)
+        self.assertFalse(Inventory.objects.filter(reserved_quantity__gt=0).exists())
+
+    def test_stock_taken_by_a_concurrent_checkout_is_not_oversold(self):
+        self.fill_cart(self.products[:1], quantity=3)
+
+        def allocate_then_lose_race(rows, quantities):
+            allocations = allocate(rows, quantities)
+            # Another checkout reserves the same stock between our SELECT and UPDATE
+            Inventory.objects.filter(pk__in=allocations).update(reserved_quantity=4)
+            return allocations
+
+        with mock.patch('backend.inventory.allocate', allocate_then_lose_race):
+            with self.assertRaises(InsufficientStock):
+                self.place_order()
+        self.assertEqual(Order.objects.count(), 20)
+        self.assertEqual(self.cart.items.count(), 1)
+
+
+class InventoryAdjustmentTests(TestCase):
+    def setUp(self):
+        create_catalog(3)
+        Inventory.objects.update(quantity=5)
+        self.first, self.second, self.third = Inventory.objects.order_by('pk')
+
+    def movement(self, row, movement_type, quantity):
+        return StockMovement(inventory_id=getattr(row, 'pk', row), movement_type=movement_type, quantity=quantity)
+
+    def quantities(self):
+        return list(Inventory.objects.order_by('pk').values_list('quantity', flat=True))
+
+    def test_movements_are_applied_and_recorded(self):
+        bulk_adjust([
+            self.movement(self.first, MOVEMENT_ADD, 3),
+            self.movement(self.second, MOVEMENT_REMOVE, 2),
+            self.movement(self.third, MOVEMENT_SET, 9),
+            self.movement(self.third, MOVEMENT_REMOVE, 1),
+        ])
+        self.assertEqual(self.quantities(), [8, 3, 8])
+        self.assertEqual(StockMovement.objects.count(), 4)
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.last_restock_date, timezone.now().date())
+
+    def test_removals_cannot_take_reserved_stock(self):
+        Inventory.objects.filter(pk=self.second.pk).update(reserved_quantity=3)
+        with self.assertRaises(InsufficientStock) as raised:
+            bulk_adjust([self.movement(self.first, MOVEMENT_ADD, 1), self.movement(self.second, MOVEMENT_REMOVE, 3)])
+        self.assertEqual(raised.exception.inventory_ids, [self.second.pk])
+        self.assertEqual(raised.exception.product_ids, [self.second.product_id])
+        # Nothing is applied or recorded
+        self.assertEqual(self.quantities(), [5, 5, 5])
+        self.assertFalse(StockMovement.objects.exists())
+
+        adjust_stock(self.second.pk, MOVEMENT_REMOVE, 2)
+        self.assertEqual(self.quantities(), [5, 3, 5])
+
+    def test_set_cannot_go_below_reserved_stock(self):
+        Inventory.objects.filter(pk=self.first.pk).update(quantity=10, reserved_quantity=8)
+        with self.assertRaises(InsufficientStock) as raised:
+            adjust_stock(self.first.pk, MOVEMENT_SET, 2)
+        self.assertEqual(raised.exception.inventory_ids, [self.first.pk])
+        with self.assertRaises(InsufficientStock):
+            bulk_adjust([self.movement(self.first, MOVEMENT_SET, 12), self.movement(self.first, MOVEMENT_REMOVE, 5)])
+        self.assertEqual(self.quantities(), [10, 5, 5])
+
+        adjust_stock(self.first.pk, MOVEMENT_SET, 8)
+        self.first.refresh_from_db()
+        self.assertEqual((self.first.quantity, self.first.available_quantity), (8, 0))
+
+    def test_errors_name_the_inventory_row(self):
+        with self.assertRaisesMessage(InsufficientStock, f'inventory rows [{self.first.pk}]'):
+            bulk_adjust([self.movement(self.first, MOVEMENT_SET, 1), self.movement(self.first, MOVEMENT_REMOVE, 2)])
+        with self.assertRaisesMessage(Inventory.DoesNotExist, 'ids [999]'):
+            bulk_adjust([self.movement(self.first, MOVEMENT_ADD, 1), self.movement(999, MOVEMENT_ADD, 1)])
+        self.assertEqual(self.quantities(), [5, 5, 5])
+
+    def test_adjust_view_records_the_reason(self):
+        self.client.post(f'/inventory/{self.first.pk}/adjust/', {'action': 'subtract', 'quantity': 4, 'reason': 'damaged'})
+        self.assertEqual(self.quantities()[0], 1)
+        self.assertEqual(StockMovement.objects.get().reason, 'damaged')
+
+
+class AvailabilityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tracked, self.closed_only, self.untracked = create_catalog()
+        main = Inventory.objects.get(product=self.tracked)
+        Inventory.objects.filter(pk=main.pk).update(quantity=2)
+        address = Address.objects.get()
+        second = Warehouse.objects.create(name='Second', address=address, phone='2', email='b@example.com')
+        closed = Warehouse.objects.create(name='Closed', address=address, phone='3', email='c@example.com',
+                                          is_active=False)
+        self.second = Inventory.objects.create(product=self.tracked, warehouse=second, quantity=5, reserved_quantity=1)
+        Inventory.objects.create(product=self.tracked, warehouse=closed, quantity=50)
+        Inventory.objects.filter(product=self.closed_only).update(warehouse=closed, quantity=50)
+        Inventory.objects.filter(product=self.untracked).delete()
+        cache.clear()
+        self.ids = [self.tracked.pk, self.closed_only.pk, self.untracked.pk]
+
+    def test_sums_active_warehouses_with_one_query_then_none(self):
+        expected = {self.tracked.pk: 6, self.closed_only.pk: 0, self.untracked.pk: None}
+        with self.assertNumQueries(1):
+            self.assertEqual(get_available_quantities(self.ids), expected)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_available_quantities(self.ids), expected)
+
+    def test_inventory_writes_invalidate_on_commit(self):
+        get_available_quantities(self.ids)
+        with self.captureOnCommitCallbacks(execute=True):
+            adjust_stock(self.second.pk, MOVEMENT_REMOVE, 4)
+        self.assertEqual(get_available_quantities([self.tracked.pk]), {self.tracked.pk: 2})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Inventory.objects.create(product=self.untracked, warehouse=self.second.warehouse, quantity=7)
+        self.assertEqual(get_available_quantities([self.untracked.pk]), {self.untracked.pk: 7})
+
+
+class PricingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.bench, self.chair = create_catalog(2)
+        self.tables = Category.objects.create(name='Tables')
+        self.table = Product.objects.create(
+            name='Table', slug='table', description='Garden table', category=self.tables,
+            material=self.bench.material, price=Decimal('50.00'), weight=20, width=150, height=75, depth=90,
+            sku='BF-T',
+        )
+        Inventory.objects.create(product=self.table, warehouse=Warehouse.objects.get(), quantity=5)
+        Product.objects.filter(pk=self.bench.pk).update(sale_price=Decimal('80.00'))
+        self.bench.refresh_from_db()
+
+    def promotion(self, name, discount_value, **fields):
+        now = timezone.now()
+        fields.setdefault('discount_type', 'percentage')
+        return Promotion.objects.create(
+            name=name, description=name, discount_value=Decimal(discount_value),
+            start_date=now - timedelta(days=1), end_date=now + timedelta(days=1), **fields
+        )
+
+    def lines(self):
+        return [
+            {'product_id': product.pk, 'category_id': product.category_id, 'quantity': quantity,
+             'price': product.price, 'sale_price': product.sale_price, 'price_adjustment': adjustment}
+            for product, quantity, adjustment in [(self.bench, 2, Decimal('5.00')), (self.table, 1, None)]
+        ]
+
+    def test_scoped_promotions_discount_only_their_lines(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.promotion('Everything', '5')
+            tables = self.promotion('Tables', '50')
+            PromotionCategory.objects.create(promotion=tables, category=self.tables)
+            bench = self.promotion('Bench', '20')
+            PromotionProduct.objects.create(promotion=bench, product=self.chair)
+        get_promotion_index()
+        with self.assertNumQueries(0):
+            priced = price_cart(self.lines())
+        self.assertEqual([line['unit_price'] for line in priced.lines], [Decimal('85.00'), Decimal('50.00')])
+        self.assertEqual(priced.subtotal, Decimal('220.00'))
+        # 50% of the table beats 5% of the cart; the chair promotion matches no line
+        self.assertEqual((priced.promotion.name, priced.discount), ('Tables', Decimal('25.00')))
+
+    def test_code_promotions_need_their_code_and_minimum(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.promotion('Code', '60', code='SAVE', discount_type='fixed')
+            self.promotion('Big spender', '90', code='BIG', minimum_order_value=Decimal('1000.00'))
+        self.assertIsNone(price_cart(self.lines()).promotion)
+        priced = price_cart(self.lines(), code=' save ')
+        self.assertEqual((priced.promotion.name, priced.discount), ('Code', Decimal('60.00')))
+        self.assertIsNone(price_cart(self.lines(), code='BIG').promotion)
+
+    def test_usage_limit_is_used_up_by_checkout(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.promotion('Once', '10', code='ONCE', discount_type='fixed', usage_limit=1)
+        customer = Customer.objects.get()
+        address = Address.objects.get()
+        cart = Cart.objects.create(customer=customer)
+        CartItem.objects.create(cart=cart, product=self.table, quantity=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            order = place_order(customer, cart, address, address, 'standard', 'credit_card', promo_code='ONCE')
+        self.assertEqual(order.discount, Decimal('10.00'))
+        self.assertEqual(Promotion.objects.get().used_count, 1)
+        self.assertIsNone(price_cart(self.lines(), code='ONCE').promotion)
+
+    def test_index_is_rebuilt_when_too_old(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.promotion('Everything', '5')
+        self.assertIsNotNone(price_cart(self.lines()).promotion)
+        # Another process disabled it; this process's cache never saw the version bump
+        Promotion.objects.update(is_active=False)
+        self.assertIsNotNone(price_cart(self.lines()).promotion)
+        with mock.patch('backend.pricing.time.monotonic', return_value=time.monotonic() + 3600):
+            self.assertIsNone(price_cart(self.lines()).promotion)
+
+
+class CartTotalsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.products = create_catalog(3)
+        self.customer = Customer.objects.get()
+
+    def cart(self, *items):
+        cart = Cart.objects.create(customer=self.customer)
+        for product, quantity, variant in items:
+            CartItem.objects.create(cart=cart, product=product, quantity=quantity, variant=variant)
+        return cart
+
+    def test_totals_are_quantized_decimals(self):
+        Product.objects.filter(pk=self.products[0].pk).update(sale_price=Decimal('89.99'))
+        variant = ProductVariant.objects.create(
+            product=self.products[1], color='Grey', color_code='#888', price_adjustment=Decimal('12.50')
+        )
+        totals = cart_totals(self.cart((self.products[0], 3, None), (self.products[1], 1, variant)), 'express')
+        self.assertEqual([line['unit_price'] for line in totals.lines], [Decimal('89.99'), Decimal('112.50')])
+        self.assertEqual(totals.subtotal, Decimal('382.47'))
+        self.assertEqual(totals.tax, Decimal('26.77'))
+        self.assertEqual(totals.shipping, Decimal('25.00'))
+        self.assertEqual(totals.total, Decimal('434.24'))
+        for amount in (totals.subtotal, totals.discount, totals.tax, totals.total):
+            self.assertIsInstance(amount, Decimal)
+            self.assertEqual(amount.as_tuple().exponent, -2)
+
+    def test_tax_rounds_half_up(self):
+        Product.objects.filter(pk=self.products[0].pk).update(price=Decimal('1.50'))
+        # 1.50 * 0.07 = 0.105, which banker's rounding would take down to 0.10
+        totals = cart_totals(self.cart((self.products[0], 1, None)))
+        self.assertEqual((totals.tax, totals.shipping, totals.total), (Decimal('0.11'), Decimal('0.00'), Decimal('1.61')))
+
+    def test_batch_matches_single_cart_totals_in_one_query(self):
+        carts = [
+            self.cart((self.products[0], 1, None)),
+            self.cart(),
+            self.cart((self.products[1], 2, None), (self.products[2], 4, None)),
+            self.cart((self.products[2], 1, None)),
+        ]
+        get_promotion_index()
+        with mock.patch('backend.totals.BATCH_CHUNK_SIZE', 2), self.assertNumQueries(1):
+            results = batch_cart_totals([cart.pk for cart in carts], 'standard')
+        self.assertEqual(sorted(results), [carts[0].pk, carts[2].pk, carts[3].pk])
+        for cart in (carts[0], carts[2], carts[3]):
+            single = cart_totals(cart, 'standard')
+            self.assertEqual(
+                (results[cart.pk].subtotal, results[cart.pk].tax, results[cart.pk].total),
+                (single.subtotal, single.tax, single.total),
+            )
+        self.assertEqual(results[carts[2].pk].total, Decimal('652.00'))
+
+
+class QueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_catalog()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_home_within_budget(self):
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertWithinQueryBudget(response)
+
+    def test_dashboard_within_budget(self):
+        response = self.client.get('/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        self.assertWithinQueryBudget(response)
+        self.assertContains(response, '$351')
+
+    def test_warm_dashboard_runs_no_queries(self):
+        self.client.get('/dashboard/')
+        response = self.client.get('/dashboard/')
+        self.assertEqual(response['X-Query-Count'], '0')
+
+    def test_order_rows_follow_customer_names(self):
+        self.client.get('/dashboard/')
+        user = User.objects.get(username='buyer')
+        user.first_name, user.last_name = 'Renamed', 'Buyer'
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+        self.assertContains(self.client.get('/dashboard/'), 'Renamed Buyer', count=3)
+
+    @override_settings(QUERY_BUDGETS={'dashboard': 1})
+    def test_over_budget_fails(self):
+        with self.assertLogs('backend.queries', 'WARNING') as logs, self.assertRaises(QueryBudgetExceeded):
+            self.client.get('/dashboard/')
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual((line['url_name'], line['budget']), ('dashboard', 1))
+        self.assertGreater(line['query_count'], 1)
+
+    def test_budgets_prefer_routes_over_shared_names(self):
+        staff = resolve(reverse('product_detail', kwargs={'pk': 1}))
+        shop = resolve(reverse('product_detail', kwargs={'slug': 'bench-0'}))
+        self.assertEqual(shop.url_name, staff.url_name)
+        self.assertEqual(get_query_budget(staff), 10)
+        self.assertEqual(get_query_budget(shop), 6)
+
+
+# Stand-ins for the storefront templates, touching what product cards,
+# reviews, cart lines and order history render
+STOREFRONT_TEMPLATES = {
+    'backend/frontend/shop.html': (
+        '{% for product in products %}{{ product.name }} {{ product.primary_image.image }} '
+        '{{ product.available_quantity }}{% endfor %}'
+        '{% for category in categories %}{{ category.name }} {{ category.product_count }}{% endfor %}'
+        '{% for material in materials %}{{ material.name }} {{ material.product_count }}{% endfor %}'
+    ),
+    'backend/frontend/product_detail.html': (
+        '{{ product.name }}{% for review in reviews %}{{ review.customer.user.username }}{% endfor %}'
+        '{% for related in related_products %}{{ related.name }} {{ related.primary_image.image }}{% endfor %}'
+    ),
+    'backend/frontend/cart.html': (
+        '{% for item in cart_items %}{{ item }} {{ item.variant }} {{ item.available_quantity }}{% endfor %}'
+        '{{ total }}'
+    ),
+    'backend/frontend/my_orders.html': (
+        '{% for order in orders %}{{ order.order_number }}'
+        '{% for item in order.items.all %}{{ item.product.name }}{% endfor %}{% endfor %}'
+    ),
+}
+
+
+storefront_templates = override_settings(TEMPLATES=[{
+    'BACKEND': 'django.template.backends.django.DjangoTemplates',
+    'OPTIONS': {
+        'context_processors': [
+            'django.template.context_processors.request',
+            'django.contrib.auth.context_processors.auth',
+            'django.contrib.messages.context_processors.messages',
+        ],
+        'loaders': [
+            ('django.template.loaders.locmem.Loader', STOREFRONT_TEMPLATES),
+            'django.template.loaders.app_directories.Loader',
+        ],
+    },
+}])
+
+
+@storefront_templates
+class StorefrontQueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = create_catalog(6)
+        cls.customer = Customer.objects.get()
+        for i, product in enumerate(cls.products):
+            reviewer = Customer.objects.create(user=User.objects.create(username=f'reviewer{i}'))
+            ProductReview.objects.create(
+                product=cls.products[0], customer=reviewer, rating=4, title='Good', comment='Sturdy'
+            )
+            OrderItem.objects.create(
+                order=Order.objects.filter(items__isnull=True).first(), product=product, quantity=1,
+                price=product.price, total=product.price,
+            )
+        cart = Cart.objects.create(customer=cls.customer)
+        for product in cls.products:
+            CartItem.objects.create(cart=cart, product=product, quantity=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_shop_within_budget(self):
+        response = self.client.get('/shop/')
+        self.assertEqual(response.status_code, 200)
+        self.assertWithinQueryBudget(response)
+
+    def test_shop_product_detail_within_budget(self):
+        response = self.client.get(f'/shop/product/{self.products[0].slug}/')
+        self.assertEqual(response.resolver_match.route, 'shop/product/<str:slug>/')
+        self.assertEqual(response.status_code, 200)
+        self.assertWithinQueryBudget(response)
+
+    def test_customer_pages_within_budget(self):
+        self.client.force_login(self.customer.user)
+        for url in ('/cart/', '/my-orders/'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertWithinQueryBudget(response)
+
+
+class FingerprintTests(TestCase):
+    def test_parameters_are_normalized(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id = 1 AND name = 'a'"),
+            fingerprint("SELECT *  FROM t WHERE id = 22 AND name = 'it''s'"),
+        )
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s)'),
+            'SELECT * FROM t WHERE id IN (...)',
+        )
+
+
+class PageCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = create_catalog()
+
+    def setUp(self):
+        cache.clear()
+        self.renders = 0
+
+        @cache_anonymous_page(params=('sort',))
+        def view(request, pk):
+            self.renders += 1
+            add_cache_tags(request, product_tag(pk))
+            return HttpResponse(Product.objects.get(pk=pk).name)
+
+        self.view = view
+
+    def get(self, pk, query=''):
+        request = RequestFactory().get(f'/shop/product/{pk}/{query}')
+        request.user = AnonymousUser()
+        return self.view(request, pk)
+
+    def test_normalized_query_hits_cache(self):
+        self.get(self.products[0].pk, '?sort=price_low&utm_source=mail')
+        response = self.get(self.products[0].pk, '?utm_source=ad&sort=price_low')
+        self.assertEqual(self.renders, 1)
+        self.assertContains(response, 'Bench 0')
+
+    def test_save_evicts_only_tagged_pages(self):
+        first, second = self.products[:2]
+        self.get(first.pk)
+        self.get(second.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            first.name = 'Teak Bench'
+            first.save()
+        self.assertContains(self.get(first.pk), 'Teak Bench')
+        self.get(second.pk)
+        self.assertEqual(self.renders, 3)
+
+    @storefront_templates
+    def test_category_pages_follow_every_facet_count(self):
+        tables = Category.objects.create(name='Tables', slug='tables')
+        seating = self.products[0].category
+        self.assertContains(self.client.get('/shop/', {'category': seating.slug}), 'Tables 0')
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(
+                name='Table', slug='table', description='Garden table', category=tables,
+                material=self.products[0].material, price=Decimal('50.00'), weight=20, width=150, height=75,
+                depth=90, sku='BF-T',
+            )
+        self.assertContains(self.client.get('/shop/', {'category': seating.slug}), 'Tables 1')
+
+
+class FragmentCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = create_catalog(1)[0]
+
+    def setUp(self):
+        cache.clear()
+
+    def render(self, product):
+        template = Template(
+            "{% load fragments %}{% versioned_cache 'row' product %}{{ product.name }}{% endversioned_cache %}"
+        )
+        return template.render(Context({'product': product}))
+
+    def test_fragment_is_reused_until_saved(self):
+        self.assertEqual(self.render(self.product), 'Bench 0')
+        self.product.name = 'Unsaved name'
+        self.assertEqual(self.render(self.product), 'Bench 0')
+        self.product.save()
+        self.assertEqual(self.render(self.product), 'Unsaved name')
+
+
+class RelatedProductsTests(TestCase):
+    def test_co_purchases_rank_first(self):
+        first, second, third = create_catalog()
+        other_category = Category.objects.create(name='Tables')
+        table = Product.objects.create(
+            name='Table', slug='table', description='Garden table', category=other_category,
+            material=first.material, price=Decimal('300.00'), weight=20, width=150, height=75,
+            depth=90, sku='BF-T',
+        )
+        order = Order.objects.first()
+        OrderItem.objects.create(order=order, product=first, quantity=1, price=first.price, total=first.price)
+        OrderItem.objects.create(order=order, product=table, quantity=1, price=table.price, total=table.price)
+
+        rebuild_related_products()
+
+        first.refresh_from_db()
+        self.assertEqual(first.related_product_ids[0], table.pk)
+        self.assertCountEqual(first.related_product_ids, [table.pk, second.pk, third.pk])
+
+
+class CategoryTreeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.outdoor = Category.objects.create(name='Outdoor')
+        self.seating = Category.objects.create(name='Seating', parent=self.outdoor)
+        self.benches = Category.objects.create(name='Benches', parent=self.seating)
+        self.tables = Category.objects.create(name='Tables')
+
+    def subtree(self, category):
+        category.refresh_from_db()
+        return set(Category.objects.subtree(category).values_list('name', flat=True))
+
+    def test_subtree_follows_moves_and_deletes(self):
+        self.assertEqual(self.subtree(self.outdoor), {'Outdoor', 'Seating', 'Benches'})
+
+        self.seating.parent = self.tables
+        self.seating.save()
+        self.assertEqual(self.subtree(self.outdoor), {'Outdoor'})
+        self.assertEqual(self.subtree(self.tables), {'Tables', 'Seating', 'Benches'})
+
+        self.tables.delete()
+        self.assertEqual(self.subtree(self.seating), {'Seating', 'Benches'})
+        self.assertEqual(self.seating.path.count('/'), 1)
+
+    def test_cached_tree_nests_active_categories(self):
+        tree = get_category_tree()
+        self.assertEqual([root.name for root in tree.roots], ['Outdoor', 'Tables'])
+        self.assertEqual([node.name for node in tree], ['Outdoor', 'Seating', 'Benches', 'Tables'])
+        self.assertCountEqual(tree.subtree_ids(self.seating.pk), [self.seating.pk, self.benches.pk])
+
+
+class FacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = create_catalog()
+        cls.oak = Material.objects.create(name='Oak', weather_resistance_rating=5, maintenance_level='medium')
+        cls.products[2].material = cls.oak
+        cls.products[2].price = Decimal('300.00')
+        cls.products[2].save()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_each_facet_ignores_its_own_filter(self):
+        teak = self.products[0].material
+        tree = get_category_tree()
+        selection = FacetSelection(QueryDict(f'material={teak.pk}&max_price=200'), tree)
+        with self.assertNumQueries(1):
+            facets = get_facet_counts(Product.objects.filter(is_active=True), selection, tree)
+
+        self.assertEqual(facets['materials'], {teak.pk: 2})
+        self.assertEqual(facets['price']['100-250'], 2)
+        self.assertEqual(facets['price']['250-500'], 0)
+        self.assertEqual(facets['categories'], {self.products[0].category_id: 2})
+        self.assertEqual(selection.filter(Product.objects.all()).count(), 2)
+
+    def test_category_filter_skips_hidden_branches(self):
+        seating = self.products[0].category
+        lounge = Category.objects.create(name='Lounge', parent=seating, is_active=False)
+        chairs = Category.objects.create(name='Chairs', parent=lounge)
+        Product.objects.filter(pk=self.products[1].pk).update(category=chairs)
+        tree = get_category_tree()
+        selection = FacetSelection(QueryDict(f'category={seating.slug}'), tree)
+        facets = get_facet_counts(Product.objects.filter(is_active=True), selection, tree)
+
+        self.assertEqual(selection.category_ids, {seating.pk})
+        self.assertEqual(facets['categories'], {seating.pk: 2})
+        self.assertEqual(
+            list(selection.filter(Product.objects.order_by('pk'))), [self.products[0], self.products[2]]
+        )
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Asserts on SQLite query plans')
+class IndexUsageTests(TestCase):
+    """The main query of each hot view is served by an index, not a table scan"""
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertRegex(plan, rf'USING (COVERING )?INDEX {index_name}\b')
+        for line in plan.splitlines():
+            self.assertIsNone(re.search(r'\bSCAN \w+$', line), f'Full table scan: {line}')
+
+    def test_home(self):
+        self.assertUsesIndex(Product.objects.filter(featured=True, is_active=True)[:8], 'product_featured_idx')
+        self.assertUsesIndex(
+            Product.objects.filter(is_active=True).order_by('-created_at')[:8], 'product_new_arrivals_idx'
+        )
+        now = timezone.now()
+        self.assertUsesIndex(
+            Promotion.objects.filter(is_active=True, start_date__lte=now, end_date__gte=now)[:3],
+            'promotion_running_idx'
+        )
+
+    def test_shop_category_by_price(self):
+        category = Category.objects.create(name='Seating')
+        products = Product.objects.filter(is_active=True, category=category).order_by('price')
+        self.assertUsesIndex(products, 'product_active_cat_price_idx')
+        self.assertNotIn('TEMP B-TREE', products.explain())
+        # A subtree is an IN list, served by either category index
+        products = Product.objects.filter(is_active=True, category__in=Category.objects.subtree(category))
+        self.assertUsesIndex(products, '(product_active_cat_price_idx|backend_product_category_id_\\w+)')
+
+    def test_orders(self):
+        self.assertUsesIndex(Order.objects.filter(customer_id=1).order_by('-created_at')[:5], 'order_customer_created_idx')
+        self.assertUsesIndex(Order.objects.filter(status='pending').order_by('-created_at'), 'order_status_created_idx')
+
+    def test_promotion_index_build(self):
+        promotions = (
+            Promotion.objects
+            .filter(is_active=True, end_date__gte=timezone.now())
+            .filter(Q(usage_limit=0) | Q(used_count__lt=F('usage_limit')))
+        )
+        self.assertUsesIndex(promotions, 'promotion_running_idx')
+
+    def test_low_stock(self):
+        self.assertUsesIndex(Inventory.objects.low_stock(), 'inventory_restock_idx')
+
+    def test_cart(self):
+        self.assertUsesIndex(Cart.objects.filter(customer_id=1), 'backend_cart_customer_id_\\w+')
+
+
+class LowStockTests(TestCase):
+    def test_low_stock_agrees_with_needs_restock(self):
+        create_catalog()
+        # Plenty on hand, but mostly reserved
+        Inventory.objects.filter(quantity=2).update(quantity=20, reserved_quantity=16)
+        Inventory.objects.filter(quantity=1).update(quantity=9)
+
+        low = set(Inventory.objects.low_stock().values_list('pk', flat=True))
+        self.assertEqual(low, {row.pk for row in Inventory.objects.all() if row.needs_restock})
+        self.assertEqual(len(low), 2)
+
+
+class PurchaseSuggestionTests(TestCase):
+    def test_suggestions_cover_lead_time_demand(self):
+        bench, second, third = create_catalog()
+        Inventory.objects.filter(product=bench).update(quantity=20)
+        Inventory.objects.filter(product=second).update(quantity=50)
+        supplier = Supplier.objects.create(
+            name='Teak Co', contact_person='Sam', address=Address.objects.first(), phone='1', email='t@example.com'
+        )
+        ProductSupplier.objects.create(product=bench, supplier=supplier, cost=Decimal('60.00'), lead_time_days=10,
+                                       is_primary=True)
+        # 60 benches in the last 30 days: 2 a day, 20 during the lead time
+        OrderItem.objects.create(order=Order.objects.first(), product=bench, quantity=60, price=bench.price,
+                                 total=bench.price)
+
+        self.assertEqual(generate_purchase_suggestions(), 2)
+        self.assertEqual(generate_purchase_suggestions(), 2)
+
+        suggestion = PurchaseSuggestion.objects.get(product=bench)
+        self.assertEqual(suggestion.supplier, supplier)
+        # Reorder point 5 + 2 a day over 10 days of lead time and 14 of cover, minus 20 on hand
+        self.assertEqual(suggestion.quantity, 33)
+        self.assertEqual(PurchaseSuggestion.objects.get(product=third).quantity, 3)
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = create_catalog()
+        order = Order.objects.first()
+        for product in cls.products[:2]:
+            OrderItem.objects.create(order=order, product=product, quantity=1, price=product.price, total=product.price)
+        cls.staff = User.objects.create_superuser('finance', 'finance@example.com', 'pw')
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def test_exports_require_permission(self):
+        self.client.logout()
+        self.assertEqual(self.client.get('/orders/export.csv').status_code, 403)
+
+    def test_order_csv_has_one_row_per_line(self):
+        response = self.client.get('/orders/export.csv')
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment; filename="orders-', response['Content-Disposition'])
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertTrue(lines[0].startswith('order_number,created_at'))
+        # Two lines for the first order, one empty line row for each of the others
+        self.assertEqual(len(lines), 1 + 2 + 2)
+
+    def test_order_jsonl_nests_lines(self):
+        response = self.client.get('/orders/export.jsonl', {'status': 'pending'})
+        orders = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(len(orders), 3)
+        self.assertEqual([item['sku'] for item in orders[0]['items']], ['BF-0', 'BF-1'])
+        self.assertEqual(orders[0]['total'], '117.00')
+
+    def test_product_and_inventory_exports(self):
+        # Session and user, then one joined SELECT
+        with self.assertNumQueries(3):
+            content = b''.join(self.client.get('/products/export.csv').streaming_content).decode()
+        self.assertIn('BF-2,Bench 2,bench-2,Seating,Teak,100.00', content)
+        inventory = b''.join(self.client.get('/inventory/export.jsonl').streaming_content).splitlines()
+        self.assertEqual(json.loads(inventory[2])['available_quantity'], 2)
+
+    def test_unknown_format_is_404(self):
+        self.assertEqual(self.client.get('/products/export.xml').status_code, 404)
+
+    def test_impossible_dates_are_400(self):
+        response = self.client.get('/orders/export.csv', {'start_date': '2024-02-30', 'end_date': '2024-03-01'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/orders/export.csv', {'end_date': '03/01/2024'}).status_code, 400)
+
+    def test_date_bounds_include_whole_days(self):
+        Order.objects.filter(pk=Order.objects.order_by('pk')[0].pk).update(
+            created_at=timezone.now() - timedelta(days=3)
+        )
+        today = timezone.localdate().isoformat()
+
+        def count(**dates):
+            response = self.client.get('/orders/export.jsonl', dates)
+            return len(b''.join(response.streaming_content).splitlines())
+
+        self.assertEqual(count(start_date=today, end_date=today), 2)
+        self.assertEqual(count(start_date=today), 2)
+        self.assertEqual(count(end_date=(timezone.localdate() - timedelta(days=1)).isoformat()), 1)
+
+    def test_csv_escapes_formulas(self):
+        Product.objects.filter(pk=self.products[0].pk).update(name='=HYPERLINK("http://x")')
+        Product.objects.filter(pk=self.products[1].pk).update(name='-2+3', sale_price=Decimal('-1.00'))
+        content = b''.join(self.client.get('/products/export.csv').streaming_content).decode()
+        self.assertIn('"\'=HYPERLINK(""http://x"")"', content)
+        self.assertIn("'-2+3,bench-1,Seating,Teak,100.00,-1.00", content)
+
+
+class ProductImportTests(TestCase):
+    header = 'sku,name,description,category,material,price,weight,width,height,depth,featured\n'
+
+    def setUp(self):
+        self.products = create_catalog()
+
+    def run_import(self, rows, fmt='csv', **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return import_products(io.StringIO(rows), fmt, **kwargs)
+
+    def test_upsert_by_sku(self):
+        result = self.run_import(
+            self.header
+            + 'BF-0,Bench Zero,Renamed,seating,TEAK,150.00,10,120,80,50,yes\n'
+            + 'NEW-1,Bench 1,New bench,Seating,Teak,99.50,8,100,80,45,\n'
+        )
+        self.assertEqual((result.created, result.updated, result.errors), (1, 1, []))
+        updated = Product.objects.get(sku='BF-0')
+        self.assertEqual((updated.name, updated.slug, updated.price, updated.featured),
+                         ('Bench Zero', 'bench-0', Decimal('150.00'), True))
+        # "bench-1" is already taken by BF-1
+        self.assertEqual(Product.objects.get(sku='NEW-1').slug, 'bench-1-2')
+        self.assertEqual(Product.objects.count(), 4)
+
+    def test_rejected_rows_are_reported_by_line(self):
+        result = self.run_import(
+            self.header
+            + 'X-1,Chair,Chair,Tables,Teak,abc,1,1,1,1,\n'
+            + 'X-2,,Chair,Seating,Teak,10,1,1,1,1,\n'
+            + 'X-3,Chair,Chair,Seating,Teak,10,1,1,1,1,maybe\n'
+            + 'X-4,Chair,Chair,Seating,Teak,10,1,1,1,1,\n'
+        )
+        self.assertEqual(result.created, 1)
+        self.assertEqual([line for line, message in result.errors], [2, 3, 4])
+        self.assertIn('no category named "Tables"', result.errors[0][1])
+        self.assertIn('price', result.errors[0][1])
+        self.assertEqual(result.errors[1][1], 'Missing name.')
+
+    def test_jsonl_slugs_unique_across_batches(self):
+        rows = ''.join(
+            json.dumps({'sku': f'J-{i}', 'name': 'Lounger', 'description': 'x', 'category': 'Seating',
+                        'material': 'Teak', 'price': 10, 'weight': 1, 'width': 1, 'height': 1, 'depth': 1}) + '\n'
+            for i in range(5)
+        ) + 'not json\n'
+        result = self.run_import(rows, 'jsonl', batch_size=2)
+        self.assertEqual(result.created, 5)
+        self.assertEqual(result.errors[0][0], 6)
+        self.assertEqual(
+            sorted(Product.objects.filter(sku__startswith='J-').values_list('slug', flat=True)),
+            ['lounger', 'lounger-2', 'lounger-3', 'lounger-4', 'lounger-5'],
+        )
+
+    def test_import_refreshes_search_and_dashboard(self):
+        self.assertEqual(get_dashboard_metrics()['total_products'], 3)
+        self.run_import(self.header + 'NEW-1,Hammock,Rope hammock,Seating,Teak,80,3,200,1,100,\n')
+        self.assertEqual(get_dashboard_metrics()['total_products'], 4)
+        self.assertEqual(get_search_backend().search('hammock'), [Product.objects.get(sku='NEW-1').pk])
+
+    def test_admin_upload(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        upload = io.BytesIO((self.header + 'NEW-1,Hammock,Rope,Seating,Teak,80,3,200,1,100,\n').encode())
+        upload.name = 'catalog.csv'
+        response = self.client.post('/admin/backend/product/import/', {'file': upload})
+        self.assertContains(response, 'Created 1 and updated 0 products')
+        self.assertTrue(Product.objects.filter(sku='NEW-1').exists())
+
+    def test_admin_upload_requires_add_and_change(self):
+        self.client.force_login(User.objects.create_user('clerk', 'clerk@example.com', 'pw', is_staff=True))
+        self.assertEqual(self.client.get('/admin/backend/product/import/').status_code, 403)
+
+
+def image_upload(name, size, mode='RGB', fmt='JPEG'):
+    buffer = io.BytesIO()
+    Image.new(mode, size, 'green').save(buffer, fmt)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(MEDIA_ROOT=self.media_root, IMAGE_WORKERS=0, IMAGE_DERIVATIVE_WIDTHS=(320, 640))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.product = create_catalog(1)[0]
+
+    def upload(self, name, size, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ProductImage.objects.create(product=self.product, image=image_upload(name, size, **kwargs),
+                                                alt_text='Bench')
+        image.refresh_from_db()
+        return image
+
+    def test_upload_builds_width_buckets(self):
+        image = self.upload('bench.jpg', (1000, 500))
+        derivatives = image.image_derivatives
+        self.assertEqual((derivatives['source'], derivatives['width'], derivatives['height']),
+                         (image.image.name, 1000, 500))
+        self.assertEqual(sorted(derivatives['formats']), ['image/jpeg', 'image/webp'])
+        with Image.open(f"{self.media_root}/{derivatives['formats']['image/webp']['320']}") as small:
+            self.assertEqual((small.format, small.size), ('WEBP', (320, 160)))
+
+        html = Template('{% load images %}{% responsive_image image sizes="50vw" %}').render(Context({'image': image}))
+        self.assertIn('type="image/webp" srcset="/media/derivatives/', html)
+        self.assertIn('320w, /media/derivatives/', html)
+        self.assertIn('width="1000" height="500" alt="Bench"', html)
+
+    def test_identical_uploads_share_files_and_small_images_keep_their_size(self):
+        first = self.upload('a.png', (200, 100), mode='RGBA', fmt='PNG')
+        second = self.upload('b.png', (200, 100), mode='RGBA', fmt='PNG')
+        self.assertEqual(first.image_derivatives['formats'], second.image_derivatives['formats'])
+        self.assertEqual(list(first.image_derivatives['formats']['image/png']), ['200'])
+
+    def test_failed_and_oversized_images_are_left_for_the_command(self):
+        with override_settings(IMAGE_MAX_PIXELS=1000 * 499), self.assertLogs('backend.images', 'ERROR'):
+            image = self.upload('huge.jpg', (1000, 500))
+        self.assertEqual(image.image_derivatives, {})
+
+        call_command('generate_image_derivatives', stdout=io.StringIO())
+        image.refresh_from_db()
+        self.assertEqual(image.image_derivatives['source'], image.image.name)
+
+    @override_settings(IMAGE_MAX_PIXELS=1000 * 499)
+    def test_review_image_form_rejects_oversized_uploads(self):
+        form = ReviewImageForm(files={'images': image_upload('huge.jpg', (1000, 500))})
+        self.assertIn('at most 499,000 pixels', form.errors['images'][0])
+        self.assertTrue(ReviewImageForm(files={'images': image_upload('ok.jpg', (998, 500))}).is_valid())
+
+    @override_settings(IMAGE_MAX_PIXELS=1000 * 499)
+    def test_catalog_image_forms_reject_oversized_uploads(self):
+        forms = [
+            (ProductImageForm, {'alt_text': 'Bench', 'display_order': 0}),
+            (ProductVariantForm, {'color': 'Green', 'color_code': '#00ff00', 'price_adjustment': '0'}),
+            (CategoryForm, {'name': 'Loungers', 'is_active': True}),
+        ]
+        for form_class, data in forms:
+            with self.subTest(form_class.__name__):
+                form = form_class(data, files={'image': image_upload('huge.jpg', (1000, 500))})
+                self.assertIn('at most 499,000 pixels', form.errors['image'][0])
+                form = form_class(data, files={'image': image_upload('ok.jpg', (998, 500))})
+                self.assertTrue(form.is_valid(), form.errors)
+
+    def test_tag_falls_back_to_original_until_processed(self):
+        image = ProductImage(product=self.product, image='products/raw.jpg', alt_text='Raw')
+        html = Template('{% load images %}{% responsive_image image %}').render(Context({'image': image}))
+        self.assertEqual(html, '<img src="/media/products/raw.jpg" alt="Raw" loading="lazy">')
+
+
+class PrimaryImageTests(TestCase):
+    def setUp(self):
+        self.products = create_catalog()
+        self.product = self.products[0]
+
+    def add_image(self, name, **kwargs):
+        return ProductImage.objects.create(product=self.product, image=f'products/{name}', alt_text=name, **kwargs)
+
+    def test_primary_image_follows_image_writes(self):
+        first = self.add_image('first.jpg', display_order=2)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.primary_image, first)
+
+        second = self.add_image('second.jpg', is_primary=True)
+        first.is_primary = True
+        first.save()
+        second.refresh_from_db()
+        self.product.refresh_from_db()
+        # Only one image stays primary, as in ProductImageFormSet
+        self.assertFalse(second.is_primary)
+        self.assertEqual(self.product.primary_image, first)
+
+        first.delete()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.primary_image, second)
+        second.delete()
+        self.product.refresh_from_db()
+        self.assertIsNone(self.product.primary_image)
+
+    @mock.patch('backend.signals.schedule_derivatives')
+    def test_recent_products_follow_the_primary_image(self, schedule_derivatives):
+        cache.clear()
+
+        def recent_image():
+            recent = {product.pk: product for product in get_dashboard_metrics()['recent_products']}
+            image = recent[self.product.pk].primary_image
+            return image and (image.image.name, image.image_derivatives)
+
+        self.assertIsNone(recent_image())
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.add_image('first.jpg')
+        self.assertEqual(recent_image(), ('products/first.jpg', {}))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.image_derivatives = {'source': 'products/first.jpg'}
+            first.save(update_fields=['image_derivatives', 'updated_at'])
+        self.assertEqual(recent_image(), ('products/first.jpg', {'source': 'products/first.jpg'}))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second = self.add_image('second.jpg', is_primary=True)
+        self.assertEqual(recent_image()[0], 'products/second.jpg')
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertEqual(recent_image()[0], 'products/first.jpg')
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertIsNone(recent_image())
+
+    def test_listing_reads_images_without_extra_queries(self):
+        for product in self.products:
+            ProductImage.objects.create(product=product, image='products/x.jpg', alt_text='x', is_primary=True)
+        with self.assertNumQueries(1):
+            names = [product.primary_image.image.name for product in Product.objects.with_primary_image()
+                     if product.primary_image]
+        self.assertEqual(len(names), 3)
+
+
+class StaticFilesTests(TestCase):
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_root)
+        settings = override_settings(
+            STATIC_ROOT=self.static_root,
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        with open(f'{self.static_root}/staticfiles.json') as manifest:
+            self.stylesheet = json.load(manifest)['paths']['css/style.css']
+
+    def get(self, path, **headers):
+        def app(environ, start_response):
+            start_response('404 Not Found', [])
+            return [b'django']
+
+        response = {}
+
+        def start_response(status, headers):
+            response.update(status=status, headers=dict(headers))
+
+        environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, **headers}
+        body = b''.join(StaticFilesWSGIHandler(app)(environ, start_response))
+        return response['status'], response['headers'], body
+
+    def test_collectstatic_writes_hashed_and_gzipped_files(self):
+        self.assertRegex(self.stylesheet, r'^css/style\.[0-9a-f]{12}\.css$')
+        with open(f'{self.static_root}/{self.stylesheet}', 'rb') as original:
+            with gzip.open(f'{self.static_root}/{self.stylesheet}.gz') as compressed:
+                self.assertEqual(compressed.read(), original.read())
+
+    def test_handler_serves_precompressed_immutable_files(self):
+        status, headers, body = self.get(f'/static/{self.stylesheet}', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(headers['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertIn(b'.hero {', gzip.decompress(body))
+
+        status, headers, body = self.get(f'/static/{self.stylesheet}', HTTP_IF_NONE_MATCH=headers['ETag'])
+        self.assertEqual((status, body), ('304 Not Modified', b''))
+        # Unhashed names may change with the next deploy
+        self.assertEqual(self.get('/static/css/style.css')[1]['Cache-Control'], 'public, max-age=60')
+        self.assertEqual(self.get('/static/missing.css')[2], b'django')
+
+    def test_accept_encoding_q_values(self):
+        static_file = StaticFile(f'{self.static_root}/{self.stylesheet}', self.stylesheet, immutable=True)
+
+        def encoding(header):
+            return dict(static_file.select(header)[1]).get('Content-Encoding')
+
+        self.assertEqual(encoding('GZIP;Q=0.5'), 'gzip')
+        self.assertEqual(encoding('*'), 'gzip')
+        self.assertIsNone(encoding('gzip;q=0, deflate'))
+        self.assertIsNone(encoding('*;q=0'))
+        self.assertIsNone(encoding('identity, gzip;q=bad'))
+
+        static_file.encodings = [('br', 'style.css.br', 10), ('gzip', 'style.css.gz', 12)]
+        self.assertEqual(encoding('gzip, br'), 'br')
+        self.assertEqual(encoding('gzip, br;q=0.5'), 'gzip')
+        self.assertEqual(encoding('br;q=0, *'), 'gzip')
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRoutingTests(SimpleTestCase):
+    def request(self, view, method='get', **cookies):
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies)
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            return view(request)
+        middleware = ReplicaRoutingMiddleware(get_response)
+        return middleware(request)
+
+    @staticmethod
+    def read_alias(request):
+        return HttpResponse(f'{router.db_for_read(Product)} {router.db_for_read(User)}')
+
+    def test_marked_views_read_shop_models_from_replica(self):
+        marked = replica_reads(lambda request: self.read_alias(request))
+        self.assertEqual(self.request(marked).content, b'replica1 default')
+        self.assertEqual(self.request(self.read_alias).content, b'default default')
+        self.assertEqual(router.db_for_read(Product), 'default')
+
+    def test_writes_pin_the_visitor_to_the_primary(self):
+        view = replica_reads(lambda request: self.read_alias(request))
+        response = self.request(view, method='post')
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 15)
+        self.assertEqual(self.request(view, **{PIN_COOKIE: '1'}).content, b'default default')
+
+    def test_writes_and_migrations_stay_on_primary(self):
+        product = Product(pk=1)
+        product._state.db = 'replica1'
+        self.assertEqual(router.db_for_write(Product, instance=product), 'default')
+        category = Category(pk=1)
+        category._state.db = 'default'
+        self.assertTrue(router.allow_relation(product, category))
+        self.assertFalse(router.allow_migrate('replica1', 'backend'))
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Copies the database into an SQLite replica file')
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class SQLiteReplicaCacheTests(TransactionTestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        # The alias settings.py adds for a SQLITE_REPLICAS file
+        cls.directory = tempfile.mkdtemp()
+        default = connections.settings['default']
+        connections.settings['replica1'] = {
+            **default, 'NAME': f'{cls.directory}/replica1.sqlite3', 'TEST': {**default['TEST'], 'MIRROR': 'default'},
+        }
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica1'].close()
+        del connections['replica1']
+        del connections.settings['replica1']
+        shutil.rmtree(cls.directory)
+
+    def setUp(self):
+        cache.clear()
+        self.products = create_catalog(2)
+        self.assertEqual(sync_sqlite_replicas(), ['replica1'])
+
+    def lag_behind(self):
+        """Write to the primary only, as if replication had not caught up"""
+        product = self.products[0]
+        product.name = 'Teak Bench'
+        product.save()
+        Product.objects.create(
+            name='Lounger', slug='lounger', description='Sun lounger', category=product.category,
+            material=product.material, price=Decimal('300.00'), weight=10, width=60, height=40, depth=190,
+            sku='BF-L',
+        )
+        with reading_from('replica1'):
+            self.assertEqual(Product.objects.count(), 2)
+
+    def test_dashboard_fills_from_the_primary(self):
+        with reading_from('replica1'):
+            self.assertEqual(get_dashboard_metrics()['total_products'], 2)
+        self.lag_behind()
+        with reading_from('replica1'):
+            metrics = get_dashboard_metrics()
+        self.assertEqual(metrics['total_products'], 3)
+        self.assertEqual(metrics['recent_products'][0].name, 'Lounger')
+
+        # A counter seeded while the replica lags starts from the primary's count
+        cache.clear()
+        with reading_from('replica1'):
+            self.assertEqual(get_dashboard_metrics()['total_products'], 3)
+
+    def test_pages_fill_from_the_primary(self):
+        @cache_anonymous_page()
+        def view(request, pk):
+            add_cache_tags(request, product_tag(pk))
+            return HttpResponse(Product.objects.get(pk=pk).name)
+
+        def get(pk):
+            request = RequestFactory().get(f'/shop/product/{pk}/')
+            request.user = AnonymousUser()
+            with reading_from('replica1'):
+                return view(request, pk)
+
+        self.assertContains(get(self.products[0].pk), 'Bench 0')
+        self.lag_behind()
+        self.assertContains(get(self.products[0].pk), 'Teak Bench')
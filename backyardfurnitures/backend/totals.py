@@ -0,0 +1,104 @@
+"""
+Cart totals.
+
+Subtotal, discount, tax, shipping and total are computed with quantized
+Decimal arithmetic over ``values()`` rows, never float, and never by
+loading full model instances.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+from .models import CartItem
+from .pricing import price_cart
+
+
+TAX_RATE = Decimal('0.07')
+
+SHIPPING_RATES = {
+    'standard': Decimal('10.00'),
+    'express': Decimal('25.00'),
+}
+
+CENT = Decimal('0.01')
+
+ZERO = Decimal('0.00')
+
+LINE_FIELDS = (
+    'cart_id', 'product_id', 'variant_id', 'quantity', 'product__category_id',
+    'product__price', 'product__sale_price', 'variant__price_adjustment',
+)
+
+# Cart item rows fetched per round trip by batch_cart_totals
+BATCH_CHUNK_SIZE = 5000
+
+
+def money(amount):
+    return Decimal(amount).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+class CartTotals:
+    def __init__(self, lines, subtotal, discount, tax, shipping, promotion=None):
+        self.lines = lines
+        self.subtotal = subtotal
+        self.discount = discount
+        self.tax = tax
+        self.shipping = shipping
+        self.total = subtotal - discount + shipping + tax
+        self.promotion = promotion
+
+
+def line_from_row(row):
+    """Turn a CartItem ``values()`` row into a pricing line"""
+    return {
+        'product_id': row['product_id'],
+        'variant_id': row['variant_id'],
+        'category_id': row['product__category_id'],
+        'quantity': row['quantity'],
+        'price': row['product__price'],
+        'sale_price': row['product__sale_price'],
+        'price_adjustment': row['variant__price_adjustment'],
+    }
+
+
+def calculate_totals(lines, shipping_method=None, promo_code=None):
+    """Totals for already projected lines, see ``line_from_row``"""
+    pricing = price_cart(lines, code=promo_code)
+    subtotal = money(pricing.subtotal)
+    discount = money(pricing.discount)
+    shipping = SHIPPING_RATES.get(shipping_method, ZERO)
+    tax = money((subtotal - discount) * TAX_RATE)
+    return CartTotals(pricing.lines, subtotal, discount, tax, shipping, pricing.promotion)
+
+
+def cart_lines(cart):
+    return [line_from_row(row) for row in CartItem.objects.filter(cart=cart).values(*LINE_FIELDS)]
+
+
+def cart_totals(cart, shipping_method=None, promo_code=None):
+    """Totals for one cart with a single projected query"""
+    return calculate_totals(cart_lines(cart), shipping_method, promo_code)
+
+
+def batch_cart_totals(cart_ids, shipping_method=None):
+    """
+    Totals for many carts, e.g. for order recalculation jobs. Cart items are
+    streamed in cart order so only one cart's lines are held at a time.
+    Carts without items are left out of the result.
+    """
+    results = {}
+    current_cart, lines = None, []
+    rows = (
+        CartItem.objects
+        .filter(cart_id__in=cart_ids)
+        .order_by('cart_id')
+        .values(*LINE_FIELDS)
+        .iterator(chunk_size=BATCH_CHUNK_SIZE)
+    )
+    for row in rows:
+        if row['cart_id'] != current_cart:
+            if lines:
+                results[current_cart] = calculate_totals(lines, shipping_method)
+            current_cart, lines = row['cart_id'], []
+        lines.append(line_from_row(row))
+    if lines:
+        results[current_cart] = calculate_totals(lines, shipping_method)
+    return results
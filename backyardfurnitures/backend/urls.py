@@ -9,6 +9,7 @@ urlpatterns = [
     
     # Product URLs
     path('products/', views.ProductListView.as_view(), name='product_list'),
+    path('products/export.<str:fmt>', views.product_export, name='product_export'),
     path('products/<int:pk>/', views.ProductDetailView.as_view(), name='product_detail'),
     path('products/create/', views.ProductCreateView.as_view(), name='product_create'),
     path('products/<int:pk>/update/', views.ProductUpdateView.as_view(), name='product_update'),
@@ -23,11 +24,13 @@ urlpatterns = [
     
     # Inventory URLs
     path('inventory/', views.InventoryListView.as_view(), name='inventory_list'),
+    path('inventory/export.<str:fmt>', views.inventory_export, name='inventory_export'),
     path('inventory/<int:pk>/update/', views.InventoryUpdateView.as_view(), name='inventory_update'),
     path('inventory/<int:pk>/adjust/', views.adjust_inventory, name='adjust_inventory'),
     
     # Order URLs
     path('orders/', views.OrderListView.as_view(), name='order_list'),
+    path('orders/export.<str:fmt>', views.order_export, name='order_export'),
     path('orders/<int:pk>/', views.OrderDetailView.as_view(), name='order_detail'),
     path('orders/create/', views.OrderCreateView.as_view(), name='order_create'),
     path('orders/<int:pk>/update/', views.OrderUpdateView.as_view(), name='order_update'),
@@ -5,11 +5,13 @@ from django.views.generic.edit import FormView
 from django.urls import reverse_lazy, reverse
 from django.contrib import messages
 from django.contrib.auth.mixins import PermissionRequiredMixin
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth.decorators import login_required, permission_required
 from django.db.models import Q, Count, Avg, Sum
-from django.http import JsonResponse, HttpResponseRedirect
+from django.http import Http404, JsonResponse, HttpResponseBadRequest, HttpResponseRedirect
 from django.core.paginator import Paginator
 from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.decorators import method_decorator
 from django.db import models
 
 
@@ -19,10 +21,29 @@ from .models import (
     ProductReview, Supplier, Promotion, Wishlist, WishlistItem,
     Cart, CartItem
 )
+from .availability import get_available_quantities, get_available_quantity
+from .categories import get_category_tree
+from .checkout import EmptyCart, PromotionUnavailable, place_order
+from .dashboard import get_dashboard_metrics
+from .exports import export_inventory, export_orders, export_products
+from .facets import FACET_PARAMS, PRICE_BUCKETS, FacetSelection, get_facet_counts
+from .inventory import (
+    MOVEMENT_ADD, MOVEMENT_REMOVE, InsufficientStock, adjust_stock
+)
+from .pagecache import (
+    CATALOG_TAG, CATEGORIES_TAG, MATERIALS_TAG, PROMOTIONS_TAG,
+    add_cache_tags, cache_anonymous_page, category_tag, product_tag, promotion_tag
+)
+from .pagination import KeysetPaginationMixin, paginate
+from .related import related_products_for
+from .replicas import replica_reads
+from .search import rank_search_results, search_products
+from .totals import cart_totals
 
 def signupview(request):
     return render(request,'backend/auth/login.html')
 
+@cache_anonymous_page()
 def homeview(request):
     return render(request,'backend/hero.html')
 
@@ -30,6 +51,7 @@ def homeview(request):
 from .forms import *
 
 # Dashboard Views
+@method_decorator(replica_reads, name='dispatch')
 class DashboardView( ListView):
     """Main dashboard view for the system"""
     template_name = 'backend/dashboard.html'
@@ -38,24 +60,17 @@ class DashboardView( ListView):
     context_object_name = 'products'
 
     def get_queryset(self):
-        return Product.objects.all().order_by('-created_at')[:5]
+        self.metrics = get_dashboard_metrics()
+        return self.metrics['recent_products']
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['total_products'] = Product.objects.count()
-        context['total_orders'] = Order.objects.count()
-        context['recent_orders'] = Order.objects.all().order_by('-created_at')[:5]
-        context['low_stock_items'] = (
-            Inventory.objects
-            .filter(quantity__lte=models.F('reorder_point'))
-            .select_related('product', 'warehouse')
-            .order_by('product__name')
-        )
+        context.update(self.metrics)
         return context
 
 
 # Product Views
-class ProductListView( ListView):
+class ProductListView(KeysetPaginationMixin, ListView):
     """List all products"""
     model = Product
     template_name = 'backend/products/list.html'
@@ -63,16 +78,12 @@ class ProductListView( ListView):
     paginate_by = 10
 
     def get_queryset(self):
-        queryset = Product.objects.all()
+        queryset = Product.objects.with_primary_image()
         
         # Filter by search query
         search_query = self.request.GET.get('q')
         if search_query:
-            queryset = queryset.filter(
-                Q(name__icontains=search_query) | 
-                Q(description__icontains=search_query) |
-                Q(sku__icontains=search_query)
-            )
+            queryset = search_products(queryset, search_query)
         
         # Filter by category
         category_id = self.request.GET.get('category')
@@ -85,8 +96,10 @@ class ProductListView( ListView):
             queryset = queryset.filter(material_id=material_id)
             
         # Sort options
-        sort = self.request.GET.get('sort', 'name')
-        if sort == 'price_low':
+        sort = self.request.GET.get('sort', 'relevance' if search_query else 'name')
+        if sort == 'relevance' and search_query:
+            queryset = rank_search_results(queryset, search_query).order_by('search_rank', 'name')
+        elif sort == 'price_low':
             queryset = queryset.order_by('price')
         elif sort == 'price_high':
             queryset = queryset.order_by('-price')
@@ -104,6 +117,12 @@ class ProductListView( ListView):
         return context
 
 
+@permission_required('backend.view_product', raise_exception=True)
+def product_export(request, fmt):
+    """Stream every product as CSV or JSON Lines"""
+    return export_products(fmt)
+
+
 class ProductDetailView( DetailView):
     """Show product details"""
     model = Product
@@ -112,7 +131,7 @@ class ProductDetailView( DetailView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        product = self.get_object()
+        product = self.object
         context['images'] = product.images.all()
         context['variants'] = product.variants.all()
         context['inventory'] = (
@@ -121,9 +140,7 @@ class ProductDetailView( DetailView):
             .select_related('warehouse')
         )
         context['reviews'] = product.reviews.select_related('customer__user').all()
-        context['avg_rating'] = (
-            product.reviews.aggregate(Avg('rating'))['rating__avg'] or 0
-        )
+        context['avg_rating'] = product.rating_average
         return context
 
 
@@ -177,6 +194,7 @@ class ProductDeleteView( DeleteView):
 
 
 # Category Views
+@method_decorator(replica_reads, name='dispatch')
 class CategoryListView( ListView):
     """List all categories"""
     model = Category
@@ -195,8 +213,8 @@ class CategoryDetailView( DetailView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        category = self.get_object()
-        context['products'] = Product.objects.filter(category=category)
+        category = self.object
+        context['products'] = Product.objects.filter(category=category).select_related('material')
         return context
 
 
@@ -241,7 +259,7 @@ class CategoryDeleteView( DeleteView):
 
 
 # Inventory Views
-class InventoryListView( ListView):
+class InventoryListView(KeysetPaginationMixin, ListView):
     """List inventory across all warehouses"""
     model = Inventory
     template_name = 'backend/inventory/list.html'
@@ -260,7 +278,7 @@ class InventoryListView( ListView):
         # Filter by stock status
         stock_status = self.request.GET.get('status')
         if stock_status == 'low':
-            queryset = queryset.filter(quantity__lte=models.F('reorder_point'))
+            queryset = queryset.low_stock()
         elif stock_status == 'out':
             queryset = queryset.filter(quantity=0)
         
@@ -272,7 +290,7 @@ class InventoryListView( ListView):
                 Q(product__sku__icontains=search)
             )
             
-        return queryset
+        return queryset.order_by('product__name')
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -290,6 +308,12 @@ class InventoryUpdateView( UpdateView):
 
 
 
+@permission_required('backend.view_inventory', raise_exception=True)
+def inventory_export(request, fmt):
+    """Stream every inventory row as CSV or JSON Lines"""
+    return export_inventory(fmt)
+
+
 def adjust_inventory(request, pk):
     """Add or subtract from inventory"""
     inventory = get_object_or_404(Inventory, pk=pk)
@@ -297,20 +321,28 @@ def adjust_inventory(request, pk):
     if request.method == 'POST':
         action = request.POST.get('action')
         quantity = int(request.POST.get('quantity', 0))
+        reason = request.POST.get('reason', '')
+        user = request.user if request.user.is_authenticated else None
         
-        if action == 'add':
-            inventory.quantity += quantity
-            inventory.last_restock_date = timezone.now().date()
-            messages.success(request, f'Added {quantity} items to inventory.')
-        elif action == 'subtract':
-            if quantity > inventory.quantity:
-                messages.error(request, 'Cannot remove more than available quantity.')
-            else:
-                inventory.quantity -= quantity
+        # 'subtract' is the older name of the remove action
+        if action == 'subtract':
+            action = MOVEMENT_REMOVE
+        
+        try:
+            adjust_stock(inventory.pk, action, quantity, reason=reason, user=user)
+        except InsufficientStock:
+            messages.error(request, 'Cannot remove more than available quantity.')
+        except ValueError:
+            messages.error(request, 'Invalid inventory adjustment.')
+        else:
+            if action == MOVEMENT_ADD:
+                messages.success(request, f'Added {quantity} items to inventory.')
+            elif action == MOVEMENT_REMOVE:
                 messages.success(request, f'Removed {quantity} items from inventory.')
+            else:
+                messages.success(request, f'Inventory set to {quantity} items.')
         
-        inventory.save()
-        return redirect('inventory_detail', pk=inventory.pk)
+        return redirect('inventory_list')
     
     return render(request, 'backend/inventory/adjust.html', {
         'inventory': inventory
@@ -318,7 +350,7 @@ def adjust_inventory(request, pk):
 
 
 # Order Views
-class OrderListView( ListView):
+class OrderListView(KeysetPaginationMixin, ListView):
     """List all orders"""
     model = Order
     template_name = 'backend/orders/list.html'
@@ -334,11 +366,14 @@ class OrderListView( ListView):
         if status:
             queryset = queryset.filter(status=status)
         
-        # Filter by date range
-        start_date = self.request.GET.get('start_date')
-        end_date = self.request.GET.get('end_date')
-        if start_date and end_date:
-            queryset = queryset.filter(created_at__range=[start_date, end_date])
+        # Filter by date range, whole days, either bound optional
+        for param, lookup in (('start_date', 'created_at__date__gte'), ('end_date', 'created_at__date__lte')):
+            try:
+                day = parse_date(self.request.GET.get(param) or '')
+            except ValueError:
+                day = None
+            if day:
+                queryset = queryset.filter(**{lookup: day})
         
         # Search
         search = self.request.GET.get('q')
@@ -362,8 +397,8 @@ class OrderDetailView( DetailView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        order = self.get_object()
-        context['items'] = order.items.select_related('product').all()
+        order = self.object
+        context['items'] = order.items.select_related('product', 'variant').all()
         context['status_history'] = order.status_history.all().order_by('-timestamp')
         return context
 
@@ -417,8 +452,25 @@ def update_order_status(request, pk):
     })
 
 
+@permission_required('backend.view_order', raise_exception=True)
+def order_export(request, fmt):
+    """Stream every order with its lines, optionally filtered like the order list"""
+    dates = {}
+    for param in ('start_date', 'end_date'):
+        value = request.GET.get(param) or ''
+        try:
+            dates[param] = parse_date(value)
+        except ValueError:
+            # Well formed but impossible, e.g. 2024-02-30
+            dates[param] = None
+        if value and dates[param] is None:
+            return HttpResponseBadRequest(f'{param} must be a valid YYYY-MM-DD date.')
+    start_date, end_date = dates['start_date'], dates['end_date']
+    return export_orders(fmt, status=request.GET.get('status'), start_date=start_date, end_date=end_date)
+
+
 # Customer Views
-class CustomerListView( ListView):
+class CustomerListView(KeysetPaginationMixin, ListView):
     """List all customers"""
     model = Customer
     template_name = 'backend/customers/list.html'
@@ -451,7 +503,7 @@ class CustomerDetailView( DetailView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        customer = self.get_object()
+        customer = self.object
         context['orders'] = Order.objects.filter(customer=customer).order_by('-created_at')
         context['reviews'] = ProductReview.objects.filter(customer=customer).select_related('product')
         context['addresses'] = customer.addresses.all()
@@ -468,16 +520,22 @@ class CustomerDetailView( DetailView):
 
 
 # Frontend Views (for customers)
+@replica_reads
+@cache_anonymous_page()
 def home(request):
     """Homepage view showing featured products"""
-    featured_products = Product.objects.filter(featured=True, is_active=True)[:8]
-    new_arrivals = Product.objects.filter(is_active=True).order_by('-created_at')[:8]
+    featured_products = list(Product.objects.with_primary_image().filter(featured=True, is_active=True)[:8])
+    new_arrivals = list(Product.objects.with_primary_image().filter(is_active=True).order_by('-created_at')[:8])
     
-    current_promotions = Promotion.objects.filter(
+    current_promotions = list(Promotion.objects.filter(
         is_active=True,
         start_date__lte=timezone.now(),
         end_date__gte=timezone.now()
-    )[:3]
+    )[:3])
+    
+    add_cache_tags(request, CATALOG_TAG, PROMOTIONS_TAG)
+    add_cache_tags(request, *(product_tag(product.id) for product in featured_products + new_arrivals))
+    add_cache_tags(request, *(promotion_tag(promotion.id) for promotion in current_promotions))
     
     return render(request, 'backend/frontend/home.html', {
         'featured_products': featured_products,
@@ -486,68 +544,87 @@ def home(request):
     })
 
 
+@replica_reads
+@cache_anonymous_page(params=FACET_PARAMS + ('sort', 'page', 'cursor'))
 def shop(request):
     """Product listing page with filters"""
-    products = Product.objects.filter(is_active=True)
+    products = Product.objects.with_primary_image().filter(is_active=True)
     
-    # Filter by category
+    # Search
+    search_query = request.GET.get('q')
+    if search_query:
+        products = search_products(products, search_query)
+    
+    # Category (with its subcategories), material, price and feature filters
+    category_tree = get_category_tree()
     category_slug = request.GET.get('category')
-    if category_slug:
-        category = get_object_or_404(Category, slug=category_slug)
-        products = products.filter(category=category)
-    
-    # Filter by material
-    material_id = request.GET.get('material')
-    if material_id:
-        products = products.filter(material_id=material_id)
-    
-    # Filter by price range
-    min_price = request.GET.get('min_price')
-    max_price = request.GET.get('max_price')
-    if min_price:
-        products = products.filter(price__gte=min_price)
-    if max_price:
-        products = products.filter(price__lte=max_price)
-        
+    selection = FacetSelection(request.GET, category_tree)
+    if category_slug and selection.category is None:
+        raise Http404('No category matches the given query.')
+    # The sidebar counts every category whatever is selected, so any product change can alter the page
+    add_cache_tags(request, CATALOG_TAG)
+    
+    # Sidebar counts are taken before the filters narrow the products
+    facets = get_facet_counts(products, selection, category_tree)
+    products = selection.filter(products)
+    
     # Sort options
     sort = request.GET.get('sort', 'default')
-    if sort == 'price_low':
+    if sort == 'default' and search_query:
+        products = rank_search_results(products, search_query).order_by('search_rank', 'name')
+    elif sort == 'price_low':
         products = products.order_by('price')
     elif sort == 'price_high':
         products = products.order_by('-price')
     elif sort == 'newest':
         products = products.order_by('-created_at')
     elif sort == 'popular':
-        products = products.annotate(order_count=Count('orderitem')).order_by('-order_count')
+        products = products.order_by('-units_sold')
     elif sort == 'rating':
-        products = products.annotate(avg_rating=Avg('reviews__rating')).order_by('-avg_rating')
-    
-    # Pagination
-    paginator = Paginator(products, 12)
-    page = request.GET.get('page')
-    products = paginator.get_page(page)
-    
-    categories = Category.objects.filter(is_active=True)
-    materials = Material.objects.all()
+        products = products.order_by('-rating_average', '-review_count')
+    
+    # Pagination (?cursor= switches to keyset pagination)
+    paginator, products = paginate(request, products, 12)
+    
+    # Stock badges for the cards on this page
+    availability = get_available_quantities(product.id for product in products)
+    for product in products:
+        product.available_quantity = availability.get(product.id)
+    add_cache_tags(request, CATEGORIES_TAG, MATERIALS_TAG, *(product_tag(product.id) for product in products))
+    
+    # Facet counts for the sidebar
+    categories = list(category_tree)
+    for node in categories:
+        node.product_count = facets['categories'].get(node.id, 0)
+    materials = list(Material.objects.all())
+    for material in materials:
+        material.product_count = facets['materials'].get(material.id, 0)
+    price_buckets = [
+        {'key': key, 'label': label, 'min_price': lower, 'max_price': upper, 'product_count': facets['price'][key]}
+        for key, label, lower, upper in PRICE_BUCKETS
+    ]
     
     return render(request, 'backend/frontend/shop.html', {
         'products': products,
         'categories': categories,
+        'category_tree': category_tree.roots,
         'materials': materials,
+        'search_query': search_query,
+        'facets': facets,
+        'price_buckets': price_buckets,
     })
 
 
+@replica_reads
+@cache_anonymous_page(params=('review_page',))
 def product_detail(request, slug):
     """Product detail page for customers"""
     product = get_object_or_404(Product, slug=slug, is_active=True)
     
-    # Get related products (same category)
-    related_products = (
-        Product.objects
-        .filter(category=product.category, is_active=True)
-        .exclude(id=product.id)
-        .order_by('?')[:4]
-    )
+    # Related products from the precomputed index
+    related_products = related_products_for(product)
+    add_cache_tags(request, product_tag(product.id), category_tag(product.category_id))
+    add_cache_tags(request, *(product_tag(related.id) for related in related_products))
     
     # Check if product is in user's wishlist
     in_wishlist = False
@@ -601,14 +678,11 @@ def add_to_cart(request, product_id):
         if variant_id:
             variant = get_object_or_404(ProductVariant, id=variant_id, product=product)
         
-        # Check inventory
-        try:
-            inventory = Inventory.objects.filter(product=product).first()
-            if inventory and inventory.available_quantity < quantity:
-                messages.error(request, f'Sorry, only {inventory.available_quantity} items available.')
-                return redirect('product_detail', slug=product.slug)
-        except Inventory.DoesNotExist:
-            pass
+        # Check stock across all active warehouses
+        available = get_available_quantity(product.id)
+        if available is not None and available < quantity:
+            messages.error(request, f'Sorry, only {available} items available.')
+            return redirect('product_detail', slug=product.slug)
         
         # Add to cart or update quantity
         cart_item, created = CartItem.objects.get_or_create(
@@ -636,7 +710,7 @@ def add_to_cart(request, product_id):
 def cart(request):
     """View shopping cart"""
     try:
-        customer = Customer.objects.get(user=request.user)
+        customer = Customer.objects.select_related('user').get(user=request.user)
         cart = Cart.objects.filter(customer=customer).first()
     except Customer.DoesNotExist:
         messages.error(request, 'Customer profile not found.')
@@ -645,49 +719,31 @@ def cart(request):
     if not cart:
         cart = Cart.objects.create(customer=customer)
     
-    cart_items = CartItem.objects.filter(cart=cart).select_related('product', 'variant')
-    
-    # Calculate totals
-    subtotal = sum(item.product.sale_price * item.quantity if item.product.sale_price 
-                   else item.product.price * item.quantity for item in cart_items)
-    
-    # Get applicable promotions
-    active_promotions = Promotion.objects.filter(
-        is_active=True,
-        start_date__lte=timezone.now(),
-        end_date__gte=timezone.now(),
-        minimum_order_value__lte=subtotal
-    )
+    # Related manager keeps item.cart cached for CartItem.__str__
+    cart.customer = customer
+    cart_items = cart.items.select_related('product', 'variant')
     
-    # Find best discount
-    best_discount = 0
-    best_promotion = None
+    # Stock for every line in one lookup
+    availability = get_available_quantities(item.product_id for item in cart_items)
+    for item in cart_items:
+        item.available_quantity = availability.get(item.product_id)
     
-    for promotion in active_promotions:
-        if promotion.discount_type == 'percentage':
-            discount = subtotal * (promotion.discount_value / 100)
-        else:
-            discount = promotion.discount_value
-            
-        if discount > best_discount:
-            best_discount = discount
-            best_promotion = promotion
+    # Promo codes entered on the cart page are kept for checkout
+    if request.method == 'POST' and 'promo_code' in request.POST:
+        request.session['promo_code'] = request.POST['promo_code'].strip()
     
-    # Calculate final totals
-    discount = best_discount
-    shipping = 0  # Simplified - would normally calculate based on location, weight, etc.
-    tax = subtotal * 0.07  # Simplified tax calculation (7%)
-    total = subtotal - discount + shipping + tax
+    # Shipping is calculated at checkout
+    totals = cart_totals(cart, promo_code=request.session.get('promo_code'))
     
     return render(request, 'backend/frontend/cart.html', {
         'cart': cart,
         'cart_items': cart_items,
-        'subtotal': subtotal,
-        'discount': discount,
-        'promotion': best_promotion,
-        'shipping': shipping,
-        'tax': tax,
-        'total': total,
+        'subtotal': totals.subtotal,
+        'discount': totals.discount,
+        'promotion': totals.promotion,
+        'shipping': totals.shipping,
+        'tax': totals.tax,
+        'total': totals.total,
     })
 
 
@@ -724,47 +780,24 @@ def checkout(request):
         shipping_address = get_object_or_404(Address, id=shipping_address_id)
         billing_address = get_object_or_404(Address, id=billing_address_id)
         
-        # Calculate totals (simplified)
-        cart_items = CartItem.objects.filter(cart=cart).select_related('product')
-        subtotal = sum(item.product.sale_price * item.quantity if item.product.sale_price 
-                      else item.product.price * item.quantity for item in cart_items)
-        
-        shipping_cost = 0
-        if shipping_method == 'standard':
-            shipping_cost = 10
-        elif shipping_method == 'express':
-            shipping_cost = 25
-            
-        tax = subtotal * 0.07  # 7% tax
-        total = subtotal + shipping_cost + tax
-        
-        # Create order
-        order = Order.objects.create(
-            customer=customer,
-            shipping_address=shipping_address,
-            billing_address=billing_address,
-            shipping_method=shipping_method,
-            shipping_cost=shipping_cost,
-            subtotal=subtotal,
-            tax=tax,
-            total=total,
-            payment_method=payment_method,
-        )
-        
-        # Create order items
-        for cart_item in cart_items:
-            price = cart_item.product.sale_price if cart_item.product.sale_price else cart_item.product.price
-            OrderItem.objects.create(
-                order=order,
-                product=cart_item.product,
-                variant=cart_item.variant,
-                quantity=cart_item.quantity,
-                price=price,
-                total=price * cart_item.quantity
+        try:
+            order = place_order(
+                customer, cart, shipping_address, billing_address,
+                shipping_method, payment_method,
+                promo_code=request.session.get('promo_code')
             )
-        
-        # Clear cart
-        cart.items.all().delete()
+        except EmptyCart:
+            messages.warning(request, 'Your cart is empty.')
+            return redirect('cart')
+        except InsufficientStock:
+            messages.error(request, 'Some items in your cart are no longer available in the requested quantity.')
+            return redirect('cart')
+        except PromotionUnavailable:
+            request.session.pop('promo_code', None)
+            messages.error(request, 'That promotion is no longer available. Please review your cart.')
+            return redirect('cart')
+        
+        request.session.pop('promo_code', None)
         
         messages.success(request, f'Order placed successfully! Your order number is {order.order_number}')
         return redirect('order_confirmation', order_id=order.id)
@@ -817,7 +850,12 @@ def my_orders(request):
         messages.error(request, 'Customer profile not found.')
         return redirect('home')
     
-    orders = Order.objects.filter(customer=customer).order_by('-created_at')
+    orders = (
+        Order.objects
+        .filter(customer=customer)
+        .prefetch_related('items__product')
+        .order_by('-created_at')
+    )
     
     return render(request, 'backend/frontend/my_orders.html', {
         'orders': orders,
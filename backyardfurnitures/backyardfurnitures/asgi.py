@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backyardfurnitures.settings')
 
 application = get_asgi_application()
+
+# Serve collected static files, hashed and precompressed, ahead of Django
+from backend.staticfiles import StaticFilesASGIHandler  # noqa: E402
+
+application = StaticFilesASGIHandler(application)
@@ -49,6 +49,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'backend.replicas.ReplicaRoutingMiddleware',
+    'backend.middleware.QueryCountMiddleware',
 ]
 
 ROOT_URLCONF = 'backyardfurnitures.urls'
@@ -82,6 +84,54 @@ DATABASES = {
     }
 }
 
+# Production SQLite profile, enabled with DATABASE_PROFILE=production.
+# WAL lets readers run alongside the single writer; BEGIN IMMEDIATE takes
+# the write lock up front, so a busy writer waits out busy_timeout instead
+# of failing with "database is locked" when a read transaction tries to
+# upgrade. mmap and a larger page cache keep hot pages out of read()
+# calls, and connections are reused across requests.
+
+SQLITE_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA cache_size=-65536',
+    'PRAGMA temp_store=MEMORY',
+)
+
+SQLITE_PRODUCTION_SETTINGS = {
+    'CONN_MAX_AGE': 600,
+    'CONN_HEALTH_CHECKS': True,
+    'OPTIONS': {
+        'init_command': ';'.join(SQLITE_PRAGMAS),
+        'transaction_mode': 'IMMEDIATE',
+    },
+}
+
+if os.environ.get('DATABASE_PROFILE') == 'production':
+    DATABASES['default'].update(SQLITE_PRODUCTION_SETTINGS)
+
+# Read replicas
+# Storefront and reporting views marked @replica_reads read from one of
+# DATABASE_REPLICAS; a visitor's own writes pin them to the primary for
+# REPLICA_PIN_SECONDS. Cache fills always read from the primary.
+# SQLITE_REPLICAS lists SQLite files that stand in for replicas locally;
+# refresh them with `manage.py sync_sqlite_replicas`.
+
+for index, path in enumerate(filter(None, os.environ.get('SQLITE_REPLICAS', '').split(',')), 1):
+    DATABASES[f'replica{index}'] = {
+        **DATABASES['default'],
+        'NAME': BASE_DIR / path.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+
+DATABASE_ROUTERS = ['backend.replicas.ReplicaRouter']
+
+REPLICA_PIN_SECONDS = 15
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -125,6 +175,22 @@ STATICFILES_DIRS = [
 
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# collectstatic writes content-hashed names and .gz/.br siblings, served by
+# backend.staticfiles from wsgi.py/asgi.py with far-future cache headers
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'backend.staticfiles.CompressedManifestStaticFilesStorage',
+    },
+}
+
+MEDIA_URL = '/media/'
+
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -138,3 +204,99 @@ JAZZMIN_SETTINGS = {
     "welcome_sign": "Welcome to Backyard Furnitures Admin Panel",
     "copyright": "Backyard Furnitures",
 }
+
+
+# Product search
+# Use 'backend.search.DatabaseSearchBackend' on databases without FTS5
+
+PRODUCT_SEARCH_BACKEND = 'backend.search.SQLiteFTSBackend'
+
+
+# Dashboard metrics
+# Counters are updated from signals; this TTL bounds how stale a missed update can get
+
+DASHBOARD_CACHE_TIMEOUT = 300
+
+
+# Storefront page cache
+# Anonymous pages are evicted by tag from signals; this TTL bounds anything missed
+
+PAGE_CACHE_TIMEOUT = 600
+
+
+# Template fragment cache
+# Fragments are keyed on updated_at, so this only bounds memory use; 0 disables
+
+FRAGMENT_CACHE_TIMEOUT = 3600
+
+
+# Promotion index
+# Each process rebuilds its compiled promotions when the version in the cache
+# changes. Without a shared cache other processes miss that bump, so this age
+# (seconds) bounds how long they keep applying an edited or disabled promotion.
+
+PROMOTION_INDEX_MAX_AGE = 60
+
+
+# Image derivatives
+# Uploads are resized to each width in the background by IMAGE_WORKERS
+# threads; 0 processes them inline when the transaction commits. Failed or
+# lost jobs are rebuilt by `manage.py generate_image_derivatives`, so run it
+# after deploys and from cron. Larger images than IMAGE_MAX_PIXELS are
+# rejected before they are decoded.
+
+IMAGE_DERIVATIVE_WIDTHS = (320, 640, 960, 1280)
+
+IMAGE_WORKERS = 2
+
+IMAGE_MAX_PIXELS = 40_000_000
+
+
+# Query budgets
+# Maximum SQL queries per request by URL name, checked by QueryCountMiddleware.
+# Requests over budget log a warning; with QUERY_BUDGET_STRICT they raise.
+# Routes take precedence, for names shared by several URLs such as
+# 'product_detail'. 'home' is the hero page.
+
+QUERY_BUDGET_DEFAULT = 20
+
+QUERY_BUDGETS = {
+    'home': 1,
+    'dashboard': 8,
+    'product_list': 8,
+    'products/<int:pk>/': 10,
+    'category_list': 3,
+    'category_detail': 4,
+    'inventory_list': 6,
+    'order_list': 6,
+    'order_detail': 6,
+    'customer_list': 6,
+    'customer_detail': 8,
+    'shop': 8,
+    'shop/product/<str:slug>/': 6,
+    'add_to_cart': 10,
+    'cart': 8,
+    'checkout': 16,
+    'order_confirmation': 4,
+    'my_account': 6,
+    'my_orders': 6,
+}
+
+QUERY_BUDGET_STRICT = False
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'backend.queries': {
+            'handlers': ['console'],
+            'level': os.environ.get('QUERY_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
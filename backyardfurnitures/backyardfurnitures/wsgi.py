@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backyardfurnitures.settings')
 
 application = get_wsgi_application()
+
+# Serve collected static files, hashed and precompressed, ahead of Django
+from backend.staticfiles import StaticFilesWSGIHandler  # noqa: E402
+
+application = StaticFilesWSGIHandler(application)
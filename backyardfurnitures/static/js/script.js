@@ -0,0 +1 @@
+// Storefront scripts, loaded on every page by base.html